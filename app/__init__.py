@@ -1,7 +1,10 @@
 # __init__.py
+import sqlite3
 from flask import Flask
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from config import Config
 
 app = Flask(__name__)
@@ -10,12 +13,31 @@ CORS(app, resources={
     r"/dataflow/*": {"origins": "https://vdi.nessi.no:5815"},
     r"/projects/*": {"origins": "https://vdi.nessi.no:5815"},
     r"/upload/*": {"origins": "https://vdi.nessi.no:5815"},
+    r"/jobs/*": {"origins": "https://vdi.nessi.no:5815"},
+    r"/operations/*": {"origins": "https://vdi.nessi.no:5815"},
     r"/views/*": {"origins": "https://vdi.nessi.no:5815"},
     r"/data/*": {"origins": "https://vdi.nessi.no:5815"},
     r"/download/*": {"origins": "*"},
 })
 
 app.config.from_object(Config)
+app.logger.setLevel(app.config['LOG_LEVEL'])
 db = SQLAlchemy(app)
 
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # apply Config.SQLITE_PRAGMAS (WAL journal etc.) to every new SQLite connection
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in app.config['SQLITE_PRAGMAS']:
+        cursor.execute(f'PRAGMA {pragma}')
+    cursor.close()
+
+from app import querycount
+querycount.install(app)
+
+from app import metrics
+metrics.install(app)
+
 from app import routes, models
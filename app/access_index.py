@@ -0,0 +1,125 @@
+# access_index.py
+# inverted index over the open calls of the logs of a project: which
+# programs accessed a file (and how, in which log) and which files a
+# program accessed, without building the dataflow graph
+#
+# the index is assembled from the stored FileAccess triples of the logs
+# (see app/dataflow.py) and cached per project like the graph; a lookup
+# only checks the change counter of the project (project_version(), one
+# primary-key query), when it changed the index is validated against the
+# current logs of the project: new logs are appended, any other change
+# rebuilds it
+#
+# file paths are kept in a sorted list, so a path-prefix lookup is a binary
+# search plus the matching paths (O(log n + k)), independent of the number
+# of events in the project
+import bisect
+import sys
+import threading
+
+from app.dataflow import project_logs, project_keys, project_version, load_accesses, extract_missing
+
+# default and maximum number of entries returned by one lookup
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 100000
+
+class AccessIndex:
+    # path -> [(program, mode, log_file_id)] and program -> [(path, mode, log_file_id)]
+    def __init__(self):
+        self.paths = {}
+        self.programs = {}
+        # (log_file_id, filtered_file_id) of the logs in the index, in order
+        self.logs = []
+        # project_version() the logs were read at (or after)
+        self.version = None
+        # sorted keys of self.paths, None after paths were added
+        self._sorted_paths = []
+
+    def add_log(self, log_file_id, accesses):
+        intern = sys.intern
+        for program, path, mode in accesses:
+            program, path, mode = intern(program), intern(path), intern(mode)
+            entries = self.paths.get(path)
+            if entries is None:
+                entries = self.paths[path] = []
+                self._sorted_paths = None
+            entries.append((program, mode, log_file_id))
+            self.programs.setdefault(program, []).append((path, mode, log_file_id))
+
+    def sorted_paths(self):
+        if self._sorted_paths is None:
+            self._sorted_paths = sorted(self.paths)
+        return self._sorted_paths
+
+    def files(self, prefix='', after=None, limit=DEFAULT_LIMIT):
+        # paths starting with prefix (after the path `after`, if given), in
+        # order, with their accesses; returns (files, next_cursor) where
+        # next_cursor is the last path returned if there are more
+        paths = self.sorted_paths()
+        start = bisect.bisect_left(paths, prefix)
+        if after is not None and after >= prefix:
+            start = max(start, bisect.bisect_right(paths, after))
+        files = []
+        for index in range(start, min(start + limit + 1, len(paths))):
+            path = paths[index]
+            if not path.startswith(prefix):
+                break
+            if len(files) == limit:
+                return files, files[-1][0]
+            files.append((path, list(self.paths[path])))
+        return files, None
+
+    def program(self, name):
+        # accesses of a program in all logs of the project, None if unknown
+        return self.programs.get(name)
+
+# cached indexes by project id, shared by all request threads
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(project_id, logs=None):
+    # return the (cached) AccessIndex of a project, see get_graph(); the
+    # version is read before the logs, so an index is never newer than it
+    version = project_version(project_id)
+    if logs is None:
+        with _indexes_lock:
+            index = _indexes.get(project_id)
+            if index is not None and version is not None and index.version == version:
+                return index
+        logs = project_logs(project_id)
+    extract_missing(logs)
+    keys = project_keys(logs)
+
+    with _indexes_lock:
+        index = _indexes.get(project_id)
+        if index is not None and index.logs == keys:
+            index.version = version
+            return index
+        if index is None or index.logs != keys[:len(index.logs)]:
+            index = AccessIndex()
+        start = len(index.logs)
+        accesses = load_accesses([log[0] for log in logs[start:] if log[1] is not None])
+        for log_file_id, filtered_file_id in keys[start:]:
+            if filtered_file_id is not None:
+                index.add_log(log_file_id, accesses[log_file_id])
+            index.logs.append((log_file_id, filtered_file_id))
+        index.version = version
+        _indexes[project_id] = index
+        return index
+
+def lookup_files(project_id, prefix='', after=None, limit=DEFAULT_LIMIT):
+    # (files, next_cursor) of a project, see AccessIndex.files()
+    index = get_index(project_id)
+    with _indexes_lock:
+        return index.files(prefix, after, limit)
+
+def lookup_program(project_id, name):
+    # accesses of a program, copied under the lock, None if unknown
+    index = get_index(project_id)
+    with _indexes_lock:
+        accesses = index.program(name)
+        return list(accesses) if accesses is not None else None
+
+def invalidate(project_id):
+    with _indexes_lock:
+        _indexes.pop(project_id, None)
@@ -0,0 +1,28 @@
+# asgi.py
+# ASGI entry point, e.g., uvicorn app.asgi:asgi_app (see app/server.py)
+#
+# a2wsgi runs the Flask views in a bounded pool of VDI_ASGI_THREADS threads
+# (default Config.SERVER_THREADS) while the event loop does the socket I/O;
+# the request body is not buffered: wsgi.input receives it from the event
+# loop as the view reads it, so streamed uploads (chunked, archives) keep
+# their constant memory use, and a response is passed back in blocks
+# through a bounded queue
+#
+# the body ends where the ASGI server says it ends, also for requests sent
+# with Transfer-Encoding: chunked (no Content-Length); without
+# wsgi.input_terminated Flask would read their body as empty
+import os
+
+from a2wsgi import WSGIMiddleware
+
+from app import app
+from app.routes import job_queue
+
+def wsgi_app(environ, start_response):
+    environ['wsgi.input_terminated'] = True
+    return app(environ, start_response)
+
+asgi_app = WSGIMiddleware(wsgi_app, workers=int(os.environ.get('VDI_ASGI_THREADS', app.config['SERVER_THREADS'])))
+
+# each server worker process imports this module once
+job_queue.run_queued()
@@ -0,0 +1,226 @@
+# bulk.py
+# operations on many files at once: ingesting archives of log files and
+# reclaiming the disk space of deleted rows in the background
+#
+# the files of deleted rows are moved to a trash directory while the
+# deletion is committed (see routes.commit_and_reclaim()) and only the trash
+# is removed in the background, so a path that is used again in between
+# (e.g., a log file uploaded again under the same name) keeps its new file
+#
+# every bulk operation is tracked as an Operation with its progress (items
+# done of total, bytes read or freed) that can be queried while it runs
+# (/operations/<id>, running ones also by kind with /operations, e.g.,
+# to follow an archive upload while it is sent); operations are kept in memory per process, like
+# app/metrics.py, so with several server workers ('run.py serve') an
+# operation is only known to the worker that started it
+import collections
+import gzip
+import os
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from app import metrics
+from app.uploads import save_stream
+
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# finished operations kept for querying, the oldest are forgotten first
+MAX_OPERATIONS = 1000
+# errors kept per operation
+MAX_ERRORS = 100
+
+# content types of zip archives, anything else is read as (compressed) tar
+ZIP_TYPES = ('application/zip', 'application/x-zip-compressed')
+# directory below each storage root the files of deleted rows are moved to
+# until they are removed
+TRASH_DIRECTORY = '.trash'
+# errors raised when reading a corrupt or truncated archive
+ARCHIVE_ERRORS = (tarfile.TarError, zipfile.BadZipFile, gzip.BadGzipFile, EOFError, zlib.error)
+
+BYTES_RECLAIMED = metrics.counter('vdi_bytes_reclaimed_total', 'Disk space freed by removing the files of deleted rows')
+FILES_RECLAIMED = metrics.counter('vdi_files_reclaimed_total', 'Files of deleted rows removed, by result', ('result',))
+
+class Operation:
+    def __init__(self, kind, total=None, label=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        # what the operation works on, e.g., the project of an upload
+        self.label = label
+        self.status = RUNNING
+        # number of items (files) to process, None if not known in advance
+        self.total = total
+        self.done = 0
+        self.bytes_read = 0
+        self.bytes_freed = 0
+        self.errors = []
+        self.started = time.time()
+        self.finished = None
+
+    def progress(self, items=1, bytes_read=0, bytes_freed=0):
+        with _lock:
+            self.done += items
+            self.bytes_read += bytes_read
+            self.bytes_freed += bytes_freed
+
+    def error(self, message):
+        with _lock:
+            if len(self.errors) < MAX_ERRORS:
+                self.errors.append(message)
+
+    def finish(self, status=DONE):
+        with _lock:
+            self.status = status
+            self.finished = time.time()
+
+    def to_dict(self):
+        with _lock:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'label': self.label,
+                'status': self.status,
+                'total': self.total,
+                'done': self.done,
+                'bytes_read': self.bytes_read,
+                'bytes_freed': self.bytes_freed,
+                'errors': list(self.errors),
+                'started': self.started,
+                'finished': self.finished,
+            }
+
+# operations by id in start order, shared by all request threads
+_operations = collections.OrderedDict()
+_lock = threading.Lock()
+# one thread removes files, deletions are I/O bound and rarely concurrent
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reclaim')
+
+def start(kind, total=None, label=None):
+    operation = Operation(kind, total, label)
+    with _lock:
+        _operations[operation.id] = operation
+        finished = [key for key, other in _operations.items() if other.status != RUNNING]
+        for key in finished[:max(0, len(_operations) - MAX_OPERATIONS)]:
+            del _operations[key]
+    return operation
+
+def get(operation_id):
+    with _lock:
+        return _operations.get(operation_id)
+
+def running(kind=None):
+    with _lock:
+        return [operation for operation in _operations.values()
+                if operation.status == RUNNING and (kind is None or operation.kind == kind)]
+
+def iter_archive(stream, content_type, spool_path):
+    # (member name, file object, size) of the regular files in an archive
+    # read from stream: tar archives (also gzip, bzip2 or xz compressed) are
+    # read as they arrive, a zip archive is first stored in spool_path since
+    # its directory is at its end; raises one of ARCHIVE_ERRORS if the
+    # archive is corrupt
+    if content_type in ZIP_TYPES:
+        save_stream(stream, spool_path)
+        try:
+            with zipfile.ZipFile(spool_path) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        with archive.open(info) as member:
+                            yield info.filename, member, info.file_size
+        finally:
+            os.remove(spool_path)
+    else:
+        with tarfile.open(fileobj=stream, mode='r|*') as archive:
+            for info in archive:
+                if info.isfile():
+                    yield info.name, archive.extractfile(info), info.size
+
+def trash(paths, roots, kind='reclaim'):
+    # first step of removing the files of deleted rows: move them at once
+    # into <root>/.trash/<operation id> below the storage root (of roots)
+    # they are in, so a file stored again under the same path is never
+    # removed; returns the Operation and the [(trash path, path)] of the
+    # files for reclaim(), the trash path is the path itself for files that
+    # cannot be moved (outside the roots, on another file system)
+    paths = sorted(set(paths))
+    operation = start(kind, len(paths))
+    moved = []
+    for index, path in enumerate(paths):
+        root = next((root for root in roots if path.startswith(os.path.join(root, ''))), None)
+        if root is not None:
+            directory = os.path.join(root, TRASH_DIRECTORY, operation.id)
+            trash_path = os.path.join(directory, f'{index}-{os.path.basename(path)}')
+            try:
+                os.makedirs(directory, exist_ok=True)
+                os.rename(path, trash_path)
+            except FileNotFoundError:
+                # counted as missing by reclaim()
+                trash_path = path
+            except OSError:
+                trash_path = path
+        else:
+            trash_path = path
+        moved.append((trash_path, path))
+    return operation, moved
+
+def restore(operation, moved):
+    # undo trash() if the deletion could not be committed
+    for trash_path, path in moved:
+        if trash_path != path:
+            try:
+                os.rename(trash_path, path)
+            except OSError as e:
+                operation.error(f'{path}: cannot be restored: {e}')
+    _remove_directories(trash_directories(moved))
+    operation.finish(FAILED)
+
+def trash_directories(moved):
+    return {os.path.dirname(trash_path) for trash_path, path in moved if trash_path != path}
+
+def reclaim(operation, moved, directories=()):
+    # remove the files moved by trash() in the background, then their trash
+    # directories and the given directories if they are empty
+    _executor.submit(_reclaim, operation, moved, set(directories) | trash_directories(moved))
+    return operation
+
+def _remove_directories(directories):
+    for directory in sorted(set(directories), key=len, reverse=True):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            # not empty or already removed
+            pass
+
+def _reclaim(operation, moved, directories):
+    try:
+        for trash_path, path in moved:
+            try:
+                stat = os.lstat(trash_path)
+                os.remove(trash_path)
+            except FileNotFoundError:
+                FILES_RECLAIMED.inc(result='missing')
+                operation.progress()
+                continue
+            except OSError as e:
+                FILES_RECLAIMED.inc(result='failed')
+                operation.error(f'{path}: {e}')
+                operation.progress()
+                continue
+            # a hardlinked file (deduplicated uploads, filter cache) only
+            # frees its space with its last link
+            freed = stat.st_size if stat.st_nlink == 1 else 0
+            FILES_RECLAIMED.inc(result='removed')
+            BYTES_RECLAIMED.inc(freed)
+            operation.progress(bytes_freed=freed)
+        _remove_directories(directories)
+    except Exception as e:
+        operation.error(str(e))
+        operation.finish(FAILED)
+    else:
+        operation.finish()
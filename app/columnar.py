@@ -0,0 +1,155 @@
+# columnar.py
+# columnar sidecar of a filtered log: the open calls of the log as the
+# dictionary-encoded columns syscall, program, path and mode, so that later
+# analyses work on integer codes instead of re-reading and re-tokenizing text
+#
+# file layout (<filtered file>.cols):
+#   8 bytes  magic 'VDICOLS1'
+#   8 bytes  offset of the header (unsigned, little endian)
+#   8 bytes  length of the header
+#   8 bytes  reserved
+#   columns  one array of num_rows native unsigned 32-bit codes per column
+#   header   JSON: num_rows, byteorder, columns with name, offset, dictionary
+# the file is memory-mapped for reading, columns are exposed as zero-copy
+# memoryviews (or NumPy arrays if NumPy is installed)
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from app.processing import temporary_path
+from app.strace import OpenCall, iter_open_calls
+
+MAGIC = b'VDICOLS1'
+PREAMBLE = struct.Struct('<8sQQQ')
+COLUMNS = OpenCall._fields
+# codes are buffered and written in blocks of this many rows
+BLOCK_ROWS = 256 * 1024
+
+def sidecar_path(filtered_path):
+    return f'{filtered_path}.cols'
+
+def write_columns(file_path, out_path=None):
+    # parse the open calls of a (filtered) log and write them as columnar
+    # sidecar; memory use is bounded by the number of distinct values
+    out_path = out_path or sidecar_path(file_path)
+    dictionaries = [{} for _ in COLUMNS]
+    part_paths = [temporary_path(f'{out_path}.{name}') for name in COLUMNS]
+    part_files = [open(path, 'xb') for path in part_paths]
+    tmp_path = temporary_path(out_path)
+    try:
+        blocks = [array.array('I') for _ in COLUMNS]
+        num_rows = 0
+        for call in iter_open_calls(file_path):
+            for value, dictionary, block in zip(call, dictionaries, blocks):
+                code = dictionary.get(value)
+                if code is None:
+                    code = dictionary[value] = len(dictionary)
+                block.append(code)
+            num_rows += 1
+            if len(blocks[0]) == BLOCK_ROWS:
+                for block, part_file in zip(blocks, part_files):
+                    block.tofile(part_file)
+                blocks = [array.array('I') for _ in COLUMNS]
+        for block, part_file in zip(blocks, part_files):
+            block.tofile(part_file)
+            part_file.close()
+
+        itemsize = array.array('I').itemsize
+        header = {'num_rows': num_rows, 'byteorder': sys.byteorder, 'itemsize': itemsize, 'columns': []}
+        with open(tmp_path, 'xb') as out:
+            out.write(PREAMBLE.pack(MAGIC, 0, 0, 0))
+            for name, dictionary, part_path in zip(COLUMNS, dictionaries, part_paths):
+                header['columns'].append({'name': name, 'offset': out.tell(), 'dictionary': list(dictionary)})
+                with open(part_path, 'rb') as part_file:
+                    while True:
+                        data = part_file.read(1024 * 1024)
+                        if not data:
+                            break
+                        out.write(data)
+            header_offset = out.tell()
+            header_data = json.dumps(header).encode('utf-8')
+            out.write(header_data)
+            out.seek(0)
+            out.write(PREAMBLE.pack(MAGIC, header_offset, len(header_data), 0))
+        os.replace(tmp_path, out_path)
+    finally:
+        for part_file in part_files:
+            part_file.close()
+        for path in part_paths + [tmp_path]:
+            if os.path.exists(path):
+                os.remove(path)
+    return out_path
+
+class ColumnarLog:
+    # read-only, memory-mapped columnar sidecar; use as context manager
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(file.fileno()).st_size else None
+        if self._mmap is None:
+            raise ValueError(f'{path} is empty')
+        magic, header_offset, header_length, _ = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a columnar log')
+        header = json.loads(self._mmap[header_offset:header_offset + header_length])
+        if header['byteorder'] != sys.byteorder or header['itemsize'] != array.array('I').itemsize:
+            raise ValueError(f'{path} was written on an incompatible platform')
+        self.num_rows = header['num_rows']
+        self._itemsize = header['itemsize']
+        self._columns = {column['name']: column for column in header['columns']}
+        self._view = memoryview(self._mmap)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._mmap is not None:
+            self._view.release()
+            self._mmap.close()
+            self._mmap = None
+
+    def dictionary(self, name):
+        # values of a column, indexed by code
+        return self._columns[name]['dictionary']
+
+    def codes(self, name):
+        # codes of a column as zero-copy memoryview of unsigned ints
+        offset = self._columns[name]['offset']
+        return self._view[offset:offset + self.num_rows * self._itemsize].cast('I')
+
+    def codes_array(self, name):
+        # codes of a column as zero-copy NumPy array (requires NumPy)
+        offset = self._columns[name]['offset']
+        return numpy.frombuffer(self._mmap, dtype=numpy.uint32 if self._itemsize == 4 else numpy.uint64,
+                                count=self.num_rows, offset=offset)
+
+    def rows(self):
+        # decoded OpenCall records, in file order
+        dictionaries = [self.dictionary(name) for name in COLUMNS]
+        for codes in zip(*(self.codes(name) for name in COLUMNS)):
+            yield OpenCall(*(dictionary[code] for dictionary, code in zip(dictionaries, codes)))
+
+    def distinct_accesses(self):
+        # distinct (program, path, mode) triples in the order of their first
+        # occurrence, computed on the integer codes
+        programs, paths, modes = (self.dictionary(name) for name in ('program', 'path', 'mode'))
+        if numpy is not None and self.num_rows:
+            program_codes = self.codes_array('program').astype(numpy.uint64)
+            path_codes = self.codes_array('path').astype(numpy.uint64)
+            mode_codes = self.codes_array('mode').astype(numpy.uint64)
+            keys = (program_codes * len(paths) + path_codes) * len(modes) + mode_codes
+            _, first = numpy.unique(keys, return_index=True)
+            first.sort()
+            return [(programs[program_codes[i]], paths[path_codes[i]], modes[mode_codes[i]]) for i in first.tolist()]
+        triples = dict.fromkeys(zip(self.codes('program'), self.codes('path'), self.codes('mode')))
+        return [(programs[program], paths[path], modes[mode]) for program, path, mode in triples]
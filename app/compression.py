@@ -0,0 +1,95 @@
+# compression.py
+# compressed log files: uploads may be gzip (.gz) or zstd (.zst) compressed,
+# and stored raw and processed logs are compressed if
+# Config.STORAGE_COMPRESSION is set
+#
+# readers use open_log(), which detects the format from the first bytes of
+# a file, so whether a stored file is compressed does not depend on its name
+# or on the current configuration; checksums (dedup, filter cache) are always
+# computed over the uncompressed content (see app/hashing.py)
+import gzip
+import io
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+MAGIC = {GZIP: b'\x1f\x8b', ZSTD: b'\x28\xb5\x2f\xfd'}
+SUFFIXES = {'.gz': GZIP, '.zst': ZSTD}
+DEFAULT_LEVELS = {GZIP: 6, ZSTD: 3}
+# size of the blocks compressed data is copied and hashed in
+BLOCK_SIZE = 1024 * 1024
+
+class CompressionError(Exception):
+    pass
+
+# errors raised when reading a corrupt or truncated compressed file
+READ_ERRORS = (OSError, EOFError, ValueError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+def available(method):
+    return method == GZIP or (method == ZSTD and zstandard is not None)
+
+def suffix_compression(file_name):
+    # compression method indicated by the suffix of a file name, or None
+    for suffix, method in SUFFIXES.items():
+        if file_name.lower().endswith(suffix):
+            return method
+    return None
+
+def strip_suffix(file_name):
+    # file name without a compression suffix
+    method = suffix_compression(file_name)
+    if method is None:
+        return file_name
+    return file_name[:file_name.rfind('.')]
+
+def add_suffix(file_name, method):
+    # file name with the suffix of a compression method, unchanged for None
+    if method is None:
+        return file_name
+    return file_name + next(suffix for suffix, suffix_method in SUFFIXES.items() if suffix_method == method)
+
+def detect(file_path):
+    # compression method of a file from its magic bytes, None if uncompressed
+    with open(file_path, 'rb') as file:
+        head = file.read(4)
+    for method, magic in MAGIC.items():
+        if head.startswith(magic):
+            return method
+    return None
+
+def open_log(file_path, buffering=io.DEFAULT_BUFFER_SIZE):
+    # buffered binary reader of the uncompressed content of a (stored) log
+    method = detect(file_path)
+    if method is None:
+        return open(file_path, 'rb', buffering=buffering)
+    if method == GZIP:
+        return io.BufferedReader(gzip.GzipFile(file_path, 'rb'), buffer_size=buffering)
+    if zstandard is None:
+        raise CompressionError(f'{file_path} is zstd compressed, but zstandard is not installed')
+    reader = zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd=True)
+    return io.BufferedReader(reader, buffer_size=buffering)
+
+def open_writer(file_path, method=None, level=None):
+    # binary writer creating file_path (it must not exist) that compresses
+    # what is written with method; None writes it uncompressed
+    if method is None:
+        return open(file_path, 'xb')
+    if not available(method):
+        raise CompressionError(f'compression method {method} is not available')
+    level = DEFAULT_LEVELS[method] if level is None else level
+    if method == GZIP:
+        return gzip.GzipFile(file_path, 'xb', compresslevel=level)
+    return zstandard.ZstdCompressor(level=level).stream_writer(open(file_path, 'xb'), closefd=True)
+
+def compress_file(src_path, dst_path, method, level=None):
+    # write the (uncompressed) content of src_path compressed to dst_path
+    with open_log(src_path, buffering=BLOCK_SIZE) as src, open_writer(dst_path, method, level) as dst:
+        while True:
+            block = src.read(BLOCK_SIZE)
+            if not block:
+                break
+            dst.write(block)
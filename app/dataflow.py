@@ -0,0 +1,253 @@
+# dataflow.py
+# builds the dataflow graph of a project (program and file nodes connected by
+# read/write edges) from the open calls found in its filtered log files
+#
+# the (program, file, access mode) triples of a log are extracted once, when
+# the log has been processed, and stored as FileAccess rows; the graph of a
+# project is assembled from those rows and cached together with its JSON
+# body and an ETag; newly added logs are appended to a cached graph
+import hashlib
+import json
+import os
+import threading
+
+from app import db, metrics
+from app.models import Project, LogFile, FilteredFile, FileAccess
+from app.columnar import ColumnarLog, sidecar_path
+from app.strace import iter_open_calls
+
+def extract_accesses(file_path):
+    # return the distinct (program, file, access mode) triples of the open
+    # calls in a filtered log, in the order of their first occurrence;
+    # repeated triples never add nodes or edges to the graph
+    # uses the columnar sidecar of the log if there is one
+    columns_path = sidecar_path(file_path)
+    if os.path.isfile(columns_path):
+        with ColumnarLog(columns_path) as columns:
+            return columns.distinct_accesses()
+    accesses = {}
+    for call in iter_open_calls(file_path):
+        accesses.setdefault((call.program, call.path, call.mode), None)
+    return list(accesses)
+
+def store_accesses(filtered_file, accesses):
+    # add the FileAccess rows of a filtered log to the session (caller commits),
+    # replacing rows stored by an earlier run
+    FileAccess.query.filter_by(log_file_id=filtered_file.log_file_id).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(FileAccess, [
+        {'log_file_id': filtered_file.log_file_id, 'seq': seq, 'program': program, 'path': path, 'mode': mode}
+        for seq, (program, path, mode) in enumerate(accesses)
+    ])
+    filtered_file.num_accesses = len(accesses)
+
+def accesses_by_checksum(checksum):
+    # stored triples of any filtered log with the given checksum, None if
+    # there is none (filtered logs with the same content have the same triples)
+    filtered_file = FilteredFile.query.filter(FilteredFile.checksum == checksum, FilteredFile.num_accesses.isnot(None)).first()
+    if filtered_file is None:
+        return None
+    return load_accesses([filtered_file.log_file_id])[filtered_file.log_file_id]
+
+class DataflowGraph:
+    # nodes and edges of a project graph plus the state needed to append logs
+    def __init__(self):
+        self.nodes = []
+        self.edges = []
+        self.node_counter = 1
+        self.edge_counter = 1
+        self.files = {}
+        self.read_ops = {}
+        self.write_ops = {}
+        # (log_file_id, filtered_file_id) of every log of the project taken
+        # into account, in order; filtered_file_id is None if not processed yet
+        self.logs = []
+        self.etag = None
+        self.body = None
+
+    def add_log(self, index, accesses):
+        programs = {}
+        for program, path, access_mode in accesses:
+            program_name_in_log = f'log-{index}##{program}'
+            if program_name_in_log not in programs:
+                # if program new create a new program node
+                programs[program_name_in_log] = self.node_counter
+                #nodes.append({ 'id': f'{node_counter}', 'label': program_name_in_log, 'type': 'program', 'position': { 'x': 0, 'y': 0 }, 'data': { 'status': 'null' } })
+                self.nodes.append({ 'id': f'{self.node_counter}', 'label': program_name_in_log, 'type': 'program', 'data': { 'status': 'null' } })
+                self.node_counter = self.node_counter + 1
+
+            # for files we should not use the prefix 'log-{index}##' or the graph cannot be connected
+            file_path_in_log = f'{path}'
+            if file_path_in_log not in self.files:
+                # if file new create a new file node
+                self.files[file_path_in_log] = self.node_counter
+                #nodes.append({ 'id': f'{node_counter}', 'label': file_path_in_log, 'type': 'file', 'position': { 'x': 0, 'y': 0 }, 'data': { 'status': 'null' } })
+                self.nodes.append({ 'id': f'{self.node_counter}', 'label': file_path_in_log, 'type': 'file', 'data': { 'status': 'null' } })
+                self.node_counter = self.node_counter + 1
+
+            # TODO handle case that file was accessed already, but with different access mode;
+            #      that is add a node? no, just a reverse edge --> probably hard to make clear
+            #        in visualisation, need some better way (no arrow, other color, ...), thus need to pass back some extra information to frontend
+            if access_mode == 'read':
+                # if access == read, create an edge from the file to the program node
+                # we assume that each log only represents a single program that would read the file
+                if file_path_in_log not in self.read_ops:
+                    self.read_ops[file_path_in_log] = self.edge_counter
+                    self.edges.append({ 'id': f'ed{self.edge_counter}', 'source': self.files[file_path_in_log], 'target': programs[program_name_in_log] })
+                    self.edge_counter = self.edge_counter + 1
+
+            if access_mode == 'write':
+                # TODO FIXME if file is openend for both reading and writing create another node for the file and use that as target
+                #            however that may need that we distinguish the operation in the file_path_in_log, but then this complicates
+                #            the matching of files between programs
+                # if access == write, create an edge from the program to the file node
+                # we assume that each log only represents a single program that would write the file
+                if file_path_in_log not in self.write_ops:
+                    self.write_ops[file_path_in_log] = self.edge_counter
+                    self.edges.append({ 'id': f'ed{self.edge_counter}', 'source': programs[program_name_in_log], 'target': self.files[file_path_in_log] })
+                    self.edge_counter = self.edge_counter + 1
+
+    def finish(self):
+        # derive the ETag from the logs the graph covers; the JSON body is
+        # only built (and then kept) when it is requested
+        self.body = None
+        self.etag = graph_etag(self.logs)
+
+# number of lines sent per chunk of a streamed graph
+NDJSON_BLOCK_LINES = 1000
+
+GRAPH_REQUESTS = metrics.counter('vdi_dataflow_graphs_total', 'Project graphs requested, by cached, appended to or built', ('result',))
+GRAPH_BUILD_SECONDS = metrics.histogram('vdi_dataflow_build_seconds', 'Time spent building or appending to project graphs')
+GRAPH_LOGS_SCANNED = metrics.counter('vdi_dataflow_logs_scanned_total', 'Logs added to project graphs')
+GRAPH_ACCESSES_SCANNED = metrics.counter('vdi_dataflow_accesses_scanned_total', 'Stored (program, file, mode) triples added to project graphs')
+GRAPH_NODES = metrics.gauge('vdi_dataflow_nodes', 'Nodes of the cached graph of a project', ('project',))
+GRAPH_EDGES = metrics.gauge('vdi_dataflow_edges', 'Edges of the cached graph of a project', ('project',))
+
+# cached graphs by project id, shared by all request threads
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+def project_logs(project_id):
+    # (log_file_id, filtered_file_id, num_accesses, filtered_file_path) for
+    # all logs of a project in upload order; only the first FilteredFile of
+    # a log is used
+    rows = db.session.query(LogFile.id, FilteredFile.id, FilteredFile.num_accesses, FilteredFile.filtered_file_path) \
+        .outerjoin(FilteredFile, FilteredFile.log_file_id == LogFile.id) \
+        .filter(LogFile.project_id == project_id) \
+        .order_by(LogFile.id, FilteredFile.id).all()
+    logs = {}
+    for row in rows:
+        logs.setdefault(row[0], row)
+    return list(logs.values())
+
+def load_accesses(log_file_ids):
+    # stored triples of the given logs, by log file id
+    accesses = {log_file_id: [] for log_file_id in log_file_ids}
+    if not log_file_ids:
+        return accesses
+    query = db.session.query(FileAccess.log_file_id, FileAccess.program, FileAccess.path, FileAccess.mode) \
+        .filter(FileAccess.log_file_id.in_(log_file_ids)) \
+        .order_by(FileAccess.log_file_id, FileAccess.seq)
+    for log_file_id, program, path, mode in query:
+        accesses[log_file_id].append((program, path, mode))
+    return accesses
+
+def extract_missing(logs):
+    # logs processed before triples were stored: extract and store them now
+    missing = [log for log in logs if log[1] is not None and log[2] is None]
+    for log_file_id, filtered_file_id, _, filtered_file_path in missing:
+        filtered_file = FilteredFile.query.get(filtered_file_id)
+        store_accesses(filtered_file, extract_accesses(filtered_file_path))
+    if missing:
+        db.session.commit()
+
+def touch_projects(project_ids):
+    # record that logs of the projects were added, processed or deleted (the
+    # caller commits with the change), see project_version()
+    Project.query.filter(Project.id.in_(list(project_ids))) \
+        .update({Project.logs_version: db.func.coalesce(Project.logs_version, 0) + 1}, synchronize_session=False)
+
+def project_version(project_id):
+    # change counter of the logs of a project (None if there is no such
+    # project); a cache built after reading it is valid as long as it does
+    # not change, which costs one primary-key lookup instead of reading the
+    # logs of the project (project_logs())
+    version = db.session.query(Project.logs_version).filter_by(id=project_id).first()
+    return None if version is None else version[0] or 0
+
+def project_keys(logs):
+    # (log_file_id, filtered_file_id) of the logs returned by project_logs()
+    return [(log[0], log[1]) for log in logs]
+
+def graph_etag(keys):
+    # ETag of the graph of the given logs, known without building the graph
+    return hashlib.sha256(repr(keys).encode('utf-8')).hexdigest()
+
+def get_graph(project_id, logs=None):
+    # return the (cached) DataflowGraph of a project; the cache is validated
+    # against the current logs of the project, new logs are appended to the
+    # cached graph, any other change (e.g., a deleted log) reassembles the
+    # graph from the stored triples
+    if logs is None:
+        logs = project_logs(project_id)
+    extract_missing(logs)
+    keys = project_keys(logs)
+
+    with _graphs_lock:
+        graph = _graphs.get(project_id)
+        if graph is not None and graph.logs == keys:
+            GRAPH_REQUESTS.inc(result='cached')
+            return graph
+        if graph is None or graph.logs != keys[:len(graph.logs)]:
+            GRAPH_REQUESTS.inc(result='built')
+            graph = DataflowGraph()
+        else:
+            GRAPH_REQUESTS.inc(result='appended')
+        with GRAPH_BUILD_SECONDS.time():
+            start = len(graph.logs)
+            accesses = load_accesses([log[0] for log in logs[start:] if log[1] is not None])
+            for index in range(start, len(logs)):
+                log_file_id, filtered_file_id = keys[index]
+                if filtered_file_id is not None:
+                    graph.add_log(index, accesses[log_file_id])
+                    GRAPH_ACCESSES_SCANNED.inc(len(accesses[log_file_id]))
+                graph.logs.append(keys[index])
+            graph.finish()
+        GRAPH_LOGS_SCANNED.inc(len(logs) - start)
+        GRAPH_NODES.set(len(graph.nodes), project=str(project_id))
+        GRAPH_EDGES.set(len(graph.edges), project=str(project_id))
+        _graphs[project_id] = graph
+        return graph
+
+def get_graph_json(project_id, logs=None):
+    # (etag, JSON body) of the project graph, read consistently under the lock
+    graph = get_graph(project_id, logs)
+    with _graphs_lock:
+        if graph.body is None:
+            graph.body = json.dumps({'nodes': graph.nodes, 'edges': graph.edges})
+        return graph.etag, graph.body
+
+def get_graph_snapshot(project_id, logs=None):
+    # (etag, nodes, edges) of the project graph; nodes and edges are only
+    # appended to, so their first len() items stay valid while streaming
+    graph = get_graph(project_id, logs)
+    with _graphs_lock:
+        return graph.etag, graph.nodes, len(graph.nodes), graph.edges, len(graph.edges)
+
+def iter_ndjson(nodes, num_nodes, edges, num_edges):
+    # the graph as newline-delimited JSON, one {"node": ...} or {"edge": ...}
+    # object per line, all nodes first; yields blocks of lines
+    block = []
+    for kind, items, count in (('node', nodes, num_nodes), ('edge', edges, num_edges)):
+        for index in range(count):
+            block.append(json.dumps({kind: items[index]}))
+            if len(block) == NDJSON_BLOCK_LINES:
+                yield '\n'.join(block) + '\n'
+                block = []
+    if block:
+        yield '\n'.join(block) + '\n'
+
+def invalidate(project_id):
+    with _graphs_lock:
+        _graphs.pop(project_id, None)
+    GRAPH_NODES.remove(project=str(project_id))
+    GRAPH_EDGES.remove(project=str(project_id))
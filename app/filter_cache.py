@@ -0,0 +1,107 @@
+# filter_cache.py
+# content-addressed cache of filtered log files, keyed by the SHA-256 of the
+# raw log plus the canonical hash of the filter list (processing.filters_key)
+#
+# entries are hardlinks to filtered files (<key> plus <key>.json holding the
+# checksum of the filtered content), a hit links the entry to the processed
+# path instead of filtering again; the total size of the entries is bounded,
+# least recently used entries (by mtime, refreshed on every hit) are evicted
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from app.processing import filters_key, temporary_path
+
+# ioctl to clone (reflink) a file on file systems that support it (Linux)
+FICLONE = 0x40049409
+
+def clone_file(src_path, dst_path):
+    # make dst_path share the content of src_path: hardlink, reflink or, as a
+    # last resort, copy; written to a temporary file and renamed into place
+    tmp_path = temporary_path(dst_path)
+    try:
+        os.link(src_path, tmp_path)
+    except OSError:
+        with open(src_path, 'rb') as src, open(tmp_path, 'xb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY):
+                    raise
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(tmp_path, dst_path)
+
+class FilterCache:
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(raw_checksum, filters):
+        return hashlib.sha256(f'{raw_checksum}:{filters_key(filters)}'.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key, dst_path):
+        # link the cached output for key to dst_path and return its checksum,
+        # None on a cache miss
+        path = self._path(key)
+        try:
+            with open(f'{path}.json') as file:
+                checksum = json.load(file)['checksum']
+            os.utime(path)
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            clone_file(path, dst_path)
+        except (OSError, ValueError, KeyError):
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return checksum
+
+    def put(self, key, src_path, checksum):
+        # add the filtered file src_path with its checksum to the cache
+        if self.max_size <= 0 or os.path.getsize(src_path) > self.max_size:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        clone_file(src_path, path)
+        tmp_path = temporary_path(f'{path}.json')
+        with open(tmp_path, 'x') as file:
+            json.dump({'checksum': checksum}, file)
+        os.replace(tmp_path, f'{path}.json')
+        self.evict()
+
+    def evict(self):
+        # remove least recently used entries until the cache fits max_size
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith('.') or name.endswith('.json'):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            for entry_path in (path, f'{path}.json'):
+                if os.path.exists(entry_path):
+                    os.remove(entry_path)
+            total -= size
+            with self.lock:
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
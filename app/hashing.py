@@ -0,0 +1,144 @@
+# hashing.py
+# SHA-256 checksums of stored files, shared by uploads, processing and
+# maintenance (run.py backfillchecksums)
+#
+# checksums are always over the uncompressed content (see app/compression.py):
+# uncompressed files are read into one reused buffer, compressed ones are
+# decompressed block by block, so memory use does not depend on the file size
+# (a memory map would be as fast, but maps the whole file into the process)
+#
+# checksums are kept by path and validated against the size and mtime of
+# the file, an unchanged file is never hashed twice; hashing work can be run
+# in a pool of threads (submit()), hashlib and file reads release the GIL, so
+# several files are hashed in parallel
+import collections
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import metrics
+from app.compression import CompressionError, READ_ERRORS, detect, open_log
+
+# size of the blocks files are read and hashed in
+BLOCK_SIZE = 1024 * 1024
+DEFAULT_WORKERS = 4
+DEFAULT_CACHE_SIZE = 100000
+
+CHECKSUM_SECONDS = metrics.histogram('vdi_checksum_seconds', 'Duration of hashing a file')
+CHECKSUM_BYTES = metrics.counter('vdi_checksum_bytes_total', 'Bytes hashed (uncompressed)')
+CHECKSUM_CACHE = metrics.counter('vdi_checksum_cache_events_total', 'Checksum cache hits and misses', ('event',))
+
+def _hash_plain(file_path):
+    # (hasher, bytes hashed)
+    hasher = hashlib.sha256()
+    buffer = bytearray(BLOCK_SIZE)
+    view = memoryview(buffer)
+    total = 0
+    with open(file_path, 'rb', buffering=0) as file:
+        while True:
+            size = file.readinto(buffer)
+            if not size:
+                break
+            hasher.update(view[:size])
+            total += size
+    return hasher, total
+
+def _hash_compressed(file_path):
+    hasher = hashlib.sha256()
+    total = 0
+    with open_log(file_path, buffering=BLOCK_SIZE) as file:
+        while True:
+            block = file.read(BLOCK_SIZE)
+            if not block:
+                break
+            hasher.update(block)
+            total += len(block)
+    return hasher, total
+
+def file_checksum(file_path):
+    # SHA-256 of the uncompressed content of a file, without caching;
+    # raises CompressionError if a compressed file cannot be decompressed
+    with CHECKSUM_SECONDS.time():
+        if detect(file_path) is None:
+            hasher, size = _hash_plain(file_path)
+        else:
+            try:
+                hasher, size = _hash_compressed(file_path)
+            except READ_ERRORS as e:
+                raise CompressionError(f'{file_path} cannot be decompressed: {e}') from e
+    CHECKSUM_BYTES.inc(size)
+    return hasher.hexdigest()
+
+class HashingService:
+    def __init__(self, workers=DEFAULT_WORKERS, cache_size=DEFAULT_CACHE_SIZE):
+        self.workers = workers
+        self.cache_size = cache_size
+        # path -> (size, mtime_ns, checksum), least recently used first
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def configure(self, workers, cache_size):
+        # only takes effect for the pool if it has not been started yet
+        with self.lock:
+            self.workers = workers
+            self.cache_size = cache_size
+
+    def _lookup(self, file_path, stat):
+        with self.lock:
+            entry = self.cache.get(file_path)
+            if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                self.cache.move_to_end(file_path)
+                return entry[2]
+        return None
+
+    def remember(self, file_path, checksum, stat=None):
+        # record the checksum of the current content of a file, e.g. computed
+        # while the file was written
+        if stat is None:
+            stat = os.stat(file_path)
+        with self.lock:
+            self.cache[file_path] = (stat.st_size, stat.st_mtime_ns, checksum)
+            self.cache.move_to_end(file_path)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def checksum(self, file_path):
+        # SHA-256 of the uncompressed content of a file, see file_checksum()
+        stat = os.stat(file_path)
+        checksum = self._lookup(file_path, stat)
+        if checksum is not None:
+            CHECKSUM_CACHE.inc(event='hit')
+            return checksum
+        CHECKSUM_CACHE.inc(event='miss')
+        checksum = file_checksum(file_path)
+        # a file changed while it was hashed must not be cached
+        if os.stat(file_path).st_mtime_ns == stat.st_mtime_ns:
+            self.remember(file_path, checksum, stat)
+        return checksum
+
+    def submit(self, func, *args):
+        # run func(*args) in the hashing pool, returns a Future
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hashing')
+        return self.executor.submit(func, *args)
+
+    def checksums(self, file_paths):
+        # checksums of several files hashed in parallel, in order; a file that
+        # cannot be hashed gets its exception instead
+        futures = [self.submit(self.checksum, file_path) for file_path in file_paths]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except (OSError, CompressionError) as e:
+                results.append(e)
+        return results
+
+# shared by all request threads, configured by app/routes.py
+service = HashingService()
+
+def checksum(file_path):
+    return service.checksum(file_path)
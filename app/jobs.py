@@ -0,0 +1,138 @@
+# jobs.py
+# bounded job queue with a fixed pool of worker threads for processing uploaded
+# log files; the state of each job is persisted on its LogFile (status,
+# attempts, error), the in-memory queue only holds LogFile ids
+import json
+import queue
+import threading
+import time
+
+from app import db, metrics
+from app.models import LogFile
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+JOB_SECONDS = metrics.histogram('vdi_job_seconds', 'Duration of background processing jobs', ('result',))
+
+class JobQueue:
+    def __init__(self, app, handler):
+        # handler(log_file_id, filters) does the actual work and raises on failure
+        self.app = app
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=app.config['JOB_QUEUE_SIZE'])
+        self.threads = []
+        self.lock = threading.Lock()
+        # set when queued jobs exist in the database that are not in self.queue
+        self.backlog = threading.Event()
+
+    def start(self):
+        # start the worker threads (only once)
+        with self.lock:
+            if self.threads:
+                return
+            for index in range(self.app.config['JOB_WORKERS']):
+                thread = threading.Thread(target=self._worker, name=f'job-worker-{index}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, log_file_id):
+        # the LogFile must already be committed with status 'queued'; when the
+        # queue is full the job simply stays queued in the database and is
+        # picked up as soon as the workers run out of work
+        self.start()
+        try:
+            self.queue.put_nowait(log_file_id)
+        except queue.Full:
+            self.backlog.set()
+
+    def requeue_interrupted(self):
+        # jobs still marked running were interrupted by a server stop; only call
+        # this before any server process has started running jobs
+        with self.app.app_context():
+            LogFile.query.filter_by(status=RUNNING).update({'status': QUEUED}, synchronize_session=False)
+            db.session.commit()
+
+    def run_queued(self):
+        # start the workers and let them pick up all jobs queued in the database
+        self.backlog.set()
+        self.start()
+
+    def resume(self):
+        # re-queue jobs that were queued or running when the server stopped
+        self.requeue_interrupted()
+        self.run_queued()
+
+    def _refill(self):
+        # move queued jobs from the database into the queue until it is full
+        self.backlog.clear()
+        with self.app.app_context():
+            query = db.session.query(LogFile.id).filter_by(status=QUEUED).order_by(LogFile.id)
+            log_file_ids = [log_file_id for (log_file_id,) in query.limit(self.queue.maxsize or None)]
+        for log_file_id in log_file_ids:
+            try:
+                self.queue.put_nowait(log_file_id)
+            except queue.Full:
+                self.backlog.set()
+                break
+
+    def _worker(self):
+        while True:
+            try:
+                log_file_id = self.queue.get(timeout=1)
+            except queue.Empty:
+                if self.backlog.is_set():
+                    self._refill()
+                continue
+            try:
+                self._run(log_file_id)
+            except Exception:
+                self.app.logger.exception(f'job {log_file_id}: unexpected error in job worker')
+            finally:
+                self.queue.task_done()
+
+    def _run(self, log_file_id):
+        with self.app.app_context():
+            # claim the job; the conditional update makes sure a job is only run
+            # once even if it was queued twice or by several server processes
+            claimed = LogFile.query.filter_by(id=log_file_id, status=QUEUED).update(
+                {'status': RUNNING, 'attempts': db.func.coalesce(LogFile.attempts, 0) + 1},
+                synchronize_session=False)
+            db.session.commit()
+            if not claimed:
+                return
+
+            log_file = LogFile.query.get(log_file_id)
+            file_path = log_file.file_path
+            filters_json = log_file.filters
+            filters = json.loads(filters_json) if filters_json else []
+            start = time.perf_counter()
+            try:
+                self.handler(log_file_id, filters)
+            except Exception as e:
+                JOB_SECONDS.observe(time.perf_counter() - start, result='failed')
+                db.session.rollback()
+                self.app.logger.exception(f'job {log_file_id}: processing {file_path} failed')
+                log_file = LogFile.query.get(log_file_id)
+                if log_file is None:
+                    return
+                retry = log_file.attempts < self.app.config['JOB_MAX_ATTEMPTS']
+                log_file.status = QUEUED if retry else FAILED
+                log_file.error = f'{type(e).__name__}: {e}'
+                db.session.commit()
+                if retry:
+                    self.submit(log_file_id)
+                return
+
+            JOB_SECONDS.observe(time.perf_counter() - start, result='done')
+            # the log file may have been uploaded again with other filters
+            # while the job ran, it is then queued to run again
+            superseded = LogFile.query.filter_by(id=log_file_id, status=RUNNING) \
+                .filter(LogFile.filters.is_distinct_from(filters_json)) \
+                .update({'status': QUEUED, 'attempts': 0}, synchronize_session=False)
+            LogFile.query.filter_by(id=log_file_id, status=RUNNING).update({'status': DONE, 'error': None}, synchronize_session=False)
+            db.session.commit()
+            if superseded:
+                self.submit(log_file_id)
@@ -0,0 +1,272 @@
+# lineage.py
+# transitive lineage of files and programs across all logs of a project:
+# which files (and the programs writing them) a file was ultimately produced
+# from (upstream) and which files and programs it ultimately fed (downstream)
+#
+# unlike the dataflow graph (app/dataflow.py), which keeps only the first
+# reader and the first writer of a file, the lineage index keeps every reader
+# and writer of every file: program nodes are per log (like the graph),
+# file nodes are shared by all logs, so lineage crosses logs through the files
+# they have in common; a read is an edge file -> program, a write an edge
+# program -> file, accesses with an unknown mode carry no dataflow
+#
+# nodes are numbered and the edges kept as adjacency lists of node numbers in
+# both directions, a query is a breadth-first search from the start nodes
+# (O(V + E) of the reached part); its result, the reached nodes in order of
+# their distance, is cached per index; once more than LINEAGE_CACHE_NODES
+# (config) nodes are held, the least recently used results are dropped
+#
+# the index is validated like the access index: by the change counter of
+# the project, and against its logs when the counter changed; new logs are
+# appended (and the cached results dropped, as any new edge can extend
+# them), any other change rebuilds it
+import bisect
+import collections
+import sys
+import threading
+from array import array
+
+from app import metrics
+from app.dataflow import project_logs, project_keys, project_version, load_accesses, extract_missing
+
+UPSTREAM = 'upstream'
+DOWNSTREAM = 'downstream'
+DIRECTIONS = (UPSTREAM, DOWNSTREAM)
+# node types a result can be restricted to
+FILE = 'file'
+PROGRAM = 'program'
+ALL = 'all'
+TYPES = (FILE, PROGRAM, ALL)
+
+# nodes of the cached results of an index (8 bytes each)
+DEFAULT_CACHE_NODES = 10 * 1000 * 1000
+
+LINEAGE_QUERIES = metrics.counter('vdi_lineage_queries_total', 'Lineage queries, by cached or computed', ('result',))
+LINEAGE_SECONDS = metrics.histogram('vdi_lineage_query_seconds', 'Time spent computing (uncached) lineage queries')
+LINEAGE_BUILD_SECONDS = metrics.histogram('vdi_lineage_build_seconds', 'Time spent building or appending to lineage indexes')
+
+class Reach:
+    # nodes reached by a query in order of their distance (number of edges)
+    # from the start nodes, the nodes of one type are selected on first use
+    def __init__(self, nodes, depths):
+        self.nodes = nodes
+        self.depths = depths
+        self._selected = {ALL: (nodes, depths)}
+
+    def select(self, index, node_type):
+        # (nodes, depths) of the nodes of a type, see TYPES
+        selected = self._selected.get(node_type)
+        if selected is None:
+            program = node_type == PROGRAM
+            nodes, depths = array('i'), array('i')
+            for node, depth in zip(self.nodes, self.depths):
+                if (index.programs[node] is not None) == program:
+                    nodes.append(node)
+                    depths.append(depth)
+            selected = self._selected[node_type] = (nodes, depths)
+        return selected
+
+    def size(self):
+        return sum(len(nodes) for nodes, _ in self._selected.values())
+
+class LineageIndex:
+    def __init__(self):
+        # per node: the path of a file, (log_file_id, program) of a program
+        # (None for files), successors and predecessors
+        self.paths = []
+        self.programs = []
+        self.successors = []
+        self.predecessors = []
+        # path -> node of a file, program name -> [nodes] (one per log)
+        self.files = {}
+        self.program_nodes = {}
+        self.num_edges = 0
+        # (log_file_id, filtered_file_id) of the logs in the index, in order
+        self.logs = []
+        # project_version() the logs were read at (or after)
+        self.version = None
+        # (direction, path, program) -> Reach, least recently used first
+        self.cache = collections.OrderedDict()
+        self.cache_nodes = 0
+        self.lock = threading.Lock()
+
+    def _add_node(self, path, program):
+        node = len(self.paths)
+        self.paths.append(path)
+        self.programs.append(program)
+        self.successors.append([])
+        self.predecessors.append([])
+        return node
+
+    def add_log(self, log_file_id, accesses):
+        # the triples of a log are distinct (see extract_accesses()), so
+        # every edge of a program node is added once
+        intern = sys.intern
+        programs = {}
+        successors = self.successors
+        predecessors = self.predecessors
+        for program, path, mode in accesses:
+            if mode != 'read' and mode != 'write':
+                continue
+            program_node = programs.get(program)
+            if program_node is None:
+                program = intern(program)
+                program_node = programs[program] = self._add_node(None, (log_file_id, program))
+                self.program_nodes.setdefault(program, []).append(program_node)
+            file_node = self.files.get(path)
+            if file_node is None:
+                path = intern(path)
+                file_node = self.files[path] = self._add_node(path, None)
+            if mode == 'read':
+                successors[file_node].append(program_node)
+                predecessors[program_node].append(file_node)
+            else:
+                successors[program_node].append(file_node)
+                predecessors[file_node].append(program_node)
+            self.num_edges += 1
+        self.cache.clear()
+        self.cache_nodes = 0
+
+    def start_nodes(self, path=None, program=None):
+        # nodes of a file or of a program (in all logs), empty if unknown
+        if path is not None:
+            node = self.files.get(path)
+            return [] if node is None else [node]
+        return self.program_nodes.get(program, [])
+
+    def reach(self, starts, direction):
+        # Reach of the nodes connected to the start nodes by a path in the
+        # direction of the edges (downstream) or against it (upstream); the
+        # start nodes themselves are not part of it
+        adjacency = self.successors if direction == DOWNSTREAM else self.predecessors
+        visited = bytearray(len(adjacency))
+        for node in starts:
+            visited[node] = 1
+        nodes, depths = array('i'), array('i')
+        frontier = list(starts)
+        depth = 0
+        while frontier:
+            depth += 1
+            reached = []
+            for node in frontier:
+                for other in adjacency[node]:
+                    if not visited[other]:
+                        visited[other] = 1
+                        reached.append(other)
+            nodes.extend(reached)
+            depths.extend([depth] * len(reached))
+            frontier = reached
+        return Reach(nodes, depths)
+
+    def query(self, direction, path=None, program=None, cache_nodes=DEFAULT_CACHE_NODES):
+        # (cached) Reach of a file or a program, None if it is unknown;
+        # the caller holds self.lock
+        key = (direction, path, program)
+        reach = self.cache.get(key)
+        if reach is not None:
+            self.cache.move_to_end(key)
+            LINEAGE_QUERIES.inc(result='cached')
+            return reach
+        starts = self.start_nodes(path, program)
+        if not starts:
+            return None
+        LINEAGE_QUERIES.inc(result='computed')
+        with LINEAGE_SECONDS.time():
+            reach = self.reach(starts, direction)
+        self.cache[key] = reach
+        self.cache_nodes += len(reach.nodes)
+        self._evict(cache_nodes)
+        return reach
+
+    def selected(self, reach, node_type, cache_nodes=DEFAULT_CACHE_NODES):
+        # (nodes, depths) of a type from a cached Reach, see Reach.select()
+        before = reach.size()
+        selected = reach.select(self, node_type)
+        self.cache_nodes += reach.size() - before
+        self._evict(cache_nodes)
+        return selected
+
+    def _evict(self, cache_nodes):
+        # drop the least recently used results, never the latest one
+        while self.cache_nodes > cache_nodes and len(self.cache) > 1:
+            _, reach = self.cache.popitem(last=False)
+            self.cache_nodes -= reach.size()
+
+    def describe(self, node, depth):
+        if self.programs[node] is None:
+            return {'type': FILE, 'path': self.paths[node], 'depth': depth}
+        log_file_id, program = self.programs[node]
+        return {'type': PROGRAM, 'program': program, 'log_file_id': log_file_id, 'depth': depth}
+
+# cached indexes by project id, shared by all request threads; an index is
+# only changed and queried under its own lock and built under the build lock
+# of its project, _indexes_lock only guards the dicts, so building or long
+# queries of one project do not block the others
+_indexes = {}
+_build_locks = {}
+_indexes_lock = threading.Lock()
+_cache_nodes = DEFAULT_CACHE_NODES
+
+def configure(cache_nodes):
+    global _cache_nodes
+    _cache_nodes = cache_nodes
+
+def get_index(project_id, logs=None):
+    # return the (cached) LineageIndex of a project, see get_graph() and
+    # access_index.get_index()
+    version = project_version(project_id)
+    if logs is None:
+        with _indexes_lock:
+            index = _indexes.get(project_id)
+        if index is not None and version is not None and index.version == version:
+            return index
+        logs = project_logs(project_id)
+    extract_missing(logs)
+    keys = project_keys(logs)
+
+    with _indexes_lock:
+        build_lock = _build_locks.setdefault(project_id, threading.Lock())
+    with build_lock:
+        with _indexes_lock:
+            index = _indexes.get(project_id)
+        if index is not None and index.logs == keys:
+            index.version = version
+            return index
+        if index is not None and version is not None and index.version is not None and index.version > version:
+            # built from newer logs by another request while this one waited
+            return index
+        if index is None or index.logs != keys[:len(index.logs)]:
+            index = LineageIndex()
+        with index.lock, LINEAGE_BUILD_SECONDS.time():
+            start = len(index.logs)
+            accesses = load_accesses([log[0] for log in logs[start:] if log[1] is not None])
+            for log_file_id, filtered_file_id in keys[start:]:
+                if filtered_file_id is not None:
+                    index.add_log(log_file_id, accesses[log_file_id])
+                index.logs.append((log_file_id, filtered_file_id))
+            index.version = version
+        with _indexes_lock:
+            _indexes[project_id] = index
+        return index
+
+def lookup(project_id, direction, path=None, program=None, node_type=FILE, max_depth=None, offset=0, limit=None):
+    # lineage of a file (path) or a program (name, in all logs) of a project:
+    # (entries, total, next_offset) with the entries (see describe()) of
+    # the reached nodes of node_type at most max_depth edges away, in order of
+    # their distance, from offset on; next_offset is None if there are no
+    # more; returns None if the file or program is unknown
+    index = get_index(project_id)
+    with index.lock:
+        reach = index.query(direction, path, program, _cache_nodes)
+        if reach is None:
+            return None
+        nodes, depths = index.selected(reach, node_type, _cache_nodes)
+        total = len(nodes) if max_depth is None else bisect.bisect_right(depths, max_depth)
+        end = total if limit is None else min(total, offset + limit)
+        entries = [index.describe(nodes[position], depths[position]) for position in range(offset, end)]
+    return entries, total, end if end < total else None
+
+def invalidate(project_id):
+    with _indexes_lock:
+        _indexes.pop(project_id, None)
+        _build_locks.pop(project_id, None)
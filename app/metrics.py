@@ -0,0 +1,250 @@
+# metrics.py
+# counters, gauges and histograms for the hot paths of the backend, exposed
+# in the Prometheus text format on /metrics (see install())
+#
+#   FILES_PROCESSED = counter('vdi_files_processed_total', 'Log files filtered')
+#   FILES_PROCESSED.inc()
+#   with PROCESSING_SECONDS.time():
+#       ...
+#
+# values are kept per process: with several server workers ('run.py serve')
+# each scrape shows the worker that answered it, use worker-independent
+# totals (e.g., rate() over counters) or a single worker for exact numbers
+#
+# with Config.PROFILE_REQUESTS set, a request with ?profile=<sort key>
+# (e.g., ?profile=cumulative) is run under cProfile and answered with the
+# profile report, followed by the SQL statements the request executed,
+# instead of its response; requests arriving while another one is profiled
+# are not profiled
+import bisect
+import cProfile
+import io
+import math
+import pstats
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.querycount import request_counter
+
+# upper bounds (seconds) of the default histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_metrics = []
+_lock = threading.Lock()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        # callback() returns {label values tuple: value} and replaces the
+        # stored values, e.g., for values owned by other objects
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} has labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(labels[name] for name in self.labelnames)
+
+    def samples(self, values):
+        # (suffix, label values, extra labels, value) of all samples
+        for key, value in sorted(values.items()):
+            yield '', key, (), value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        # callbacks may take locks of their own, they run outside of _lock
+        values = self.callback() if self.callback is not None else None
+        with _lock:
+            samples = list(self.samples(self.values if values is None else values))
+        for suffix, key, extra, value in samples:
+            lines.append(f'{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = value
+
+    def remove(self, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values.pop(key, None)
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            counts, total = self.values.get(key, (None, 0))
+            if counts is None:
+                counts = [0] * len(self.buckets)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def time(self, **labels):
+        # context manager observing the seconds its block takes
+        return _Timer(self, labels)
+
+    def samples(self, values):
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield '_bucket', key, (('le', _format_value(bound)),), cumulative
+            yield '_sum', key, (), total
+            yield '_count', key, (), cumulative
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds = time.perf_counter() - self.start
+        self.histogram.observe(self.seconds, **self.labels)
+
+def _register(metric):
+    with _lock:
+        _metrics.append(metric)
+    return metric
+
+def counter(name, documentation, labelnames=(), callback=None):
+    return _register(Counter(name, documentation, labelnames, callback))
+
+def gauge(name, documentation, labelnames=(), callback=None):
+    return _register(Gauge(name, documentation, labelnames, callback))
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+def render():
+    # all metrics in the Prometheus text exposition format
+    return '\n'.join(metric.render() for metric in _metrics) + '\n'
+
+# metrics of code that does not import this module itself
+DB_QUERIES = counter('vdi_db_queries_total', 'SQL statements executed')
+DB_QUERY_SECONDS = histogram('vdi_db_query_seconds', 'Duration of SQL statements')
+HTTP_REQUEST_SECONDS = histogram('vdi_http_request_seconds', 'Duration of HTTP requests (until the response is returned)',
+                                 ('endpoint', 'method', 'status'))
+HTTP_REQUEST_QUERIES = histogram('vdi_http_request_queries', 'SQL statements executed per HTTP request', ('endpoint',),
+                                 buckets=(1, 2, 5, 10, 20, 50, 100, 500, 1000))
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_start'].pop()
+    DB_QUERIES.inc()
+    DB_QUERY_SECONDS.observe(seconds)
+
+@event.listens_for(Engine, 'handle_error')
+def _fail_query(context):
+    # a failed statement has no after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_start'):
+        context.connection.info['query_start'].pop()
+
+# only one request at a time is profiled
+_profile_lock = threading.Lock()
+
+def install(app):
+    # add the /metrics endpoint, per-request metrics and request profiling
+    @app.before_request
+    def start_request_metrics():
+        # runs after querycount's before_request, see app/__init__.py
+        g.metrics_start = time.perf_counter()
+        sort = request.args.get('profile')
+        if sort and app.config['PROFILE_REQUESTS'] and _profile_lock.acquire(blocking=False):
+            g.profile_sort = sort
+            counter = request_counter()
+            if counter is not None:
+                counter.keep_statements()
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def record_request_metrics(response):
+        profiler = stop_profile()
+        if profiler is not None:
+            report = io.StringIO()
+            stats = pstats.Stats(profiler, stream=report)
+            try:
+                stats.sort_stats(g.profile_sort)
+            except KeyError:
+                stats.sort_stats('cumulative')
+            stats.print_stats(app.config['PROFILE_LINES'])
+            counter = request_counter()
+            if counter is not None:
+                report.write(f'{counter.count} SQL statements\n\n')
+                report.write(''.join(f'{statement}\n\n' for statement in counter.statements or ()))
+            response = app.response_class(report.getvalue(), mimetype='text/plain')
+        endpoint = request.endpoint or 'unknown'
+        # the counter is closed by querycount's after_request, which runs
+        # after this one (they run in reverse order of registration)
+        counter = request_counter()
+        if counter is not None:
+            HTTP_REQUEST_QUERIES.observe(counter.count, endpoint=endpoint)
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint,
+                                         method=request.method, status=str(response.status_code))
+        return response
+
+    @app.teardown_request
+    def cleanup_request_metrics(exc):
+        # after_request is skipped if the view raised
+        stop_profile()
+
+    def stop_profile():
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+        return profiler
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        return app.response_class(render(), mimetype='text/plain; version=0.0.4')
@@ -6,36 +6,68 @@ class Project(db.Model):
     __tablename__ = 'projects'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(80), nullable=False, unique=True)
+    # incremented whenever logs of the project are added, processed or
+    # deleted, lets per-project caches be validated with one lookup (see
+    # app/dataflow.py project_version())
+    logs_version = db.Column(db.Integer, nullable=True, default=0)
     log_files = db.relationship('LogFile', cascade='all, delete-orphan', back_populates='project', lazy=True)
 
 class LogFile(db.Model):
     __tablename__ = 'log_files'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete='CASCADE'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete='CASCADE'), nullable=False, index=True)
     file_name = db.Column(db.String, nullable=False)
     file_path = db.Column(db.String, nullable=False)
-    checksum = db.Column(db.String(64), nullable=True)
+    checksum = db.Column(db.String(64), nullable=True, index=True)
     processed_time = db.Column(db.DateTime, nullable=True)
+    # state of the background processing job, see app/jobs.py
+    status = db.Column(db.String(16), nullable=True, index=True)
+    attempts = db.Column(db.Integer, nullable=True, default=0)
+    error = db.Column(db.Text, nullable=True)
+    # filters (JSON) the log file is processed with, needed to re-run the job
+    filters = db.Column(db.Text, nullable=True)
     project = db.relationship('Project', back_populates='log_files')
     filtered_files = db.relationship('FilteredFile', cascade='all, delete-orphan', back_populates='log_file', lazy=True)
+    # rows are deleted in bulk (see routes.delete_file_accesses) or by the
+    # database (ON DELETE CASCADE), the ORM does not load them to delete them
+    file_accesses = db.relationship('FileAccess', cascade='all, delete-orphan', back_populates='log_file', lazy=True, passive_deletes=True)
 
     def to_dict(self):
         return {
             'id': self.id,
             'project_id': self.project_id,
             'file_name': self.file_name,
-            'file_path': self.file_path
+            'file_path': self.file_path,
+            'status': self.status
         }
 
 class FilteredFile(db.Model):
     __tablename__ = 'filtered_files'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    log_file_id = db.Column(db.Integer, db.ForeignKey('log_files.id', ondelete='CASCADE'), nullable=False)
+    log_file_id = db.Column(db.Integer, db.ForeignKey('log_files.id', ondelete='CASCADE'), nullable=False, index=True)
     log_file = db.relationship('LogFile', back_populates='filtered_files')
     filtered_file_name = db.Column(db.String, nullable=False)
     filtered_file_path = db.Column(db.String, nullable=False)
-    checksum = db.Column(db.String(64), nullable=True)
+    checksum = db.Column(db.String(64), nullable=True, index=True)
     processed_time = db.Column(db.DateTime, nullable=True)
+    # the open calls of the file are also stored column-wise next to it,
+    # in filtered_file_path + '.cols' (see app/columnar.py)
+    # number of FileAccess rows extracted from the file, None if not extracted yet
+    num_accesses = db.Column(db.Integer, nullable=True)
+
+# distinct (program, file, access mode) triples of the open calls in a filtered
+# log, seq is the order of their first occurrence; the dataflow graph of a
+# project is assembled from these rows instead of re-reading the logs
+class FileAccess(db.Model):
+    __tablename__ = 'file_accesses'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    log_file_id = db.Column(db.Integer, db.ForeignKey('log_files.id', ondelete='CASCADE'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    program = db.Column(db.String, nullable=False)
+    path = db.Column(db.String, nullable=False)
+    mode = db.Column(db.String(16), nullable=False)
+    log_file = db.relationship('LogFile', back_populates='file_accesses')
+    __table_args__ = (db.Index('ix_file_accesses_log_file_id_seq', 'log_file_id', 'seq'),)
 
 # View and Data are used in the Virtual Data Infrastructure component
 class View(db.Model):
@@ -51,9 +83,11 @@ class View(db.Model):
 class Data(db.Model):
     __tablename__ = 'data'
     id = db.Column(db.Integer, primary_key=True)
-    view_id = db.Column(db.Integer, db.ForeignKey('view.id', ondelete='CASCADE'), nullable=False)
-    filepath = db.Column(db.String(200), nullable=False)
+    view_id = db.Column(db.Integer, db.ForeignKey('view.id', ondelete='CASCADE'), nullable=False, index=True)
+    filepath = db.Column(db.String(200), nullable=False, index=True)
     stored_path = db.Column(db.String(200), nullable=False)
+    # SHA-256 of the stored file, used as ETag for downloads
+    checksum = db.Column(db.String(64), nullable=True)
 
     def __repr__(self):
         return f'<Data {self.filepath}>'
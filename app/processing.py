@@ -1,7 +1,168 @@
-import csv
+import concurrent.futures
+import functools
 import hashlib
+import io
+import json
+import multiprocessing
+import operator
 import os
 import re
+import uuid
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from app import metrics
+from app.compression import SUFFIXES, add_suffix, detect, open_log, open_writer, strip_suffix
+
+PROCESS_FILE_SECONDS = metrics.histogram('vdi_process_file_seconds', 'Duration of process_file')
+PROCESS_FILE_LINES = metrics.counter('vdi_process_file_lines_total', 'Lines read (in) and kept (out) by process_file', ('direction',))
+PROCESS_FILE_BYTES = metrics.counter('vdi_process_file_bytes_total',
+                                     'Bytes read (in, as stored) and written (out, uncompressed) by process_file', ('direction',))
+FILTER_MATCHED_LINES = metrics.counter('vdi_filter_matched_lines_total',
+                                       'Lines removed by process_file per filter list (first 12 hex digits of filters_key)', ('filters',))
+MATCH_FILTERS_CALLS = metrics.counter('vdi_match_filters_total', 'Calls of match_filters by result', ('result',))
+
+def _split_filter(filter_items):
+    # split one 'col0@@@regex0@@@col1@@@regex1@@@...' filter into a tuple of
+    # (column, compiled regex) pairs; a trailing column without a regex is
+    # ignored, just like match_filters always did
+    filters_splitted = filter_items.split('@@@')
+    cols = filters_splitted[::2]
+    regexs = filters_splitted[1::2]
+    return tuple((int(cols[ridx]), re.compile(regexs[ridx])) for ridx in range(len(regexs)))
+
+def _can_combine(pattern):
+    # a regex can only be merged into an alternation if doing so cannot change
+    # its meaning: no groups (backreferences would be renumbered) and no
+    # inline global flags (only allowed at the start of a pattern)
+    return pattern.groups == 0 and pattern.flags == re.compile('').flags
+
+def _alternation(patterns):
+    # compiled regexs matching if one of the (combinable) patterns matches:
+    # a single alternation, or one regex per pattern if it cannot be compiled
+    patterns = list(dict.fromkeys(patterns))
+    if len(patterns) == 1:
+        return [re.compile(patterns[0])]
+    try:
+        return [re.compile('|'.join(f'(?:{p})' for p in patterns))]
+    except re.error:
+        return [re.compile(p) for p in patterns]
+
+class FilterPlan:
+    # immutable, precompiled form of a filter list as accepted by match_filters
+    #  - filters: tuple of filters in their original order, each a tuple of
+    #    (column, compiled regex) pairs that must all match (used for lines
+    #    that are too short, to reproduce the IndexError match_filters raises)
+    #  - any_match: True if one filter has no regex at all (matches any line)
+    #  - alternatives: (column, compiled regex) pairs built by combining all
+    #    single-regex filters on the same column into one alternation
+    #  - conjunctions: remaining multi-regex filters, regexes grouped by
+    #    column; filters that only differ in their last regex are combined
+    #    into one with an alternation as last regex
+    #  - min_len: rows shorter than this miss a referenced column
+    #  - maxsplit: lines are only split as far as the highest column referenced
+    #  - columns: the referenced columns, sorted
+    __slots__ = ('source', 'filters', 'any_match', 'alternatives', 'conjunctions', 'min_len', 'maxsplit', 'columns')
+
+    def __init__(self, filters):
+        compiled = tuple(_split_filter(filter_items) for filter_items in filters)
+        alternatives = {}
+        shared = {}
+        conjunctions = []
+        for conditions in compiled:
+            if len(conditions) == 1 and _can_combine(conditions[0][1]):
+                col, regex = conditions[0]
+                alternatives.setdefault(col, []).append(regex.pattern)
+            elif conditions:
+                # sort by column so all regexes for one column are tried together
+                conditions = tuple(sorted(conditions, key=lambda c: c[0]))
+                *common, (col, regex) = conditions
+                if _can_combine(regex):
+                    # filters that only differ in their last regex are
+                    # combined: (A and B1) or (A and B2) == A and (B1|B2)
+                    key = (tuple((c, r.pattern, r.flags) for c, r in common), col)
+                    shared.setdefault(key, (tuple(common), col, []))[2].append(regex.pattern)
+                else:
+                    conjunctions.append(conditions)
+
+        combined = [(col, regex) for col, patterns in alternatives.items() for regex in _alternation(patterns)]
+        for common, col, patterns in shared.values():
+            conjunctions.extend(common + ((col, regex),) for regex in _alternation(patterns))
+
+        cols = [col for conditions in compiled for col, _ in conditions]
+        max_col = max(cols, default=-1)
+        object.__setattr__(self, 'source', tuple(filters))
+        object.__setattr__(self, 'filters', compiled)
+        object.__setattr__(self, 'any_match', any(not conditions for conditions in compiled))
+        object.__setattr__(self, 'alternatives', tuple(combined))
+        object.__setattr__(self, 'conjunctions', tuple(conjunctions))
+        object.__setattr__(self, 'min_len', max(max_col + 1, -min(cols, default=0)))
+        # negative columns index from the end of the row, so they need the full split
+        object.__setattr__(self, 'maxsplit', -1 if any(col < 0 for col in cols) else max_col + 1)
+        object.__setattr__(self, 'columns', tuple(sorted(set(cols))))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('FilterPlan is immutable')
+
+    def __reduce__(self):
+        # rebuild from the filter strings, e.g., when sent to a worker process
+        return (FilterPlan, (self.source,))
+
+    def _match_in_order(self, row):
+        # same evaluation order as the original match_filters, including the
+        # IndexError for a referenced column that is missing from the row
+        for conditions in self.filters:
+            matches = 0
+            for col, regex in conditions:
+                if regex.search(row[col]):
+                    matches = matches + 1
+            if matches == len(conditions):
+                return True
+        return False
+
+    def match(self, string):
+        if not self.filters:
+            return False
+        # str.split() splits on the same whitespace as re.split(r'\s+') and
+        # drops leading/trailing whitespace like the strip() did
+        row = string.split(None, self.maxsplit) or ['']
+        if len(row) < self.min_len:
+            return self._match_in_order(row)
+        if self.any_match:
+            return True
+        for col, regex in self.alternatives:
+            if regex.search(row[col]):
+                return True
+        for conditions in self.conjunctions:
+            for col, regex in conditions:
+                if not regex.search(row[col]):
+                    break
+            else:
+                return True
+        return False
+
+@functools.lru_cache(maxsize=32)
+def _cached_filter_plan(filters):
+    return FilterPlan(filters)
+
+def compile_filters(filters):
+    # parse a filter list once into a FilterPlan; passing a FilterPlan returns it unchanged
+    if isinstance(filters, FilterPlan):
+        return filters
+    return _cached_filter_plan(tuple(filters))
+
+def filters_key(filters):
+    # canonical SHA-256 of a filter list: filters are OR-ed and the regexs of
+    # a filter AND-ed, so neither their order nor duplicates change which
+    # lines are kept; a trailing column without a regex is ignored
+    canonical = sorted({
+        '@@@'.join(f'{col}@@@{regex.pattern}' for col, regex in sorted(set(_split_filter(filter_items)), key=lambda c: (c[0], c[1].pattern)))
+        for filter_items in filters
+    })
+    return hashlib.sha256(json.dumps(canonical).encode('utf-8')).hexdigest()
 
 def match_filters(string, filters):
     # assume string contains x whitespace-separated columns
@@ -15,55 +176,245 @@ def match_filters(string, filters):
     #                   "12@@@^openat$@@@14@@@^/cvmfs/software\.eessi\.io" ]
     #    to illustrate that the pathname is stored in a different column for
     #    different calls
-    row = re.split(r'\s+', string.strip())
-    
-    for filter_items in filters:
-        # construct arrays for cols and regexs
-        filters_splitted = filter_items.split('@@@')
-        cols = filters_splitted[::2]
-        regexs = filters_splitted[1::2]
-        # print(f"filter line '{filter_items}' contains {len(cols)} columns and {len(regexs)} regexs")
-        # iterate over [0, len(regexs)] using regexs because there could be a column without a regex
-        # when all regex in a filter match we return True (matches == len(regexs))
-        # when or differently formulated if any regex
-        #   doesn't match we return False otherwise True
-        matches = 0
-        for ridx in range(len(regexs)):
-            # print(f"try to match column {cols[ridx]} with regex '{regexs[ridx]}'")
-            if re.search(regexs[ridx], row[int(cols[ridx])]):
-                matches = matches + 1
-        if (matches == len(regexs)):
-            return True
-    # none of the filters matched
-    return False
+    # a line matches if all regexs of at least one filter match; filters may
+    # be given as a list of strings or as a FilterPlan from compile_filters()
+    matched = compile_filters(filters).match(string)
+    MATCH_FILTERS_CALLS.inc(result='match' if matched else 'no match')
+    return matched
 
-# Function to process the file and filter out irrelevant information
-def process_file(file_path, filters):
-    processed_lines = []
+# size hint for reading/writing log files in blocks of lines
+BLOCK_SIZE = 4 * 1024 * 1024
+# smaller files are always filtered serially, a process pool does not pay off
+PARALLEL_MIN_SIZE = 64 * 1024 * 1024
 
-    # Read the original file and filter lines
-    with open(file_path, 'r', newline='', encoding='utf-8') as file:
-        for line in file:
-            if not match_filters(line, filters):
-                processed_lines.append(line)
-
-    # Define the path for the processed file
+def processed_file_path(file_path, compression=None):
+    # path of the filtered copy of a raw log: raw_logs/<file> -> processed_logs/<file>,
+    # named after the compression of the copy, not of the raw log:
+    # raw_logs/trace.log.gz -> processed_logs/trace.log (uncompressed) or
+    # processed_logs/trace.log.gz (gzip)
     processed_dir = os.path.dirname(file_path.replace('raw_logs', 'processed_logs'))
-    if not os.path.exists(processed_dir):
-        os.makedirs(processed_dir)
-    processed_path = os.path.join(processed_dir, os.path.basename(file_path))
-    
-    # Save the filtered content to the new file
-    with open(processed_path, 'w', newline='', encoding='utf-8') as processed_file:
-        for line in processed_lines:
-            processed_file.write(line)
-    
-    return processed_path
-
-# Function to calculate the checksum of a file
-def calculate_checksum(file_path):
+    return os.path.join(processed_dir, add_suffix(strip_suffix(os.path.basename(file_path)), compression))
+
+def processed_file_paths(file_path):
+    # every path the filtered copy of a raw log may have, see processed_file_path()
+    return [processed_file_path(file_path, method) for method in (None,) + tuple(SUFFIXES.values())]
+
+def temporary_path(path):
+    # hidden, unique file next to path; written first and then renamed to path
+    return os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.{uuid.uuid4().hex}.tmp')
+
+def filter_lines(lines, plan):
+    # return the lines that are kept, i.e., that do not match any filter
+    # large filter lists are evaluated column-wise (see filter_lines_batch)
+    # if NumPy is installed, the result is the same
+    if numpy is not None and len(lines) >= BATCH_MIN_LINES and \
+       len(plan.alternatives) + sum(map(len, plan.conjunctions)) >= BATCH_MIN_CONDITIONS:
+        return filter_lines_batch(lines, plan)
+    match = plan.match
+    return [line for line in lines if not match(line)]
+
+# blocks with fewer lines, or filter lists with fewer (column, regex) pairs
+# after compilation, are matched line by line: splitting the lines into
+# columns costs about as much as matching a few regexs per line
+BATCH_MIN_LINES = 256
+BATCH_MIN_CONDITIONS = 64
+
+def _match_rows(rows, plan):
+    # vectorized FilterPlan.match for rows given as tuples of the columns in
+    # plan.columns: a referenced column is dictionary-encoded once (distinct
+    # values plus one code per row) and a (column, regex) pair is searched at
+    # most once per distinct value; filters are evaluated as arrays of the
+    # indices of the rows they still match, so the later regexs of a filter
+    # only look at the rows that passed the earlier ones
+    if plan.any_match:
+        return numpy.ones(len(rows), dtype=bool)
+    positions = {col: position for position, col in enumerate(plan.columns)}
+    encoded = {}
+    # per (column, regex) and distinct value: 1 if the regex matches, 0 if
+    # not, -1 if not searched yet; filters often share a regex, e.g., '^openat$'
+    found = {}
+    # indices of all rows matched by the first regex of filters
+    first = {}
+    def search(col, regex, indices):
+        # indices (None for all rows) of the rows whose column col matches regex
+        if col not in encoded:
+            values = list(map(operator.itemgetter(positions[col]), rows))
+            index = {value: code for code, value in enumerate(dict.fromkeys(values))}
+            codes = numpy.fromiter(map(index.__getitem__, values), dtype=numpy.intp, count=len(values))
+            encoded[col] = (codes, list(index))
+        codes, distinct = encoded[col]
+        results = found.get((col, regex))
+        if results is None:
+            results = found[(col, regex)] = numpy.full(len(distinct), -1, dtype=numpy.int8)
+        candidates = codes if indices is None else codes[indices]
+        needed = numpy.unique(candidates)
+        needed = needed[results[needed] < 0].tolist()
+        search = regex.search
+        results[needed] = [search(distinct[code]) is not None for code in needed]
+        hits = numpy.flatnonzero(results[candidates] == 1)
+        return hits if indices is None else indices[hits]
+    matched = numpy.zeros(len(rows), dtype=bool)
+    for col, regex in plan.alternatives:
+        matched[search(col, regex, None)] = True
+    for conditions in plan.conjunctions:
+        col, regex = conditions[0]
+        if (col, regex) not in first:
+            first[(col, regex)] = search(col, regex, None)
+        indices = first[(col, regex)]
+        for col, regex in conditions[1:]:
+            if not len(indices):
+                break
+            indices = search(col, regex, indices)
+        matched[indices] = True
+    return matched
+
+def filter_lines_batch(lines, plan):
+    # same result as filter_lines(), but the lines are matched column-wise
+    # with NumPy (see _match_rows); syscall names, programs and path
+    # prefixes repeat heavily in strace logs, so most regex searches are saved
+    if not plan.filters:
+        return list(lines)
+    if not plan.columns:
+        # only filters without regexs, they match every line
+        return []
+    # only the referenced columns of a row are kept, as one tuple per row
+    maxsplit = plan.maxsplit
+    columns = operator.itemgetter(*plan.columns)
+    if len(plan.columns) == 1:
+        single = columns
+        columns = lambda row: (single(row),)
+    try:
+        rows = [columns(line.split(None, maxsplit) or ['']) for line in lines]
+    except IndexError:
+        # a row misses a referenced column: match the block line by line,
+        # which raises the same IndexError as match_filters if it should
+        match = plan.match
+        return [line for line in lines if not match(line)]
+    matched = _match_rows(rows, plan)
+    return [lines[index] for index in numpy.flatnonzero(~matched).tolist()]
+
+def _filter_serial(file_path, plan, out_path, compression=None, compression_level=None):
+    # filter file_path into out_path in blocks of lines; file_path may be
+    # compressed; return the SHA-256 of the (uncompressed) output, the number
+    # of lines read and kept and the number of (uncompressed) bytes written
     hasher = hashlib.sha256()
+    lines_in = lines_out = bytes_out = 0
+    with io.TextIOWrapper(open_log(file_path, buffering=BLOCK_SIZE), encoding='utf-8', newline='') as file, \
+         open_writer(out_path, compression, compression_level) as processed_file:
+        while True:
+            lines = file.readlines(BLOCK_SIZE)
+            if not lines:
+                break
+            kept = filter_lines(lines, plan)
+            block = ''.join(kept).encode('utf-8')
+            hasher.update(block)
+            processed_file.write(block)
+            lines_in += len(lines)
+            lines_out += len(kept)
+            bytes_out += len(block)
+    return hasher.hexdigest(), lines_in, lines_out, bytes_out
+
+def split_ranges(file_path, parts):
+    # split a file into at most parts byte ranges [start, end) that all end
+    # right after a newline (or at the end of the file)
+    size = os.path.getsize(file_path)
+    boundaries = [0]
     with open(file_path, 'rb') as file:
-        buf = file.read()
-        hasher.update(buf)
-    return hasher.hexdigest()
+        for part in range(1, parts):
+            file.seek(max(size * part // parts, boundaries[-1]))
+            file.readline()
+            boundaries.append(file.tell())
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+def _filter_range(file_path, start, end, plan, out_path):
+    # worker: filter the lines in the byte range [start, end) into out_path
+    # blocks always end at a newline, so decoding them and splitting them with
+    # newline='' yields the same lines the serial text-mode reader sees
+    # returns out_path and the number of lines read and kept
+    lines_in = lines_out = 0
+    with open(file_path, 'rb') as file, open(out_path, 'xb') as part_file:
+        file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = file.read(min(BLOCK_SIZE, remaining))
+            if not data:
+                break
+            if len(data) < remaining:
+                data += file.readline()
+            remaining -= len(data)
+            lines = io.StringIO(data.decode('utf-8'), newline='').readlines()
+            kept = filter_lines(lines, plan)
+            part_file.write(''.join(kept).encode('utf-8'))
+            lines_in += len(lines)
+            lines_out += len(kept)
+    return out_path, lines_in, lines_out
+
+def _filter_parallel(file_path, plan, out_path, workers, compression=None, compression_level=None):
+    # filter newline-aligned byte ranges of file_path in a process pool and
+    # stitch the partial outputs together in order, returns the same as
+    # _filter_serial()
+    ranges = split_ranges(file_path, workers)
+    part_paths = [f'{out_path}.{index}' for index in range(len(ranges))]
+    hasher = hashlib.sha256()
+    lines_in = lines_out = bytes_out = 0
+    try:
+        # spawn instead of fork, the server process runs other threads
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(_filter_range, file_path, start, end, plan, part_path)
+                       for (start, end), part_path in zip(ranges, part_paths)]
+            with open_writer(out_path, compression, compression_level) as processed_file:
+                for future in futures:
+                    part_path, part_lines_in, part_lines_out = future.result()
+                    lines_in += part_lines_in
+                    lines_out += part_lines_out
+                    with open(part_path, 'rb') as part_file:
+                        while True:
+                            block = part_file.read(BLOCK_SIZE)
+                            if not block:
+                                break
+                            hasher.update(block)
+                            processed_file.write(block)
+                            bytes_out += len(block)
+                    os.remove(part_path)
+    finally:
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    return hasher.hexdigest(), lines_in, lines_out, bytes_out
+
+# Function to process the file and filter out irrelevant information
+# streams the file in blocks, so memory use does not grow with the log size;
+# kept lines go to a temporary file that is renamed into place when done
+# with workers > 1, files of at least min_parallel_size bytes are split into
+# line-aligned ranges that are filtered in parallel by a process pool; the
+# output is byte-identical to the serial one
+# compressed (gzip, zstd) input is decompressed while it is read, and always
+# filtered serially; with compression set, the output is compressed too
+# returns the path of the processed file and the SHA-256 of its (uncompressed) content
+def process_file(file_path, filters, workers=1, min_parallel_size=PARALLEL_MIN_SIZE, compression=None, compression_level=None):
+    plan = compile_filters(filters)
+
+    # Define the path for the processed file
+    processed_path = processed_file_path(file_path, compression)
+    os.makedirs(os.path.dirname(processed_path), exist_ok=True)
+
+    tmp_path = temporary_path(processed_path)
+    try:
+        with PROCESS_FILE_SECONDS.time():
+            if workers > 1 and os.path.getsize(file_path) >= min_parallel_size and detect(file_path) is None:
+                checksum, lines_in, lines_out, bytes_out = _filter_parallel(file_path, plan, tmp_path, workers, compression, compression_level)
+            else:
+                checksum, lines_in, lines_out, bytes_out = _filter_serial(file_path, plan, tmp_path, compression, compression_level)
+        os.replace(tmp_path, processed_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    PROCESS_FILE_LINES.inc(lines_in, direction='in')
+    PROCESS_FILE_LINES.inc(lines_out, direction='out')
+    PROCESS_FILE_BYTES.inc(os.path.getsize(file_path), direction='in')
+    PROCESS_FILE_BYTES.inc(bytes_out, direction='out')
+    FILTER_MATCHED_LINES.inc(lines_in - lines_out, filters=filters_key(plan.source)[:12])
+    return processed_path, checksum
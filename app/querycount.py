@@ -0,0 +1,80 @@
+# querycount.py
+# counts the SQL statements executed by the current thread, e.g., to assert
+# an upper bound on the number of statements an endpoint issues:
+#
+#   with count_queries() as queries:
+#       client.get('/dataflow/1')
+#   assert queries.count <= 5
+#
+# every request runs under one counter (request_counter()), which feeds the
+# per-request metrics (app/metrics.py) and, with Config.QUERY_COUNT_HEADER
+# set, the X-Query-Count header of its response; only counters created with
+# statements=True (or switched on with keep_statements(), as for profiled
+# requests) keep the text of the statements, the others only count
+import threading
+
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_local = threading.local()
+
+class QueryCounter:
+    def __init__(self, statements=False):
+        self.count = 0
+        # text of the statements, None if they are only counted
+        self.statements = [] if statements else None
+
+    def keep_statements(self):
+        # keep the text of the statements executed from now on
+        if self.statements is None:
+            self.statements = []
+
+    def __enter__(self):
+        _counters().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _counters().remove(self)
+
+def _counters():
+    if not hasattr(_local, 'counters'):
+        _local.counters = []
+    return _local.counters
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    for counter in _counters():
+        counter.count += 1
+        if counter.statements is not None:
+            counter.statements.append(statement)
+
+def count_queries(statements=False):
+    return QueryCounter(statements)
+
+def request_counter():
+    # the counter of the current request, None outside of requests
+    return g.get('query_counter')
+
+def install(app):
+    # count the statements of every request, add the X-Query-Count header
+    # to responses if enabled in the config
+    @app.before_request
+    def start_query_count():
+        g.query_counter = count_queries().__enter__()
+
+    @app.after_request
+    def add_query_count_header(response):
+        counter = g.pop('query_counter', None)
+        if counter is not None:
+            counter.__exit__(None, None, None)
+            if app.config.get('QUERY_COUNT_HEADER'):
+                response.headers['X-Query-Count'] = str(counter.count)
+        return response
+
+    @app.teardown_request
+    def stop_query_count(exc):
+        # after_request is skipped if the view raised
+        counter = g.pop('query_counter', None)
+        if counter is not None:
+            counter.__exit__(None, None, None)
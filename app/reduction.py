@@ -0,0 +1,244 @@
+# reduction.py
+# reduced dataflow graph of a project for display (/dataflow?reduce=1): the
+# full graph has one node per distinct file, tens of thousands for typical
+# software stacks, which a browser cannot lay out
+#
+# the reduction works on the stored (program, file, mode) triples of the
+# logs (see app/dataflow.py) with every reader and writer of a file:
+#   - read-only files read by a single program are dropped (they are leaves
+#     and carry no dataflow between programs), as are files that were only
+#     opened with an unknown access mode
+#   - the remaining files are collapsed into one node per directory prefix of
+#     `depth` components, e.g. /cvmfs/software.eessi.io/versions for depth 3
+#     (0 keeps the files); edges carry the number of files they stand for
+#   - every node gets a position from a layered layout (see layout())
+# results are cached per project and depth (the CACHED_DEPTHS last used
+# depths of a project) and validated against the logs of the project like
+# the full graph; any change rebuilds them
+import collections
+import json
+import threading
+
+from app import metrics
+from app.dataflow import project_logs, project_keys, load_accesses, extract_missing, graph_etag
+
+# distance (px) between layers and between nodes of a layer
+LAYER_SPACING = 400
+NODE_SPACING = 80
+# barycenter passes (down and up) ordering the nodes of the layers
+LAYOUT_SWEEPS = 4
+# collapse depths accepted (0 keeps single files) and reduced graphs kept
+# per project, the least recently used depth is dropped first
+MAX_DEPTH = 32
+CACHED_DEPTHS = 4
+
+REDUCE_SECONDS = metrics.histogram('vdi_dataflow_reduce_seconds', 'Time spent reducing and laying out project graphs')
+REDUCED_FILES = metrics.counter('vdi_dataflow_reduced_files_total', 'Files of reduced graphs, by dropped, collapsed or kept', ('result',))
+
+def collapse_key(path, depth):
+    # directory prefix of depth components a file is collapsed into; files
+    # in shallower directories are collapsed into their directory
+    directories = path.split('/')[:-1]
+    if depth <= 0 or not directories:
+        return path
+    # an absolute path starts with an empty component
+    depth += directories[:1] == ['']
+    if len(directories) > depth:
+        directories = directories[:depth]
+    return '/'.join(directories) or '/'
+
+def layout(num_nodes, edges):
+    # (x, y) of the nodes 0..num_nodes-1 of a directed graph given as
+    # (source, target) pairs: layers by longest path (edges closing a cycle
+    # are ignored), then the nodes of each layer ordered by the mean position
+    # of their neighbours in the previous layer, sweeping down and up;
+    # O(LAYOUT_SWEEPS * (V log V + E))
+    successors = [[] for _ in range(num_nodes)]
+    neighbours = [[] for _ in range(num_nodes)]
+    for source, target in edges:
+        successors[source].append(target)
+        neighbours[source].append(target)
+        neighbours[target].append(source)
+
+    # reverse DFS postorder is a topological order of the graph without the
+    # edges closing cycles (those that point back in this order)
+    visited = bytearray(num_nodes)
+    postorder = []
+    for root in range(num_nodes):
+        if visited[root]:
+            continue
+        visited[root] = 1
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if not visited[child]:
+                    visited[child] = 1
+                    stack.append((child, iter(successors[child])))
+                    break
+            else:
+                stack.pop()
+                postorder.append(node)
+    order = postorder[::-1]
+    rank = [0] * num_nodes
+    for index, node in enumerate(order):
+        rank[node] = index
+
+    layer = [0] * num_nodes
+    for node in order:
+        for child in successors[node]:
+            if rank[child] > rank[node] and layer[child] <= layer[node]:
+                layer[child] = layer[node] + 1
+    layers = [[] for _ in range(max(layer, default=-1) + 1)]
+    for node in order:
+        layers[layer[node]].append(node)
+
+    # neighbours in the layer above and below, positions within the layer
+    above = [[other for other in neighbours[node] if layer[other] == layer[node] - 1] for node in range(num_nodes)]
+    below = [[other for other in neighbours[node] if layer[other] == layer[node] + 1] for node in range(num_nodes)]
+    position = [0] * num_nodes
+    for nodes in layers:
+        for index, node in enumerate(nodes):
+            position[node] = index
+    for sweep in range(LAYOUT_SWEEPS):
+        down = sweep % 2 == 0
+        adjacent = above if down else below
+        for index in (range(1, len(layers)) if down else range(len(layers) - 2, -1, -1)):
+            nodes = layers[index]
+            keys = {}
+            for node in nodes:
+                others = adjacent[node]
+                keys[node] = sum([position[other] for other in others]) / len(others) if others else position[node]
+            nodes.sort(key=keys.__getitem__)
+            for position_in_layer, node in enumerate(nodes):
+                position[node] = position_in_layer
+
+    coordinates = [None] * num_nodes
+    for index, nodes in enumerate(layers):
+        offset = (len(nodes) - 1) / 2
+        for node in nodes:
+            coordinates[node] = (index * LAYER_SPACING, int((position[node] - offset) * NODE_SPACING))
+    return coordinates
+
+class ReducedGraph:
+    def __init__(self, depth):
+        self.depth = depth
+        self.nodes = []
+        self.edges = []
+        # (log_file_id, filtered_file_id) of the logs of the project, see DataflowGraph
+        self.logs = []
+        self.etag = None
+        self.body = None
+
+    def build(self, logs, accesses):
+        # logs: (index, log_file_id) of the processed logs of the project
+        # program node -> node index, path -> {node index}
+        programs = {}
+        readers = {}
+        writers = {}
+        for index, log_file_id in logs:
+            for program, path, mode in accesses[log_file_id]:
+                program_id = programs.get((index, program))
+                if program_id is None:
+                    program_id = programs[(index, program)] = len(programs)
+                if mode == 'read':
+                    readers.setdefault(path, set()).add(program_id)
+                elif mode == 'write':
+                    writers.setdefault(path, set()).add(program_id)
+
+        # group the files that are kept by their collapse key (files that are
+        # read come before files that are only written); the groups become
+        # nodes in sorted order of their keys below, so the node numbers do
+        # not depend on the order of the accesses
+        groups = {}
+        dropped = 0
+        for path, path_readers in readers.items():
+            if path not in writers and len(path_readers) == 1:
+                dropped += 1
+            else:
+                groups.setdefault(collapse_key(path, self.depth), []).append(path)
+        for path in writers:
+            if path not in readers:
+                groups.setdefault(collapse_key(path, self.depth), []).append(path)
+
+        # program nodes first, then one node per group (the file itself if
+        # the group has only one file); edges are counted per node pair
+        labels = [f'log-{index}##{program}' for index, program in programs]
+        group_files = []
+        read_edges = {}
+        write_edges = {}
+        for key in sorted(groups):
+            paths = groups[key]
+            node = len(labels)
+            labels.append(paths[0] if len(paths) == 1 else key)
+            group_files.append(len(paths))
+            for path in paths:
+                for program_id in readers.get(path, ()):
+                    read_edges[(node, program_id)] = read_edges.get((node, program_id), 0) + 1
+                for program_id in writers.get(path, ()):
+                    write_edges[(program_id, node)] = write_edges.get((program_id, node), 0) + 1
+        edge_files = list(read_edges.items()) + list(write_edges.items())
+        coordinates = layout(len(labels), [pair for pair, _ in edge_files])
+
+        for node, label in enumerate(labels):
+            x, y = coordinates[node]
+            if node < len(programs):
+                self.nodes.append({ 'id': f'{node + 1}', 'label': label, 'type': 'program', 'position': { 'x': x, 'y': y }, 'data': { 'status': 'null' } })
+            else:
+                files = group_files[node - len(programs)]
+                data = { 'status': 'null', 'files': files } if files > 1 else { 'status': 'null' }
+                self.nodes.append({ 'id': f'{node + 1}', 'label': label, 'type': 'file', 'position': { 'x': x, 'y': y }, 'data': data })
+        for index, ((source, target), files) in enumerate(edge_files, 1):
+            self.edges.append({ 'id': f'ed{index}', 'source': source + 1, 'target': target + 1, 'data': { 'files': files } })
+
+        REDUCED_FILES.inc(dropped, result='dropped')
+        REDUCED_FILES.inc(sum(count for count in group_files if count > 1), result='collapsed')
+        REDUCED_FILES.inc(sum(1 for count in group_files if count == 1), result='kept')
+        self.etag = f'{graph_etag(self.logs)}-reduced-{self.depth}'
+
+# cached reduced graphs by (project id, depth), least recently used first,
+# shared by all request threads
+_reduced = collections.OrderedDict()
+_reduced_lock = threading.Lock()
+
+def get_reduced(project_id, depth, logs=None):
+    # return the (cached) ReducedGraph of a project for a collapse depth
+    if logs is None:
+        logs = project_logs(project_id)
+    extract_missing(logs)
+    keys = project_keys(logs)
+
+    with _reduced_lock:
+        graph = _reduced.get((project_id, depth))
+        if graph is not None and graph.logs == keys:
+            _reduced.move_to_end((project_id, depth))
+            return graph
+        with REDUCE_SECONDS.time():
+            graph = ReducedGraph(depth)
+            graph.logs = keys
+            processed = [(index, key[0]) for index, key in enumerate(keys) if key[1] is not None]
+            graph.build(processed, load_accesses([log_file_id for _, log_file_id in processed]))
+        _reduced[(project_id, depth)] = graph
+        _reduced.move_to_end((project_id, depth))
+        depths = [key for key in _reduced if key[0] == project_id]
+        for key in depths[:max(0, len(depths) - CACHED_DEPTHS)]:
+            del _reduced[key]
+        return graph
+
+def get_reduced_json(project_id, depth, logs=None):
+    # (etag, JSON body) of the reduced graph, see get_graph_json()
+    graph = get_reduced(project_id, depth, logs)
+    with _reduced_lock:
+        if graph.body is None:
+            graph.body = json.dumps({'nodes': graph.nodes, 'edges': graph.edges})
+        return graph.etag, graph.body
+
+def get_reduced_snapshot(project_id, depth, logs=None):
+    # (etag, nodes, edges) of the reduced graph, which is never modified
+    graph = get_reduced(project_id, depth, logs)
+    return graph.etag, graph.nodes, len(graph.nodes), graph.edges, len(graph.edges)
+
+def invalidate(project_id):
+    with _reduced_lock:
+        for key in [key for key in _reduced if key[0] == project_id]:
+            del _reduced[key]
@@ -1,66 +1,34 @@
 # routes.py
-from flask import request, jsonify, current_app, send_file, abort
+from flask import request, jsonify, current_app, send_file, abort, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
 from app import app, db, CORS
-from app.models import Project, LogFile, FilteredFile, View, Data
+from app.models import Project, LogFile, FilteredFile, FileAccess, View, Data
+import contextlib
 import json
+import mimetypes
 import os
 import re
+import urllib.parse
 import datetime
-import threading
-import hashlib
-from .processing import process_file
-
-def is_open_call(line):
-    decoded_line = line.decode('utf-8')
-    row = re.split(r'\s+', decoded_line)
-    if re.search('^(open|openat|open64|fopen|fopenat|fopen64|freopen)$', row[12]):
-        return True
-    return False
-
-def get_program_name(line):
-    decoded_line = line.decode('utf-8')
-    row = re.split(r'\s+', decoded_line)
-    return row[8]
-
-def get_file_name(line):
-    decoded_line = line.decode('utf-8')
-    row = re.split(r'\s+', decoded_line)
-    if re.search('^(open|open64|fopen|fopen64|freopen)$', row[12]):
-        return row[13]
-    if re.search('^(openat|fopenat)$', row[12]):
-        return row[14]
-    else:
-        return 'NONE'
-
-def get_access_mode(line):
-    decoded_line = line.decode('utf-8')
-    row = re.split(r'\s+', decoded_line)
-    if re.search('^(open|open64|fopen|fopen64|freopen)$', row[12]):
-        raw_access_mode = row[14]
-    elif re.search('^(openat|fopenat)$', row[12]):
-        raw_access_mode = row[15]
-    else:
-        return 'UNKNOWN'
-    if re.search('^(open|open64|openat)$', row[12]):
-        # raw_access_mode contains 'O_RDWR' -> return 'write'
-        if 'O_RDWR' in raw_access_mode:
-            return 'write'
-        # raw_access_mode contains 'O_RDONLY' -> return 'read'
-        if 'O_RDONLY' in raw_access_mode:
-            return 'read'
-    elif re.search('^(fopen|fopen64|fopenat|freopen)$', row[12]):
-        # raw_access_mode contains 'w' -> return 'write'
-        if 'w' in raw_access_mode:
-            return 'write'
-        # raw_access_mode contains 'r' -> return 'read'
-        if 'r' in raw_access_mode:
-            return 'read'
-
-    return 'UNKNOWN'
+from .dataflow import extract_accesses, store_accesses, load_accesses, accesses_by_checksum, project_logs, project_keys, touch_projects, graph_etag, get_graph_json, get_graph_snapshot, iter_ndjson, invalidate
+from . import access_index, bulk, hashing, lineage, metrics, reduction
+from .columnar import sidecar_path, write_columns
+from .compression import CompressionError, available, compress_file, detect, strip_suffix, suffix_compression
+from .filter_cache import FilterCache
+from .jobs import JobQueue, QUEUED, RUNNING, DONE
+from .processing import process_file, processed_file_path, processed_file_paths, temporary_path, filters_key
+from .uploads import ChunkedUpload, UploadError, save_stream, link_file
 
 def allowed_log_file(filename):
+    # logs may be uploaded gzip or zstd compressed, e.g., 'trace.log.gz'
+    method = suffix_compression(filename)
+    if method is not None:
+        if not available(method):
+            return False
+        filename = strip_suffix(filename)
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'txt', 'csv', 'json', 'log'}
 
 def background_processing(log_file_id, filters):
@@ -68,11 +36,36 @@ def background_processing(log_file_id, filters):
         log_file = LogFile.query.get(log_file_id)
         if log_file:
             original_filepath = log_file.file_path
-            print(f"background_processing: org_path={original_filepath}")
-            processed_filepath = process_file(original_filepath, filters)  # Process the file
-            checksum = calculate_checksum(processed_filepath)
+            app.logger.info(f"background_processing: org_path={original_filepath}")
+            # reuse the output of an earlier run on the same content with the same filters
+            cache_key = FilterCache.key(log_file.checksum, filters) if log_file.checksum else None
+            processed_filepath = processed_file_path(original_filepath, app.config['STORAGE_COMPRESSION'])
+            checksum = filter_cache.get(cache_key, processed_filepath) if cache_key else None
+            if checksum is not None:
+                # cached with another STORAGE_COMPRESSION, named after its content
+                cached_filepath = processed_filepath
+                processed_filepath = processed_file_path(original_filepath, detect(cached_filepath))
+                if processed_filepath != cached_filepath:
+                    os.replace(cached_filepath, processed_filepath)
+            else:
+                # Process the file, the checksum is computed while writing it
+                processed_filepath, checksum = process_file(
+                    original_filepath, filters,
+                    workers=app.config['PROCESSING_WORKERS'],
+                    min_parallel_size=app.config['PROCESSING_PARALLEL_MIN_SIZE'],
+                    compression=app.config['STORAGE_COMPRESSION'],
+                    compression_level=app.config['STORAGE_COMPRESSION_LEVEL'])
+                if cache_key:
+                    filter_cache.put(cache_key, processed_filepath, checksum)
             processed_time = datetime.datetime.now()
-                
+            # parse the open calls once into a columnar sidecar for later
+            # analyses, the text file stays available for download
+            write_columns(processed_filepath)
+            # extract the open calls once for the dataflow graph
+            accesses = accesses_by_checksum(checksum)
+            if accesses is None:
+                accesses = extract_accesses(processed_filepath)
+
             # Save processed file metadata to the database
             filtered_file = FilteredFile(
                 log_file_id=log_file_id,
@@ -81,15 +74,118 @@ def background_processing(log_file_id, filters):
                 checksum=checksum,
                 processed_time=processed_time
             )
+            # replaces the output of an earlier run, e.g., with other filters
+            FilteredFile.query.filter_by(log_file_id=log_file_id).delete(synchronize_session=False)
             db.session.add(filtered_file)
+            store_accesses(filtered_file, accesses)
+            touch_projects([log_file.project_id])
             db.session.commit()
 
-def calculate_checksum(file_path):
-    hasher = hashlib.sha256()
-    with open(file_path, 'rb') as f:
-        buf = f.read()
-        hasher.update(buf)
-    return hasher.hexdigest()
+# uploaded log files are processed by a bounded pool of background workers
+job_queue = JobQueue(app, background_processing)
+# filtered outputs by (raw checksum, filters), shared by all projects
+filter_cache = FilterCache(os.path.join(app.config['UPLOAD_DIRECTORY'], '.filter_cache'), app.config['FILTER_CACHE_SIZE'])
+# checksums of stored files and the pool uploaded files are hashed in
+hashing.service.configure(app.config['CHECKSUM_WORKERS'], app.config['CHECKSUM_CACHE_SIZE'])
+lineage.configure(app.config['LINEAGE_CACHE_NODES'])
+
+def job_counts():
+    # number of jobs (log files) by status, for /metrics
+    rows = db.session.query(LogFile.status, db.func.count(LogFile.id)).group_by(LogFile.status).all()
+    return {(status or 'unknown',): count for status, count in rows}
+
+metrics.gauge('vdi_job_queue_depth', 'Jobs held in the in-memory queue of this process',
+              callback=lambda: {(): job_queue.queue.qsize()})
+metrics.gauge('vdi_jobs', 'Jobs (log files) by status', ('status',), callback=job_counts)
+metrics.counter('vdi_filter_cache_events_total', 'Filter cache hits, misses and evictions', ('event',),
+                callback=lambda: {(event,): count for event, count in filter_cache.stats().items()})
+
+def paginate(query, id_column):
+    # cursor pagination for list endpoints: ?limit=N returns at most N rows
+    # ordered by id, ?cursor=<next_cursor of the previous page> continues
+    # after the last row of that page; next_cursor is None on the last page
+    # without limit all rows are returned, as before
+    limit = request.args.get('limit', type=int)
+    if limit is None or limit <= 0:
+        return query.all(), None
+    cursor = request.args.get('cursor', type=int)
+    query = query.order_by(id_column)
+    if cursor is not None:
+        query = query.filter(id_column > cursor)
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+def delete_file_accesses(condition):
+    # FileAccess rows can be many per log file, delete them in one statement
+    # instead of letting the ORM cascade load and delete them one by one
+    FileAccess.query.filter(condition).delete(synchronize_session=False)
+
+def delete_log_file_rows(*conditions):
+    # delete the LogFile rows matching conditions with their filtered files
+    # and open calls, with one statement per table (the caller commits);
+    # returns the number of log files and the paths of their files on disk
+    # (raw, processed and columnar sidecar)
+    log_file_ids = select(LogFile.id).where(*conditions)
+    touch_projects({project_id for project_id, in db.session.query(LogFile.project_id).filter(*conditions).distinct()})
+    paths = set()
+    for file_path, in db.session.query(LogFile.file_path).filter(*conditions):
+        paths.add(file_path)
+        for processed_path in processed_file_paths(file_path):
+            paths.update((processed_path, sidecar_path(processed_path)))
+    for filtered_path, in db.session.query(FilteredFile.filtered_file_path).filter(FilteredFile.log_file_id.in_(log_file_ids)):
+        paths.update((filtered_path, sidecar_path(filtered_path)))
+    delete_file_accesses(FileAccess.log_file_id.in_(log_file_ids))
+    FilteredFile.query.filter(FilteredFile.log_file_id.in_(log_file_ids)).delete(synchronize_session=False)
+    count = LogFile.query.filter(*conditions).delete(synchronize_session=False)
+    return count, paths
+
+def delete_data_rows(*conditions):
+    # delete the Data rows matching conditions with one statement (the
+    # caller commits); returns the number of rows and the stored files
+    paths = {stored_path for stored_path, in db.session.query(Data.stored_path).filter(*conditions)}
+    count = Data.query.filter(*conditions).delete(synchronize_session=False)
+    return count, paths
+
+def unreferenced_paths(paths):
+    # the paths not used by any remaining row (e.g., a log file uploaded
+    # again under the same name), nor derived from such a path
+    paths = set(paths)
+    referenced = set()
+    candidates = list(paths)
+    for start in range(0, len(candidates), 500):
+        chunk = candidates[start:start + 500]
+        for column in (LogFile.file_path, FilteredFile.filtered_file_path, Data.stored_path):
+            referenced.update(path for path, in db.session.query(column).filter(column.in_(chunk)))
+    for path in list(referenced):
+        referenced.add(sidecar_path(path))
+        for processed_path in processed_file_paths(path):
+            referenced.update((processed_path, sidecar_path(processed_path)))
+    return paths - referenced
+
+def commit_and_reclaim(paths, remove_directories=False):
+    # commit deleted rows and remove their files that no remaining row uses
+    # in the background; returns the operation tracking it; the files are
+    # moved to the trash (see app/bulk.py) before the commit, while the
+    # deletion holds the database write lock, so no upload can register a
+    # file under one of the paths in between (uploads place their files
+    # after their rows, under the same lock); with remove_directories, the
+    # directories of the files and their parents (project or view directory)
+    # are removed if they end up empty
+    paths = unreferenced_paths(paths)
+    directories = set()
+    if remove_directories:
+        for path in paths:
+            directories.update((os.path.dirname(path), os.path.dirname(os.path.dirname(path))))
+    roots = [current_app.config['UPLOAD_DIRECTORY'], current_app.config['DATA_DIRECTORY']]
+    operation, moved = bulk.trash(paths, roots)
+    try:
+        db.session.commit()
+    except BaseException:
+        bulk.restore(operation, moved)
+        raise
+    return bulk.reclaim(operation, moved, directories)
 
 def ensure_upload_directory_exists():
     # base directory where uploaded files will be saved
@@ -98,88 +194,62 @@ def ensure_upload_directory_exists():
     if not os.path.exists(current_app.config['UPLOAD_DIRECTORY']):
         os.makedirs(current_app.config['UPLOAD_DIRECTORY'])
 
+DATAFLOW_RESPONSES = metrics.counter('vdi_dataflow_responses_total', 'Responses of /dataflow by format and status', ('format', 'status'))
+DATAFLOW_LOGS = metrics.histogram('vdi_dataflow_logs', 'Logs of the project per /dataflow request',
+                                  buckets=(1, 10, 100, 1000, 10000, 100000))
+
 @app.route('/dataflow/<int:project_id>', methods=['GET'])
 def get_dataflow(project_id):
     project = Project.query.get(project_id)
     if project is None:
         return jsonify({'error': 'Project not found'}), 404
-    print(f'project name: {project.name}')
-
-    # get processed log files if any
-    nodes = []
-    edges = []
-    edge_counter = 1
-    node_counter = 1
-    raw_log_files = LogFile.query.filter_by(project_id=project.id).all()
-    print(f'number of raw log files: {len(raw_log_files)}')
-    files = {}
-    read_ops = {}
-    write_ops = {}
-    for index, raw_log in enumerate(raw_log_files):
-        print(f'processing log file #{index+1}: {raw_log.file_name}')
-        processed_log_file = FilteredFile.query.filter_by(log_file_id=raw_log.id).first()
-
-        # for each log file line determine the program, filepath and access mode
-        file_path = processed_log_file.filtered_file_path
-        programs = {}
-        with open(file_path, 'rb') as file:
-            for line in file:
-                # check that call is one of open{64,at} or fopen{64,at}
-                if not is_open_call(line):
-                    continue
-
-                access_mode = get_access_mode(line)
-                print(f'access_mode: "{access_mode}"')
-
-                program_name_in_log = f'log-{index}##{get_program_name(line)}'
-                if program_name_in_log not in programs:
-                    # if program new create a new program node
-                    programs[program_name_in_log] = node_counter
-                    #nodes.append({ 'id': f'{node_counter}', 'label': program_name_in_log, 'type': 'program', 'position': { 'x': 0, 'y': 0 }, 'data': { 'status': 'null' } })
-                    nodes.append({ 'id': f'{node_counter}', 'label': program_name_in_log, 'type': 'program', 'data': { 'status': 'null' } })
-                    node_counter = node_counter + 1
-
-                # file_path_in_log = f'log-{index}##{get_file_name(line)}'
-                # for files we should not use the prefix 'log-{index}##' or the graph cannot be connected
-                file_path_in_log = f'{get_file_name(line)}'
-                print(f'file_path_in_log: "{file_path_in_log}"')
-                if file_path_in_log not in files:
-                    # if file new create a new file node
-                    files[file_path_in_log] = node_counter
-                    #nodes.append({ 'id': f'{node_counter}', 'label': file_path_in_log, 'type': 'file', 'position': { 'x': 0, 'y': 0 }, 'data': { 'status': 'null' } })
-                    nodes.append({ 'id': f'{node_counter}', 'label': file_path_in_log, 'type': 'file', 'data': { 'status': 'null' } })
-                    node_counter = node_counter + 1
-
-                # TODO handle case that file was accessed already, but with different access mode;
-                #      that is add a node? no, just a reverse edge --> probably hard to make clear
-                #        in visualisation, need some better way (no arrow, other color, ...), thus need to pass back some extra information to frontend
-                if access_mode == 'read':
-                    # if access == read, create an edge from the file to the program node
-                    # we assume that each log only represents a single program that would read the file
-                    if file_path_in_log not in read_ops:
-                        read_ops[file_path_in_log] = edge_counter
-                        edges.append({ 'id': f'ed{edge_counter}', 'source': files[file_path_in_log], 'target': programs[program_name_in_log] })
-                        edge_counter = edge_counter + 1
-
-                if access_mode == 'write':
-                    # TODO FIXME if file is openend for both reading and writing create another node for the file and use that as target
-                    #            however that may need that we distinguish the operation in the file_path_in_log, but then this complicates
-                    #            the matching of files between programs
-                    # if access == write, create an edge from the program to the file node
-                    # we assume that each log only represents a single program that would write the file
-                    if file_path_in_log not in write_ops:
-                        write_ops[file_path_in_log] = edge_counter
-                        edges.append({ 'id': f'ed{edge_counter}', 'source': programs[program_name_in_log], 'target': files[file_path_in_log] })
-                        edge_counter = edge_counter + 1
-
-    # return both arrays: nodes and edges
-    print(f'nodes: {nodes}')
-    print(f'edges: {edges}')
-    return jsonify({'nodes': nodes, 'edges': edges}), 200
+    app.logger.debug(f'project name: {project.name}')
+
+    # the graph only changes when logs are added, processed or deleted, so
+    # its ETag is known before the graph is built (see app/dataflow.py)
+    logs = project_logs(project.id)
+    app.logger.debug(f'number of raw log files: {len(logs)}')
+    # ?format=ndjson streams one node/edge per line instead of building
+    # the whole JSON document
+    ndjson = request.args.get('format') == 'ndjson'
+    suffix = '-ndjson' if ndjson else ''
+    # ?reduce=1 returns the reduced graph with node positions, files
+    # collapsed by directory prefixes of ?depth=N components (see
+    # app/reduction.py)
+    reduce = request.args.get('reduce', '').lower() in ('1', 'true', 'yes')
+    depth = request.args.get('depth', app.config['DATAFLOW_COLLAPSE_DEPTH'], type=int)
+    if reduce:
+        if not 0 <= depth <= reduction.MAX_DEPTH:
+            return jsonify({'error': f'Invalid depth, expected 0 to {reduction.MAX_DEPTH}'}), 400
+        suffix = f'-reduced-{depth}' + suffix
+    etag = graph_etag(project_keys(logs)) + suffix
+    if request.if_none_match.contains(etag):
+        DATAFLOW_RESPONSES.inc(format='ndjson' if ndjson else 'json', status='304')
+        return '', 304, {'ETag': f'"{etag}"'}
+    DATAFLOW_RESPONSES.inc(format='ndjson' if ndjson else 'json', status='200')
+    DATAFLOW_LOGS.observe(len(logs))
+
+    if ndjson:
+        if reduce:
+            etag, nodes, num_nodes, edges, num_edges = reduction.get_reduced_snapshot(project.id, depth, logs)
+        else:
+            etag, nodes, num_nodes, edges, num_edges = get_graph_snapshot(project.id, logs)
+        etag = etag + '-ndjson'
+        response = current_app.response_class(stream_with_context(iter_ndjson(nodes, num_nodes, edges, num_edges)),
+                                              mimetype='application/x-ndjson')
+    else:
+        if reduce:
+            etag, body = reduction.get_reduced_json(project.id, depth, logs)
+        else:
+            etag, body = get_graph_json(project.id, logs)
+        response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response, 200
 
 @app.route('/projects', methods=['GET'])
 def get_projects():
-    projects = Project.query.all()
+    projects = db.session.query(Project.id, Project.name).all()
     return jsonify([{'id': project.id, 'name': project.name} for project in projects]), 200
 
 @app.route('/projects', methods=['POST'])
@@ -197,9 +267,123 @@ def delete_project(project_id):
     project = Project.query.get(project_id)
     if project is None:
         return jsonify({'error': 'Project not found'}), 404
+    # the rows are deleted at once, their files are removed in the background
+    _, paths = delete_log_file_rows(LogFile.project_id == project_id)
     db.session.delete(project)
-    db.session.commit()
-    return jsonify({'message': 'Project deleted successfully'}), 200
+    operation = commit_and_reclaim(paths, remove_directories=True)
+    invalidate(project_id)
+    access_index.invalidate(project_id)
+    reduction.invalidate(project_id)
+    lineage.invalidate(project_id)
+    return jsonify({'message': 'Project deleted successfully', 'operation': operation.to_dict()}), 200
+
+@app.route('/projects/<int:project_id>/logfiles', methods=['DELETE'])
+def delete_log_files(project_id):
+    # delete many log files of a project: JSON with ids, a list of LogFile
+    # ids; the rows are deleted at once and their files (raw, processed,
+    # sidecars) removed in the background, see the returned operation
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not all(isinstance(file_id, int) for file_id in ids):
+        return jsonify({'error': 'No list of log file ids provided'}), 400
+    count, paths = delete_log_file_rows(LogFile.project_id == project_id, LogFile.id.in_(ids))
+    operation = commit_and_reclaim(paths)
+    return jsonify({'deleted': count, 'operation': operation.to_dict()}), 202
+
+@app.route('/operations', methods=['GET'])
+def get_operations():
+    # running bulk operations, of one ?kind= (upload, reclaim) if given,
+    # e.g., to find the operation of an archive upload that is still sent
+    operations = bulk.running(request.args.get('kind'))
+    return jsonify({'operations': [operation.to_dict() for operation in operations]}), 200
+
+@app.route('/operations/<string:operation_id>', methods=['GET'])
+def get_operation(operation_id):
+    # progress of a bulk operation (archive upload, removal of deleted files)
+    operation = bulk.get(operation_id)
+    if operation is None:
+        return jsonify({'error': 'Operation not found'}), 404
+    return jsonify(operation.to_dict()), 200
+
+@app.route('/projects/<int:project_id>/files', methods=['GET'])
+def get_project_files(project_id):
+    # files accessed in the logs of a project whose path starts with
+    # ?prefix=, with the programs that accessed them; ?limit= and ?cursor=
+    # (the next_cursor of the previous page, a path) page through the result
+    if db.session.query(Project.id).filter_by(id=project_id).first() is None:
+        return jsonify({'error': 'Project not found'}), 404
+    prefix = request.args.get('prefix', '')
+    limit = request.args.get('limit', access_index.DEFAULT_LIMIT, type=int)
+    limit = min(max(limit, 1), access_index.MAX_LIMIT)
+    files, next_cursor = access_index.lookup_files(project_id, prefix, request.args.get('cursor'), limit)
+    return jsonify({
+        'project_id': project_id,
+        'prefix': prefix,
+        'files': [{'path': path,
+                   'accesses': [{'program': program, 'mode': mode, 'log_file_id': log_file_id}
+                                for program, mode, log_file_id in accesses]}
+                  for path, accesses in files],
+        'next_cursor': next_cursor,
+    }), 200
+
+@app.route('/projects/<int:project_id>/programs/<path:program_name>', methods=['GET'])
+def get_project_program(project_id, program_name):
+    # files a program accessed in the logs of a project; ?mode=read or
+    # ?mode=write returns only the files it read or wrote
+    if db.session.query(Project.id).filter_by(id=project_id).first() is None:
+        return jsonify({'error': 'Project not found'}), 404
+    accesses = access_index.lookup_program(project_id, program_name)
+    if accesses is None:
+        return jsonify({'error': 'Program not found'}), 404
+    mode = request.args.get('mode')
+    return jsonify({
+        'project_id': project_id,
+        'program': program_name,
+        'files': [{'path': path, 'mode': access_mode, 'log_file_id': log_file_id}
+                  for path, access_mode, log_file_id in accesses
+                  if mode is None or access_mode == mode],
+    }), 200
+
+@app.route('/projects/<int:project_id>/lineage', methods=['GET'])
+def get_project_lineage(project_id):
+    # transitive lineage of a file (?path=) or a program (?program=, in all
+    # logs) over every reader and writer in the logs of a project (see
+    # app/lineage.py): ?direction=upstream (default) returns what it was
+    # produced from, downstream what it fed; ?type=file (default), program
+    # or all selects the nodes returned, ?depth=N limits the distance in
+    # edges (a file read by a program that wrote a file is 2 edges away);
+    # ?limit= and ?cursor= (the next_cursor of the previous page) page
+    # through the result, which is in order of distance
+    if db.session.query(Project.id).filter_by(id=project_id).first() is None:
+        return jsonify({'error': 'Project not found'}), 404
+    path = request.args.get('path')
+    program = request.args.get('program')
+    if (path is None) == (program is None):
+        return jsonify({'error': 'Either path or program must be given'}), 400
+    direction = request.args.get('direction', lineage.UPSTREAM)
+    if direction not in lineage.DIRECTIONS:
+        return jsonify({'error': f'Invalid direction, expected one of {", ".join(lineage.DIRECTIONS)}'}), 400
+    node_type = request.args.get('type', lineage.FILE)
+    if node_type not in lineage.TYPES:
+        return jsonify({'error': f'Invalid type, expected one of {", ".join(lineage.TYPES)}'}), 400
+    max_depth = request.args.get('depth', type=int)
+    limit = request.args.get('limit', access_index.DEFAULT_LIMIT, type=int)
+    limit = min(max(limit, 1), access_index.MAX_LIMIT)
+    offset = max(request.args.get('cursor', 0, type=int), 0)
+    result = lineage.lookup(project_id, direction, path, program, node_type, max_depth, offset, limit)
+    if result is None:
+        return jsonify({'error': 'File not found' if path is not None else 'Program not found'}), 404
+    nodes, total, next_offset = result
+    return jsonify({
+        'project_id': project_id,
+        'path': path,
+        'program': program,
+        'direction': direction,
+        'type': node_type,
+        'total': total,
+        'nodes': nodes,
+        'next_cursor': str(next_offset) if next_offset is not None else None,
+    }), 200
 
 @app.route('/upload/<string:project_name>', methods=['POST'])
 def upload_files(project_name):
@@ -210,7 +394,230 @@ def upload_files(project_name):
     if not project_id:
         return jsonify({"error": "No project Id provided"}), 400
 
+    try:
+        filters = parse_filters(request.form.get('filters'), decode=True)  # Specify the filters (regular expressions)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filters: {e}'}), 400
+
     # check if the project exists
+    project, project_dir = get_or_create_project(project_name, project_id)
+
+    files = request.files.getlist('files')
+    # (file name, raw file path, temporary path, future of its checksum)
+    saved = []
+    error = None
+    for file in files:
+        if file.filename == '':
+            # keep the files saved so far
+            error = jsonify({'error': 'Filename empty or no selected file'}), 400
+            break
+
+        sec_file_name = secure_filename(file.filename)
+        if file and allowed_log_file(sec_file_name):
+            saved.append(save_log_upload(file.stream, project_dir, sec_file_name))
+
+    # files are added in upload order
+    log_files = []
+    for index, (sec_file_name, raw_file_path, tmp_path, future) in enumerate(saved):
+        try:
+            checksum = future.result()
+        except CompressionError:
+            # keep the files saved so far
+            discard_uploads(saved[index + 1:])
+            error = jsonify({'error': f'{sec_file_name} cannot be decompressed'}), 400
+            break
+        log_files.append(add_log_file(project, raw_file_path, tmp_path, checksum, filters)[0])
+
+    # one commit for all files of the upload
+    db.session.commit()
+    queue_jobs(log_files)
+    if error is not None:
+        return error
+
+    # TODO provide detailed status, e.g., some files may not have been uploaded
+    return jsonify({"message": "Files uploaded successfully"})
+
+def save_log_upload(stream, project_dir, sec_file_name):
+    # save an uploaded raw log to a temporary file, hashing (and compressing)
+    # it while it is written; hashing compressed uploads (or compressing them
+    # for storage) runs in the hashing pool while the next files are received
+    # returns (file name, raw file path, temporary path, future of its checksum)
+    raw_file_path = os.path.join(project_dir, sec_file_name)
+    tmp_path = temporary_path(raw_file_path)
+    compression = None if suffix_compression(sec_file_name) else app.config['STORAGE_COMPRESSION']
+    checksum = save_stream(stream, tmp_path, compression, app.config['STORAGE_COMPRESSION_LEVEL'])
+    return sec_file_name, raw_file_path, tmp_path, hashing.service.submit(finish_log_upload, tmp_path, sec_file_name, checksum)
+
+def discard_uploads(saved):
+    # remove the temporary files of uploads that are not added
+    for _, _, tmp_path, future in saved:
+        try:
+            future.result()
+        except Exception:
+            # removed by finish_log_upload if it cannot be decompressed
+            pass
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+@app.route('/upload/<string:project_name>/archive', methods=['POST'])
+def upload_archive(project_name):
+    # upload many log files as one archive in the request body: tar (also
+    # gzip, bzip2 or xz compressed) or zip (Content-Type application/zip),
+    # with ?projectId= and optional ?filters= (JSON); members are extracted
+    # while the archive is received and added in one transaction, members
+    # that are not log files are skipped; nothing is added if the archive is
+    # corrupt
+    project_id = request.args.get('projectId')
+    if not project_id:
+        return jsonify({"error": "No project Id provided"}), 400
+    try:
+        filters = parse_filters(request.args.get('filters'), decode=True)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filters: {e}'}), 400
+    project, project_dir = get_or_create_project(project_name, project_id)
+
+    # the operation can be followed with /operations?kind=upload while the
+    # archive is sent, it is labelled with the project name; it is finished
+    # as failed if the upload fails for any reason
+    operation = bulk.start('upload', label=project_name)
+    saved = []
+    try:
+        return receive_archive(operation, project, project_dir, filters, saved)
+    except Exception as e:
+        operation.error(f'upload failed: {e}')
+        operation.finish(bulk.FAILED)
+        db.session.rollback()
+        discard_uploads(saved)
+        raise
+
+def receive_archive(operation, project, project_dir, filters, saved):
+    # extract, store and add the members of an archive upload (see
+    # upload_archive()), saved collects the members saved so far;
+    # members keep their directory in the name (logs/n1/trace.log is stored
+    # as logs_n1_trace.log), so logs of the same name in different
+    # directories are kept apart; a member is skipped, and reported in the
+    # errors of the operation, if its name is used by another member or by
+    # a log file of the project with other content
+    skipped = []
+    names = set()
+    spool_path = temporary_path(os.path.join(project_dir, 'archive'))
+    try:
+        with contextlib.closing(bulk.iter_archive(request.stream, request.mimetype, spool_path)) as members:
+            for name, member, size in members:
+                sec_file_name = secure_filename(name)
+                if sec_file_name == '' or not allowed_log_file(sec_file_name):
+                    skipped.append(name)
+                elif sec_file_name in names:
+                    skipped.append(name)
+                    operation.error(f'{name} is stored as {sec_file_name}, which another member of the archive uses')
+                else:
+                    names.add(sec_file_name)
+                    saved.append(save_log_upload(member, project_dir, sec_file_name))
+                operation.progress(bytes_read=size)
+    except bulk.ARCHIVE_ERRORS as e:
+        discard_uploads(saved)
+        del saved[:]
+        operation.error(f'invalid archive: {e}')
+        operation.finish(bulk.FAILED)
+        return jsonify({'error': f'invalid archive: {e}', 'operation': operation.to_dict()}), 400
+
+    # checksums of the log files of the project stored under the same paths
+    stored = {}
+    for file_path, checksum in db.session.query(LogFile.file_path, LogFile.checksum) \
+            .filter(LogFile.project_id == project.id, LogFile.file_path.in_([raw_file_path for _, raw_file_path, _, _ in saved])):
+        stored.setdefault(file_path, set()).add(checksum)
+
+    added = []
+    for sec_file_name, raw_file_path, tmp_path, future in saved:
+        try:
+            checksum = future.result()
+        except CompressionError:
+            skipped.append(sec_file_name)
+            operation.error(f'{sec_file_name} cannot be decompressed')
+            continue
+        if raw_file_path in stored and checksum not in stored[raw_file_path]:
+            os.remove(tmp_path)
+            skipped.append(sec_file_name)
+            operation.error(f'{sec_file_name} is used by a log file of the project with other content')
+            continue
+        added.append(add_log_file(project, raw_file_path, tmp_path, checksum, filters))
+
+    # one commit for all files of the archive
+    db.session.commit()
+    del saved[:]
+    queue_jobs([log_file for log_file, _ in added])
+    operation.finish()
+    return jsonify({
+        'files': [log_file_info(log_file, deduplicated) for log_file, deduplicated in added if log_file is not None],
+        'skipped': skipped,
+        'operation': operation.to_dict(),
+    }), 200
+
+@app.route('/upload/<string:project_name>/manifest', methods=['POST'])
+def upload_manifest(project_name):
+    # add many log files by the checksums of their content, in one
+    # transaction: JSON with projectId, optional filters and files, a list
+    # of {fileName, checksum, optional filters}; files whose content is
+    # already stored in the project are added without uploading them, the
+    # names of the others are returned as missing (upload them, e.g., as an
+    # archive)
+    data = request.json or {}
+    project_id = data.get('projectId')
+    if not project_id:
+        return jsonify({"error": "No project Id provided"}), 400
+    files = data.get('files')
+    if not isinstance(files, list):
+        return jsonify({'error': 'No files provided'}), 400
+    try:
+        filters = parse_filters(data.get('filters'))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filters: {e}'}), 400
+    project, project_dir = get_or_create_project(project_name, project_id)
+
+    added = []
+    missing = []
+    invalid = []
+    for entry in files:
+        sec_file_name = secure_filename(entry.get('fileName', '')) if isinstance(entry, dict) else ''
+        if sec_file_name == '' or not allowed_log_file(sec_file_name) or not entry.get('checksum'):
+            invalid.append(entry)
+            continue
+        try:
+            entry_filters = parse_filters(entry.get('filters')) or filters
+        except ValueError:
+            invalid.append(entry)
+            continue
+        log_file, deduplicated = add_log_file(project, os.path.join(project_dir, sec_file_name), None,
+                                              entry['checksum'], entry_filters)
+        if log_file is None:
+            missing.append(sec_file_name)
+        else:
+            added.append((log_file, deduplicated))
+
+    # one commit for all files of the manifest
+    db.session.commit()
+    queue_jobs([log_file for log_file, _ in added])
+    return jsonify({
+        'files': [log_file_info(log_file, deduplicated) for log_file, deduplicated in added],
+        'missing': missing,
+        'invalid': invalid,
+    }), 200
+
+def parse_filters(filters, decode=False):
+    # filters of an upload: a list of 'col0@@@regex0@@@col1@@@...' strings,
+    # given as JSON text with decode (form field, query argument) or as
+    # decoded JSON; missing filters are an empty list; raises ValueError if
+    # they are not a list of strings
+    if decode:
+        filters = json.loads(filters) if filters else None
+    if filters is None:
+        return []
+    if not isinstance(filters, list) or not all(isinstance(filter_items, str) for filter_items in filters):
+        raise ValueError('filters must be a list of strings')
+    return filters
+
+def get_or_create_project(project_name, project_id):
+    # return the project and the directory its raw logs are stored in
     project = Project.query.filter_by(name=project_name).first()
     if not project:
        # create a new project if it does not exist
@@ -221,88 +628,306 @@ def upload_files(project_name):
     sec_project_name = f"{secure_filename(project_name)}_{project_id}"
     project_dir = os.path.join(current_app.config['UPLOAD_DIRECTORY'], sec_project_name, 'raw_logs')
     os.makedirs(project_dir, exist_ok=True)
-
-    filters_json = request.form.get('filters')  # Specify the filters (regular expressions)
-    filters = json.loads(filters_json) if filters_json else []
-
-    files = request.files.getlist('files')
-    for file in files:
-        if file.filename == '':
-            return jsonify({'error': 'Filename empty or no selected file'}), 400
-
-        sec_file_name = secure_filename(file.filename)
-        if file and allowed_log_file(sec_file_name):
-            # save raw file
-            raw_file_path = os.path.join(project_dir, sec_file_name)
-            file.save(raw_file_path)
-
-            checksum = calculate_checksum(raw_file_path)
-            processed_time = datetime.datetime.now()
-
-            # save file info to database
-            log_file = LogFile(
-                project_id = project.id,
-                file_name = sec_file_name,
-                file_path = raw_file_path,
-                checksum = checksum,
-                processed_time = processed_time,
-            )
-            db.session.add(log_file)
+    return project, project_dir
+
+def finish_log_upload(tmp_path, file_name, checksum):
+    # prepare an uploaded log in tmp_path for storage and return the SHA-256
+    # of its uncompressed content, which identifies duplicates: compressed
+    # uploads (.gz, .zst) are stored as uploaded, others are compressed if
+    # STORAGE_COMPRESSION is set and tmp_path is not compressed yet;
+    # raises CompressionError, after removing tmp_path, if a compressed
+    # upload cannot be decompressed
+    if suffix_compression(file_name):
+        try:
+            return hashing.file_checksum(tmp_path)
+        except CompressionError:
+            os.remove(tmp_path)
+            raise
+    method = app.config['STORAGE_COMPRESSION']
+    if method and detect(tmp_path) is None:
+        compressed_path = temporary_path(tmp_path)
+        compress_file(tmp_path, compressed_path, method, app.config['STORAGE_COMPRESSION_LEVEL'])
+        os.replace(compressed_path, tmp_path)
+    return checksum
+
+def add_log_file(project, raw_file_path, tmp_path, checksum, filters):
+    # register an uploaded log file whose content is in tmp_path (None if
+    # the content was not uploaded because its checksum is already known in
+    # the project)
+    # if a log file with the same content exists, it is hardlinked instead of
+    # stored again, and if it was already filtered with the same filters its
+    # filtered copy and open calls are reused instead of filtering it again
+    # returns the LogFile and whether existing content was reused; the caller
+    # commits (once per upload) and then passes new log files to queue_jobs()
+    filters_json = json.dumps(filters)
+    try:
+        filters_hash = filters_key(filters)
+    except (ValueError, re.error):
+        # invalid filters, the processing job reports the error
+        filters_hash = None
+    duplicates = LogFile.query.filter_by(checksum=checksum)
+    if tmp_path is None:
+        # a checksum given by the client proves nothing about its content,
+        # only content stored in the same project is reused for it
+        duplicates = duplicates.filter_by(project_id=project.id)
+    duplicates = duplicates.order_by(LogFile.id).all()
+    for duplicate in duplicates:
+        if duplicate.project_id == project.id and duplicate.file_path == raw_file_path:
+            # same file uploaded again to the same project, filtered again
+            # if the filters changed
+            if tmp_path is not None:
+                os.remove(tmp_path)
+            if not same_filters(duplicate, filters_json, filters_hash):
+                refilter_log_file(duplicate, filters_json)
+            return duplicate, True
+
+    if tmp_path is None and not any(os.path.isfile(log_file.file_path) for log_file in duplicates):
+        return None, False
+
+    log_file = LogFile(
+        project_id = project.id,
+        file_name = os.path.basename(raw_file_path),
+        file_path = raw_file_path,
+        checksum = checksum,
+        processed_time = datetime.datetime.now(),
+        status = QUEUED,
+        attempts = 0,
+        filters = filters_json,
+    )
+    db.session.add(log_file)
+    touch_projects([project.id])
+    # the row is written before the file is put in place, so the deletion
+    # of an earlier file under this path cannot remove it (see
+    # commit_and_reclaim())
+    db.session.flush()
+    source = next((duplicate for duplicate in duplicates
+                   if os.path.isfile(duplicate.file_path) and link_file(duplicate.file_path, raw_file_path)), None)
+    if source is not None:
+        if tmp_path is not None:
+            os.remove(tmp_path)
+    elif tmp_path is not None:
+        os.replace(tmp_path, raw_file_path)
+    else:
+        # the duplicates were removed meanwhile
+        db.session.delete(log_file)
+        return None, False
+    hashing.service.remember(raw_file_path, checksum)
+
+    for duplicate in duplicates:
+        filtered = FilteredFile.query.filter_by(log_file_id=duplicate.id).first()
+        if filters_hash is None or duplicate.status != DONE or filtered is None or filtered.num_accesses is None \
+           or filters_key(json.loads(duplicate.filters or '[]')) != filters_hash:
+            continue
+        if not os.path.isfile(filtered.filtered_file_path):
+            continue
+        processed_filepath = processed_file_path(raw_file_path, detect(filtered.filtered_file_path))
+        os.makedirs(os.path.dirname(processed_filepath), exist_ok=True)
+        if not link_file(filtered.filtered_file_path, processed_filepath):
+            continue
+        # the columnar sidecar of the same content is shared as well, it is
+        # written if the duplicate has none (e.g., processed before sidecars)
+        duplicate_columns = sidecar_path(filtered.filtered_file_path)
+        if not (os.path.isfile(duplicate_columns) and link_file(duplicate_columns, sidecar_path(processed_filepath))):
+            write_columns(processed_filepath)
+        db.session.flush()
+        filtered_file = FilteredFile(
+            log_file_id=log_file.id,
+            filtered_file_name=os.path.basename(processed_filepath),
+            filtered_file_path=processed_filepath,
+            checksum=filtered.checksum,
+            processed_time=datetime.datetime.now()
+        )
+        db.session.add(filtered_file)
+        store_accesses(filtered_file, load_accesses([duplicate.id])[duplicate.id])
+        log_file.status = DONE
+        return log_file, True
+
+    return log_file, source is not None
+
+def same_filters(log_file, filters_json, filters_hash):
+    # whether a log file is (to be) processed with the filters of an upload
+    if log_file.filters == filters_json:
+        return True
+    if filters_hash is None:
+        return False
+    try:
+        return filters_key(json.loads(log_file.filters or '[]')) == filters_hash
+    except (ValueError, re.error):
+        return False
+
+def refilter_log_file(log_file, filters_json):
+    # process a stored log file again with other filters (the caller commits
+    # and passes it to queue_jobs()): the output of a finished job is
+    # dropped and a new job queued, a queued job runs with the new filters,
+    # a running job is run again when it finishes (see JobQueue._run())
+    log_file.filters = filters_json
+    if log_file.status in (QUEUED, RUNNING):
+        return
+    delete_file_accesses(FileAccess.log_file_id == log_file.id)
+    FilteredFile.query.filter_by(log_file_id=log_file.id).delete(synchronize_session=False)
+    log_file.status = QUEUED
+    log_file.attempts = 0
+    log_file.error = None
+    touch_projects([log_file.project_id])
+
+def queue_jobs(log_files):
+    # trigger background processing of committed log files that need it
+    for log_file in log_files:
+        if log_file is not None and log_file.status == QUEUED:
+            job_queue.submit(log_file.id)
+
+def chunked_upload_dir():
+    return os.path.join(current_app.config['UPLOAD_DIRECTORY'], '.chunked')
+
+def log_file_info(log_file, deduplicated):
+    return {
+        'log_file_id': log_file.id,
+        'file_name': log_file.file_name,
+        'checksum': log_file.checksum,
+        'status': log_file.status,
+        'deduplicated': deduplicated,
+    }
+
+def log_file_response(log_file, deduplicated):
+    return jsonify(log_file_info(log_file, deduplicated))
+
+@app.route('/upload/<string:project_name>/chunked', methods=['POST'])
+def create_chunked_upload(project_name):
+    # start a chunked upload of a single log file: JSON with projectId,
+    # fileName, size, optional filters and optional checksum (SHA-256, of
+    # the uncompressed content for compressed logs); if a log file of the
+    # project has that checksum, nothing needs to be uploaded
+    data = request.json or {}
+    project_id = data.get('projectId')
+    if not project_id:
+        return jsonify({"error": "No project Id provided"}), 400
+    sec_file_name = secure_filename(data.get('fileName', ''))
+    if sec_file_name == '' or not allowed_log_file(sec_file_name):
+        return jsonify({'error': 'Filename empty or not allowed'}), 400
+    size = data.get('size')
+    if not isinstance(size, int) or size < 0:
+        return jsonify({'error': 'Invalid file size'}), 400
+    try:
+        filters = parse_filters(data.get('filters'))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filters: {e}'}), 400
+
+    if data.get('checksum'):
+        project, project_dir = get_or_create_project(project_name, project_id)
+        log_file, deduplicated = add_log_file(project, os.path.join(project_dir, sec_file_name), None, data['checksum'], filters)
+        if log_file is not None:
             db.session.commit()
+            queue_jobs([log_file])
+            return log_file_response(log_file, deduplicated), 200
+
+    upload = ChunkedUpload.create(chunked_upload_dir(), project_name=project_name, project_id=project_id,
+                                  file_name=sec_file_name, size=size, filters=filters)
+    return jsonify({'upload_id': upload.id, 'offset': 0, 'size': size}), 201
+
+@app.route('/upload/chunked/<string:upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    # current offset of an upload, an interrupted upload resumes from there
+    upload = ChunkedUpload.load(chunked_upload_dir(), upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({'upload_id': upload.id, 'offset': upload.offset, 'size': upload.size}), 200
+
+@app.route('/upload/chunked/<string:upload_id>', methods=['PATCH'])
+def upload_chunk(upload_id):
+    # append the request body at the offset given in the Upload-Offset header;
+    # the chunk completing the upload registers and processes the log file
+    upload = ChunkedUpload.load(chunked_upload_dir(), upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'No Upload-Offset header provided'}), 400
 
-            # trigger background processing
-            threading.Thread(target=background_processing, args=(log_file.id, filters)).start()
-
-    # TODO provide detailed status, e.g., some files may not have been uploaded
-    return jsonify({"message": "Files uploaded successfully"})
+    try:
+        offset = upload.write_chunk(offset, request.stream)
+    except UploadError as e:
+        return jsonify({'error': str(e), 'offset': upload.offset}), 409
+    if not upload.complete:
+        return jsonify({'upload_id': upload.id, 'offset': offset, 'size': upload.size}), 200
+
+    meta = upload.meta
+    project, project_dir = get_or_create_project(meta['project_name'], meta['project_id'])
+    raw_file_path = os.path.join(project_dir, meta['file_name'])
+    tmp_path = temporary_path(raw_file_path)
+    checksum = upload.checksum()
+    os.replace(upload.part_path, tmp_path)
+    upload.remove()
+    try:
+        checksum = finish_log_upload(tmp_path, meta['file_name'], checksum)
+    except CompressionError:
+        return jsonify({'error': f"{meta['file_name']} cannot be decompressed"}), 400
+    log_file, deduplicated = add_log_file(project, raw_file_path, tmp_path, checksum, meta['filters'])
+    db.session.commit()
+    queue_jobs([log_file])
+    return log_file_response(log_file, deduplicated), 201
+
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    # a job processes one uploaded log file, the job id is the id of the LogFile
+    log_file = LogFile.query.get(job_id)
+    if log_file is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    filtered_file = FilteredFile.query.filter_by(log_file_id=log_file.id).first()
+    status = log_file.status
+    if status is None:
+        # uploaded before jobs were tracked
+        status = 'done' if filtered_file else 'unknown'
+    return jsonify({
+        'id': log_file.id,
+        'project_id': log_file.project_id,
+        'file_name': log_file.file_name,
+        'status': status,
+        'attempts': log_file.attempts,
+        'error': log_file.error,
+        'filtered_file_id': filtered_file.id if filtered_file else None,
+    }), 200
 
 @app.route('/projects/<string:project_name>/rawlogfiles', methods=['GET'])
 def get_project_rawlogfiles(project_name):
-    project = Project.query.filter_by(name=project_name).first()
+    project = db.session.query(Project.id).filter_by(name=project_name).first()
     if not project:
         return jsonify({"error": "Project not found"}), 404
 
-    log_files = LogFile.query.filter_by(project_id=project.id).all()
+    query = db.session.query(LogFile.id, LogFile.file_name).filter_by(project_id=project.id)
+    log_files, next_cursor = paginate(query, LogFile.id)
 
     files_data = [{"id": file.id, "file_name": file.file_name} for file in log_files]
 
-    return jsonify({"project_name": project_name, "log_files": files_data})
+    return jsonify({"project_name": project_name, "log_files": files_data, "next_cursor": next_cursor})
 
 @app.route('/projects/<string:project_name>/processedlogfiles', methods=['GET'])
 def get_project_processed_logfiles(project_name):
-    project = Project.query.filter_by(name=project_name).first()
+    project = db.session.query(Project.id).filter_by(name=project_name).first()
     if not project:
         return jsonify({"error": "Project not found"}), 404
 
-    log_files = LogFile.query.filter_by(project_id=project.id).all()
+    query = db.session.query(LogFile.id, LogFile.file_name).filter_by(project_id=project.id)
+    log_files, next_cursor = paginate(query, LogFile.id)
 
     files_data = [{"id": file.id, "file_name": file.file_name} for file in log_files]
 
-    return jsonify({"project_name": project_name, "log_files": files_data})
+    return jsonify({"project_name": project_name, "log_files": files_data, "next_cursor": next_cursor})
 
 @app.route('/projects/<int:project_id>/<int:file_id>', methods=['DELETE'])
 def delete_log_file(project_id, file_id):
     #project = Project.query.get(project_id)
     #if project is None:
     #    return jsonify({'error': 'Project not found'}), 404
-    query = LogFile.query
-    query = query.filter(LogFile.project_id == project_id)
-    query = query.filter(LogFile.id == file_id)
-    log_files = query.all()
-
-    for file in log_files:
-      db.session.delete(file)
-      db.session.commit()
-      # unlink file.file_path
-      if os.path.isfile(file.file_path):
-        os.remove(file.file_path)
-
-    return jsonify({'message': 'Log file(s) deleted successfully'}), 200
+    _, paths = delete_log_file_rows(LogFile.project_id == project_id, LogFile.id == file_id)
+    # the files (raw, processed, sidecars) are removed in the background
+    operation = commit_and_reclaim(paths)
+    return jsonify({'message': 'Log file(s) deleted successfully', 'operation': operation.to_dict()}), 200
 
 # routes for table View
 @app.route('/views', methods=['GET'])
 def get_views():
-    views = View.query.all()
+    views = db.session.query(View.id, View.name).all()
     return jsonify([{'id': view.id, 'name': view.name} for view in views]), 200
 
 @app.route('/views', methods=['POST'])
@@ -320,9 +945,23 @@ def delete_view(view_id):
     view = View.query.get(view_id)
     if view is None:
         return jsonify({'error': 'View not found'}), 404
+    # the rows are deleted at once, their files are removed in the background
+    _, paths = delete_data_rows(Data.view_id == view_id)
     db.session.delete(view)
-    db.session.commit()
-    return jsonify({'message': 'View deleted successfully'}), 200
+    operation = commit_and_reclaim(paths, remove_directories=True)
+    return jsonify({'message': 'View deleted successfully', 'operation': operation.to_dict()}), 200
+
+@app.route('/views/<int:view_id>/files', methods=['DELETE'])
+def delete_data_files(view_id):
+    # delete many data files of a view: JSON with ids, a list of Data ids,
+    # see delete_log_files()
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not all(isinstance(file_id, int) for file_id in ids):
+        return jsonify({'error': 'No list of file ids provided'}), 400
+    count, paths = delete_data_rows(Data.view_id == view_id, Data.id.in_(ids))
+    operation = commit_and_reclaim(paths)
+    return jsonify({'deleted': count, 'operation': operation.to_dict()}), 202
 
 @app.route('/data/<string:view_name>', methods=['POST'])
 def upload_data(view_name):
@@ -346,78 +985,122 @@ def upload_data(view_name):
     os.makedirs(view_dir, exist_ok=True)
 
     files = request.files.getlist('files')
+    # files of rows that now point to a newly uploaded file elsewhere
+    replaced_paths = set()
     for file in files:
         if file.filename == '':
+            # keep the files saved so far
+            db.session.commit()
             return jsonify({'error': 'Filename empty or no selected file'}), 400
 
         sec_file_path = secure_filename(file.filename)
         if file:
-            # save file
+            # save file, hashing it while it is written (used as ETag for downloads);
+            # it is moved in place once its row is written, see commit_and_reclaim()
             file_path = os.path.join(view_dir, sec_file_path)
-            file.save(file_path)
-
-            #checksum = calculate_checksum(raw_file_path)
+            tmp_path = temporary_path(file_path)
+            checksum = save_stream(file.stream, tmp_path)
             #processed_time = datetime.datetime.now()
 
-            # save file info to database
-            data_file = Data(
-                view_id = view.id,
-                filepath = sec_file_path,
-                stored_path = file_path,
-                #checksum = checksum,
-                #processed_time = processed_time,
-            )
-            db.session.add(data_file)
-            db.session.commit()
+            # a file uploaded again under the same name replaces the content
+            # of its row, so downloads (and their ETag) follow the new file
+            data_file = Data.query.filter_by(view_id=view.id, filepath=sec_file_path).order_by(Data.id.desc()).first()
+            if data_file is not None:
+                if data_file.stored_path != file_path:
+                    replaced_paths.add(data_file.stored_path)
+                data_file.stored_path = file_path
+                data_file.checksum = checksum
+            else:
+                # save file info to database
+                data_file = Data(
+                    view_id = view.id,
+                    filepath = sec_file_path,
+                    stored_path = file_path,
+                    checksum = checksum,
+                    #processed_time = processed_time,
+                )
+                db.session.add(data_file)
+            db.session.flush()
+            os.replace(tmp_path, file_path)
+            hashing.service.remember(file_path, checksum)
 
             # trigger background processing
             #threading.Thread(target=background_processing, args=(log_file.id, filters)).start()
 
+    # one commit for all files of the upload
+    if replaced_paths:
+        commit_and_reclaim(replaced_paths)
+    else:
+        db.session.commit()
+
     # TODO provide detailed status, e.g., some files may not have been uploaded
     return jsonify({"message": "Files uploaded successfully"})
 
 @app.route('/views/<string:view_name>/files', methods=['GET'])
 def get_view_files(view_name):
-    view = View.query.filter_by(name=view_name).first()
+    view = db.session.query(View.id).filter_by(name=view_name).first()
     if not view:
         return jsonify({"error": "View not found"}), 404
 
-    files = Data.query.filter_by(view_id=view.id).all()
+    query = db.session.query(Data.id, Data.filepath).filter_by(view_id=view.id)
+    files, next_cursor = paginate(query, Data.id)
 
     files_data = [{"id": file.id, "filename": file.filepath} for file in files]
 
-    return jsonify({"view_name": view_name, "files": files_data})
+    return jsonify({"view_name": view_name, "files": files_data, "next_cursor": next_cursor})
 
 @app.route('/views/<int:view_id>/<int:file_id>', methods=['DELETE'])
 def delete_data_file(view_id, file_id):
-    query = Data.query
-    query = query.filter(Data.view_id == view_id)
-    query = query.filter(Data.id == file_id)
-    files = query.all()
-
-    for file in files:
-      db.session.delete(file)
-      db.session.commit()
-      # unlink file.file_path
-      if os.path.isfile(file.stored_path):
-        os.remove(file.stored_path)
-
-    return jsonify({'message': 'File(s) deleted successfully'}), 200
+    _, paths = delete_data_rows(Data.view_id == view_id, Data.id == file_id)
+    # the file is removed in the background
+    operation = commit_and_reclaim(paths)
+    return jsonify({'message': 'File(s) deleted successfully', 'operation': operation.to_dict()}), 200
+
+def accel_response(stored_path, download_name, checksum):
+    # let the front proxy send the file: X-Sendfile (Apache, lighttpd) gets
+    # the file system path, X-Accel-Redirect (nginx) the path below
+    # DOWNLOAD_ACCEL_PREFIX, an internal location mapped to DATA_DIRECTORY;
+    # the proxy also takes care of Range requests
+    response = current_app.response_class(mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream')
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    if checksum:
+        response.set_etag(checksum)
+    if current_app.config['DOWNLOAD_ACCEL'] == 'x-accel-redirect':
+        relative_path = os.path.relpath(stored_path, current_app.config['DATA_DIRECTORY'])
+        internal_path = f"{current_app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/')}/{relative_path}"
+        response.headers['X-Accel-Redirect'] = urllib.parse.quote(internal_path)
+    else:
+        response.headers['X-Sendfile'] = stored_path
+    return response
 
 #@cross_origin()  # This decorator allows CORS specifically for this route
 @app.route('/download/<string:view_name>/<string:file_name>', methods=['GET'])
 def download_file(view_name, file_name):
-    # Fetching the corresponding View entry
-    view_entry = View.query.filter_by(name=view_name).first()
-    if view_entry is None:
-        abort(404, description="View not found")
-
-    # Fetching the corresponding Data entry
-    data_entry = Data.query.filter_by(filepath=file_name, view_id=view_entry.id).first()
+    # Fetching the Data entry and its View in one query; the newest row
+    # wins if a file was stored more than once under the same name (before
+    # uploads replaced their row), its file is the one on disk
+    data_entry = db.session.query(Data.stored_path, Data.filepath, Data.checksum) \
+        .join(View, Data.view_id == View.id) \
+        .filter(View.name == view_name, Data.filepath == file_name) \
+        .order_by(Data.id.desc()).first()
     if data_entry is None:
+        if View.query.filter_by(name=view_name).first() is None:
+            abort(404, description="View not found")
         abort(404, description="File not found")
 
+    # the stored checksum is a strong ETag; files uploaded before checksums
+    # were stored get the default ETag of send_file (mtime, size, path)
+    if data_entry.checksum and request.if_none_match.contains(data_entry.checksum):
+        return '', 304, {'ETag': f'"{data_entry.checksum}"'}
+
     try:
-        return send_file(data_entry.stored_path, as_attachment=True)
+        if current_app.config['DOWNLOAD_ACCEL']:
+            if not os.path.isfile(data_entry.stored_path):
+                abort(404, description="File not found")
+            return accel_response(data_entry.stored_path, data_entry.filepath, data_entry.checksum)
+        # send_file answers Range (206/416), If-Range, If-None-Match and If-Modified-Since (304)
+        return send_file(data_entry.stored_path, as_attachment=True, conditional=True, etag=data_entry.checksum or True)
+    except HTTPException:
+        raise
     except Exception as e:
         abort(500, description=str(e))
@@ -0,0 +1,67 @@
+# server.py
+# production serving of the API (see 'run.py serve'), as an alternative to the
+# single-process Werkzeug development server used by 'run.py run'
+#  - gunicorn: pre-forked worker processes, each with a pool of threads
+#    (gthread worker) that keeps client connections alive
+#  - uvicorn: the Flask app wrapped as an ASGI app (app/asgi.py); the
+#    asyncio event loop handles the socket I/O of slow uploads and downloads
+#    and the views run in a bounded pool of threads per worker; request
+#    bodies are streamed to the views, not buffered
+# every worker process runs its own job workers (Config.JOB_WORKERS threads);
+# jobs are claimed in the database, so each job still runs only once
+import os
+
+from app import app, db
+from app.routes import job_queue
+
+def requeue_interrupted():
+    # requeue jobs of a previous run once, before the worker processes start;
+    # the pooled database connection used for it is closed, forked workers
+    # must open their own instead of sharing it
+    job_queue.requeue_interrupted()
+    with app.app_context():
+        db.engine.dispose()
+
+def serve_gunicorn(host, port, workers, threads, keepalive, timeout, certfile=None, keyfile=None):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit('gunicorn is not installed, run: pip install gunicorn')
+
+    class Server(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': f'{host}:{port}',
+                'workers': workers,
+                'threads': threads,
+                'worker_class': 'gthread',
+                'keepalive': keepalive,
+                'timeout': timeout,
+                'certfile': certfile,
+                'keyfile': keyfile,
+                # requeue jobs of a previous run once, in the master process
+                'on_starting': lambda server: requeue_interrupted(),
+                'post_worker_init': lambda worker: job_queue.run_queued(),
+            }
+            for key, value in options.items():
+                if value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Server().run()
+
+def serve_uvicorn(host, port, workers, threads, keepalive, certfile=None, keyfile=None):
+    try:
+        import uvicorn
+        import a2wsgi
+    except ImportError:
+        raise SystemExit('uvicorn/a2wsgi are not installed, run: pip install uvicorn a2wsgi')
+
+    # size of the thread pool the Flask views run in (read by app/asgi.py,
+    # also in the worker processes uvicorn starts)
+    os.environ['VDI_ASGI_THREADS'] = str(threads)
+    requeue_interrupted()
+    uvicorn.run('app.asgi:asgi_app', host=host, port=port, workers=workers,
+                timeout_keep_alive=keepalive, ssl_certfile=certfile, ssl_keyfile=keyfile)
@@ -0,0 +1,90 @@
+# strace.py
+# single-pass parser for the open calls in strace-style log lines
+# column layout: program name in column 8, syscall in column 12, path in
+# column 13 (open, open64, fopen, fopen64, freopen) or 14 (openat, fopenat)
+# followed by the flags (open*) or mode string (fopen*) in the next column
+import collections
+
+from app.compression import open_log
+
+# size hint for reading log files in blocks of lines
+BLOCK_SIZE = 4 * 1024 * 1024
+
+OPEN_CALLS = frozenset(('open', 'openat', 'open64', 'fopen', 'fopenat', 'fopen64', 'freopen'))
+# calls whose path is in column 14 because column 13 holds the directory fd
+AT_CALLS = frozenset(('openat', 'fopenat'))
+# calls with O_* flags, the others have an fopen mode string
+FLAG_CALLS = frozenset(('open', 'open64', 'openat'))
+
+PROGRAM_COL = 8
+SYSCALL_COL = 12
+
+# compact record of one open call; mode is 'read', 'write' or 'UNKNOWN'
+OpenCall = collections.namedtuple('OpenCall', ['syscall', 'program', 'path', 'mode'])
+# the same records in batch, one list per field
+OpenCallColumns = collections.namedtuple('OpenCallColumns', ['syscall', 'program', 'path', 'mode'])
+
+def split_columns(line):
+    # same columns as re.split(r'\s+', line): leading/trailing whitespace
+    # yields an empty first/last column
+    row = line.split()
+    if line[:1].isspace():
+        row.insert(0, '')
+    if line[-1:].isspace():
+        row.append('')
+    return row
+
+def access_mode(syscall, raw_access_mode):
+    if syscall in FLAG_CALLS:
+        # O_RDWR -> 'write', O_RDONLY -> 'read'
+        if 'O_RDWR' in raw_access_mode:
+            return 'write'
+        if 'O_RDONLY' in raw_access_mode:
+            return 'read'
+    else:
+        # fopen mode containing 'w' -> 'write', 'r' -> 'read'
+        if 'w' in raw_access_mode:
+            return 'write'
+        if 'r' in raw_access_mode:
+            return 'read'
+    return 'UNKNOWN'
+
+def parse_row(row):
+    # OpenCall for a line split into columns, None if it is not an open call
+    # or too short to hold the path and the access mode
+    if len(row) <= SYSCALL_COL:
+        return None
+    syscall = row[SYSCALL_COL]
+    if syscall not in OPEN_CALLS:
+        return None
+    path_col = SYSCALL_COL + 2 if syscall in AT_CALLS else SYSCALL_COL + 1
+    if len(row) <= path_col + 1:
+        return None
+    return OpenCall(syscall, row[PROGRAM_COL], row[path_col], access_mode(syscall, row[path_col + 1]))
+
+def parse_line(line):
+    # decode (if given bytes) and tokenize a line once, return an OpenCall or None
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    return parse_row(split_columns(line))
+
+def iter_open_calls(file_path):
+    # OpenCall records of all open calls in a (possibly compressed) log file,
+    # in file order
+    with open_log(file_path) as file:
+        while True:
+            lines = file.readlines(BLOCK_SIZE)
+            if not lines:
+                break
+            for line in lines:
+                call = parse_row(split_columns(line.decode('utf-8')))
+                if call is not None:
+                    yield call
+
+def parse_file(file_path):
+    # parse all open calls of a log file into OpenCallColumns
+    columns = OpenCallColumns([], [], [], [])
+    for call in iter_open_calls(file_path):
+        for column, value in zip(columns, call):
+            column.append(value)
+    return columns
@@ -0,0 +1,165 @@
+# uploads.py
+# streaming storage of uploaded files and resumable chunked uploads
+#
+# a chunked upload is created with its final size, then its content is sent
+# in one or more PATCH requests, each starting at the current offset of the
+# upload; an interrupted upload is resumed by asking for the offset and
+# sending the rest; the SHA-256 of the content is updated as chunks arrive
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+from app.compression import open_writer
+from app.processing import temporary_path
+
+# size of the blocks uploaded data is copied and hashed in
+CHUNK_SIZE = 1024 * 1024
+
+def copy_stream(stream, file, hasher, limit=None):
+    # copy up to limit bytes (everything if None) from stream to file while
+    # updating hasher, return the number of bytes copied
+    copied = 0
+    while limit is None or copied < limit:
+        block = stream.read(CHUNK_SIZE if limit is None else min(CHUNK_SIZE, limit - copied))
+        if not block:
+            break
+        hasher.update(block)
+        file.write(block)
+        copied += len(block)
+    return copied
+
+def save_stream(stream, file_path, compression=None, compression_level=None):
+    # write stream to file_path in chunks, compressed with compression (see
+    # app/compression.py) if given; return the SHA-256 of the content as read
+    # from stream
+    hasher = hashlib.sha256()
+    tmp_path = temporary_path(file_path)
+    try:
+        with open_writer(tmp_path, compression, compression_level) as file:
+            copy_stream(stream, file, hasher)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return hasher.hexdigest()
+
+def link_file(src_path, dst_path):
+    # hardlink src_path to dst_path (replacing dst_path), return False if the
+    # file system does not support it, e.g., across devices
+    if os.path.exists(dst_path) and os.path.samefile(src_path, dst_path):
+        return True
+    tmp_path = temporary_path(dst_path)
+    try:
+        os.link(src_path, tmp_path)
+    except OSError:
+        return False
+    os.replace(tmp_path, dst_path)
+    return True
+
+class UploadError(Exception):
+    pass
+
+# hashers of chunked uploads by upload id, together with the offset they
+# have seen; after a restart the hasher is rebuilt from the partial file
+_hashers = {}
+_locks = {}
+_hashers_lock = threading.Lock()
+
+class ChunkedUpload:
+    # a chunked upload is stored as <upload dir>/<id>.json (metadata) and
+    # <upload dir>/<id>.part (content received so far)
+    def __init__(self, upload_dir, upload_id, meta):
+        self.upload_dir = upload_dir
+        self.id = upload_id
+        self.meta = meta
+
+    @classmethod
+    def create(cls, upload_dir, **meta):
+        os.makedirs(upload_dir, exist_ok=True)
+        upload = cls(upload_dir, uuid.uuid4().hex, meta)
+        with open(upload.meta_path, 'w') as file:
+            json.dump(meta, file)
+        open(upload.part_path, 'xb').close()
+        return upload
+
+    @classmethod
+    def load(cls, upload_dir, upload_id):
+        # None if there is no such upload
+        if not upload_id.isalnum():
+            return None
+        try:
+            with open(os.path.join(upload_dir, f'{upload_id}.json')) as file:
+                meta = json.load(file)
+        except FileNotFoundError:
+            return None
+        return cls(upload_dir, upload_id, meta)
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.upload_dir, f'{self.id}.json')
+
+    @property
+    def part_path(self):
+        return os.path.join(self.upload_dir, f'{self.id}.part')
+
+    @property
+    def size(self):
+        return self.meta['size']
+
+    @property
+    def offset(self):
+        return os.path.getsize(self.part_path)
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+    def _lock(self):
+        with _hashers_lock:
+            return _locks.setdefault(self.id, threading.Lock())
+
+    def _hasher(self, offset):
+        # hasher over the first offset bytes of the partial file
+        offset_seen, hasher = _hashers.get(self.id, (None, None))
+        if offset_seen != offset:
+            hasher = hashlib.sha256()
+            with open(self.part_path, 'rb') as file:
+                while True:
+                    block = file.read(CHUNK_SIZE)
+                    if not block:
+                        break
+                    hasher.update(block)
+        return hasher
+
+    def write_chunk(self, offset, stream):
+        # append the data of stream at offset, which must be the current
+        # offset of the upload; return the new offset
+        with self._lock():
+            current = self.offset
+            if offset != current:
+                raise UploadError(f'chunk starts at offset {offset}, upload is at offset {current}')
+            hasher = self._hasher(current)
+            with open(self.part_path, 'ab') as file:
+                try:
+                    current += copy_stream(stream, file, hasher, self.size - current)
+                finally:
+                    # keep what was received, a retry resumes from there
+                    file.flush()
+                    current = file.tell()
+            _hashers[self.id] = (current, hasher)
+            return current
+
+    def checksum(self):
+        with self._lock():
+            return self._hasher(self.offset).hexdigest()
+
+    def remove(self):
+        for path in (self.meta_path, self.part_path):
+            if os.path.exists(path):
+                os.remove(path)
+        with _hashers_lock:
+            _hashers.pop(self.id, None)
+            _locks.pop(self.id, None)
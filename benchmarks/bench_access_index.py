@@ -0,0 +1,92 @@
+# bench_access_index.py
+# timings of the file-access endpoints (/projects/<id>/files and
+# /projects/<id>/programs/<name>) through the Flask test client on a
+# temporary database with one project of many logs, next to their parts:
+# validating the cached index by its change counter (project_version())
+# versus by reading the logs of the project (project_logs() and
+# extract_missing(), what every lookup did before), and the in-memory lookup
+#   python -m benchmarks.bench_access_index --logs 10000
+import argparse
+import atexit
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import config
+
+# the app reads its configuration when it is imported, see benchmarks/suite.py
+TMP_DIR = tempfile.mkdtemp(prefix='vdi-bench-')
+atexit.register(shutil.rmtree, TMP_DIR, ignore_errors=True)
+config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(TMP_DIR, 'vdi.db')
+config.Config.UPLOAD_DIRECTORY = os.path.join(TMP_DIR, 'uploads')
+config.Config.DATA_DIRECTORY = os.path.join(TMP_DIR, 'data')
+config.Config.LOG_LEVEL = 'WARNING'
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import app, db, access_index  # noqa: E402
+from app.dataflow import extract_missing, project_logs, project_version  # noqa: E402
+from app.models import FileAccess, FilteredFile, LogFile, Project  # noqa: E402
+from benchmarks.strace_gen import PATH_PREFIXES, programs  # noqa: E402
+
+def timed(name, func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f'  {name:<52} {elapsed * 1000:10.3f} ms')
+    return result
+
+def populate(logs, accesses, num_paths, seed):
+    # one project with logs processed logs of accesses distinct triples each
+    rnd = random.Random(seed)
+    names = programs()
+    paths = [f'{rnd.choice(PATH_PREFIXES)}/dir{index // 100}/file{index}' for index in range(num_paths)]
+    with db.engine.begin() as connection:
+        connection.execute(insert(Project), [{'id': 1, 'name': 'bench', 'logs_version': 0}])
+        connection.execute(insert(LogFile), [
+            {'id': i, 'project_id': 1, 'file_name': f'log{i}.log', 'file_path': f'/raw_logs/log{i}.log', 'status': 'done'}
+            for i in range(1, logs + 1)])
+        connection.execute(insert(FilteredFile), [
+            {'id': i, 'log_file_id': i, 'filtered_file_name': f'log{i}.log', 'filtered_file_path': f'/processed_logs/log{i}.log',
+             'num_accesses': accesses}
+            for i in range(1, logs + 1)])
+        for start in range(1, logs + 1, 1000):
+            rows = []
+            for log_file_id in range(start, min(start + 1000, logs + 1)):
+                triples = {(rnd.choice(names), rnd.choice(paths), rnd.choice(('read', 'write'))) for _ in range(accesses)}
+                rows.extend({'log_file_id': log_file_id, 'seq': seq, 'program': program, 'path': path, 'mode': mode}
+                            for seq, (program, path, mode) in enumerate(triples))
+            connection.execute(insert(FileAccess), rows)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the file-access endpoints.')
+    parser.add_argument('--logs', type=int, default=10000, help='Logs of the project')
+    parser.add_argument('--accesses', type=int, default=20, help='Distinct accesses per log')
+    parser.add_argument('--num-paths', type=int, default=100000, help='Distinct file paths')
+    parser.add_argument('--repeat', type=int, default=100, help='Requests per timing')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the generator')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        populate(args.logs, args.accesses, args.num_paths, args.seed)
+    print(f'1 project, {args.logs} logs, {args.logs * args.accesses} accesses')
+    client = app.test_client()
+    prefix = f'{PATH_PREFIXES[1]}/dir1'
+    files_url = f'/projects/1/files?prefix={prefix}&limit=100'
+    program_url = f'/projects/1/programs/{programs()[0]}?mode=write'
+
+    timed('first request (builds the index)', lambda: client.get(files_url))
+    timed('GET /projects/1/files (prefix, 100 entries)', lambda: client.get(files_url), args.repeat)
+    response = timed('GET /projects/1/programs/<name>?mode=write', lambda: client.get(program_url), args.repeat)
+    print(f'    {len(response.get_json()["files"])} entries returned')
+    with app.app_context():
+        timed('  validation by change counter', lambda: project_version(1), args.repeat)
+        timed('  validation by reading the logs (before)', lambda: extract_missing(project_logs(1)), args.repeat)
+        timed('  index lookup (prefix, 100 entries)', lambda: access_index.lookup_files(1, prefix, None, 100), args.repeat)
+
+if __name__ == '__main__':
+    main()
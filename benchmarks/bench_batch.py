@@ -0,0 +1,74 @@
+# bench_batch.py
+# compares line-by-line and column-wise (NumPy) filter evaluation in
+# process_file, for the small filter list of bench_filters and for larger
+# lists excluding path prefixes per open call (and program), as used to
+# drop system files
+#   python -m benchmarks.bench_batch --lines 1000000 --num-paths 100
+import argparse
+import os
+import tempfile
+import time
+
+from app import processing
+from app.processing import process_file
+from benchmarks.bench_filters import FILTERS
+from benchmarks.strace_gen import PATH_PREFIXES, PROGRAMS, write_log
+
+def prefix_filters(dirs_per_prefix, programs=(None,)):
+    # one filter per open call and path prefix (and program, if given), the
+    # path is in column 13 (open, open64, fopen, fopen64, freopen) or 14
+    # (openat, fopenat)
+    filters = []
+    for program in programs:
+        program_filter = f'8@@@^{program}$@@@' if program else ''
+        for prefix in PATH_PREFIXES[:2]:
+            for index in range(dirs_per_prefix):
+                path = f'^{prefix}/dir{index}/'.replace('.', '\\.')
+                for syscall in ('open', 'open64', 'fopen', 'fopen64', 'freopen'):
+                    filters.append(f'{program_filter}12@@@^{syscall}$@@@13@@@{path}')
+                for syscall in ('openat', 'fopenat'):
+                    filters.append(f'{program_filter}12@@@^{syscall}$@@@14@@@{path}')
+    return FILTERS + filters
+
+def run(raw_path, filters, batch):
+    # process_file with column-wise evaluation forced on or off
+    saved = processing.BATCH_MIN_CONDITIONS
+    processing.BATCH_MIN_CONDITIONS = 0 if batch else float('inf')
+    try:
+        start = time.perf_counter()
+        _, checksum = process_file(raw_path, filters)
+        return time.perf_counter() - start, checksum
+    finally:
+        processing.BATCH_MIN_CONDITIONS = saved
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark line-by-line vs. column-wise filtering.')
+    parser.add_argument('--lines', type=int, default=1000000, help='Number of synthetic log lines')
+    parser.add_argument('--num-paths', type=int, default=100, help='Number of distinct file names per directory')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the log generator')
+    args = parser.parse_args()
+    if processing.numpy is None:
+        raise SystemExit('column-wise filtering needs NumPy')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = os.path.join(tmp_dir, 'raw_logs')
+        os.makedirs(raw_dir)
+        raw_path = write_log(os.path.join(raw_dir, 'bench.log'), args.lines, seed=args.seed, num_paths=args.num_paths)
+        size_mb = os.path.getsize(raw_path) / (1024 * 1024)
+        print(f'log: {args.lines} lines, {size_mb:.1f} MiB')
+
+        for dirs_per_prefix, programs in ((0, (None,)), (8, (None,)), (32, (None,)), (8, PROGRAMS[:4]), (8, PROGRAMS)):
+            filters = prefix_filters(dirs_per_prefix, programs)
+            plan = processing.compile_filters(filters)
+            conditions = len(plan.alternatives) + sum(map(len, plan.conjunctions))
+            line_time, line_checksum = run(raw_path, filters, batch=False)
+            batch_time, batch_checksum = run(raw_path, filters, batch=True)
+            if batch_checksum != line_checksum:
+                raise SystemExit(f'column-wise output differs for {len(filters)} filters')
+            print(f'filters={len(filters):<4} conditions={conditions:<4} '
+                  f'line {line_time:7.3f}s {size_mb / line_time:7.1f} MiB/s  '
+                  f'batch {batch_time:7.3f}s {size_mb / batch_time:7.1f} MiB/s  '
+                  f'speedup={line_time / batch_time:5.2f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# bench_filters.py
+# compares the compiled filter plan (processing.compile_filters) with the
+# original per-line implementation of match_filters
+#   python -m benchmarks.bench_filters --lines 200000
+import argparse
+import re
+import time
+
+from app.processing import compile_filters, match_filters
+from benchmarks.strace_gen import generate_lines
+
+FILTERS = [
+    '12@@@^(read|write|close|mmap|fstat|stat|lseek)$',
+    '12@@@^open$@@@13@@@^/(proc|etc)/',
+    '12@@@^openat$@@@14@@@^/(proc|etc)/',
+    '12@@@^openat$@@@14@@@^/cvmfs/software\\.eessi\\.io',
+    '8@@@^git$',
+]
+
+def legacy_match_filters(string, filters):
+    # match_filters as it was before filters were compiled into a FilterPlan
+    row = re.split(r'\s+', string.strip())
+    for filter_items in filters:
+        filters_splitted = filter_items.split('@@@')
+        cols = filters_splitted[::2]
+        regexs = filters_splitted[1::2]
+        matches = 0
+        for ridx in range(len(regexs)):
+            if re.search(regexs[ridx], row[int(cols[ridx])]):
+                matches = matches + 1
+        if (matches == len(regexs)):
+            return True
+    return False
+
+def run(name, func, lines, filters):
+    start = time.perf_counter()
+    kept = sum(1 for line in lines if not func(line, filters))
+    elapsed = time.perf_counter() - start
+    print(f'{name:<24} {elapsed:8.3f}s {len(lines) / elapsed:12.0f} lines/s  kept={kept}')
+    return kept
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark match_filters implementations.')
+    parser.add_argument('--lines', type=int, default=200000, help='Number of synthetic log lines')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the log generator')
+    args = parser.parse_args()
+
+    lines = generate_lines(args.lines, seed=args.seed)
+    plan = compile_filters(FILTERS)
+    expected = run('legacy match_filters', legacy_match_filters, lines, FILTERS)
+    results = [
+        run('match_filters', match_filters, lines, FILTERS),
+        run('FilterPlan.match', lambda line, _: plan.match(line), lines, None),
+    ]
+    if any(kept != expected for kept in results):
+        raise SystemExit('compiled filters disagree with legacy match_filters')
+
+if __name__ == '__main__':
+    main()
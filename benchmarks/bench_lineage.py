@@ -0,0 +1,102 @@
+# bench_lineage.py
+# timings of the lineage index (app/lineage.py) on a synthetic project with
+# a given number of read/write edges: building the index, uncached queries
+# (a breadth-first search over the reached part of the graph) and cached
+# queries, upstream and downstream, for files and programs; before timing,
+# the results are checked against a plain set-based search over the edges
+#   python -m benchmarks.bench_lineage --edges 1000000
+import argparse
+import random
+import time
+
+from app.lineage import ALL, DOWNSTREAM, UPSTREAM, LineageIndex
+from benchmarks.strace_gen import PATH_PREFIXES, programs
+
+def generate_accesses(num_edges, num_logs, num_files, num_programs, write_ratio, seed):
+    # {log_file_id: [(program, path, mode)]} with num_edges distinct triples
+    # in total; every program reads and writes random files of the project,
+    # so the lineage of a file usually reaches most of the graph (worst case)
+    rnd = random.Random(seed)
+    names = programs(num_programs)
+    paths = [f'{rnd.choice(PATH_PREFIXES)}/dir{index // 100}/file{index}' for index in range(num_files)]
+    logs = {}
+    per_log = num_edges // num_logs
+    for log_file_id in range(1, num_logs + 1):
+        accesses = {}
+        while len(accesses) < per_log:
+            mode = 'write' if rnd.random() < write_ratio else 'read'
+            accesses.setdefault((rnd.choice(names), rnd.choice(paths), mode), None)
+        logs[log_file_id] = list(accesses)
+    return logs
+
+def reference(logs, path, direction):
+    # nodes reached from a file by a set-based search over the edge list
+    edges = set()
+    for log_file_id, accesses in logs.items():
+        for program, file_path, mode in accesses:
+            node = ('program', log_file_id, program)
+            edges.add((('file', file_path), node) if mode == 'read' else (node, ('file', file_path)))
+    if direction == UPSTREAM:
+        edges = {(target, source) for source, target in edges}
+    adjacency = {}
+    for source, target in edges:
+        adjacency.setdefault(source, []).append(target)
+    start = ('file', path)
+    seen = {start}
+    frontier = [start]
+    while frontier:
+        frontier = [other for node in frontier for other in adjacency.get(node, ()) if other not in seen and not seen.add(other)]
+    seen.discard(start)
+    return seen
+
+def check(index, logs, path):
+    for direction in (UPSTREAM, DOWNSTREAM):
+        reach = index.reach(index.start_nodes(path=path), direction)
+        nodes, _ = reach.select(index, ALL)
+        found = {('file', index.paths[node]) if index.programs[node] is None else ('program',) + index.programs[node]
+                 for node in nodes}
+        if found != reference(logs, path, direction):
+            raise SystemExit(f'{direction} lineage of {path} differs from the reference')
+
+def timed(name, func, count=1):
+    # time of func() per item, if it handles count items
+    start = time.perf_counter()
+    result = func()
+    elapsed = (time.perf_counter() - start) / count
+    print(f'  {name:<52} {elapsed * 1000:10.2f} ms')
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark lineage queries.')
+    parser.add_argument('--edges', type=int, default=1000000, help='Read/write edges of the project')
+    parser.add_argument('--logs', type=int, default=100, help='Logs of the project')
+    parser.add_argument('--files', type=int, default=200000, help='Distinct files')
+    parser.add_argument('--programs', type=int, default=50, help='Distinct program names')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of write accesses')
+    parser.add_argument('--queries', type=int, default=10, help='Files queried per direction')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the generator')
+    args = parser.parse_args()
+
+    logs = generate_accesses(args.edges, args.logs, args.files, args.programs, args.write_ratio, args.seed)
+    index = LineageIndex()
+    def build():
+        for log_file_id, accesses in logs.items():
+            index.add_log(log_file_id, accesses)
+    timed('build index', build)
+    print(f'{len(index.paths)} nodes, {index.num_edges} edges')
+    rnd = random.Random(args.seed)
+    paths = rnd.sample(sorted(index.files), args.queries)
+    check(index, logs, paths[0])
+
+    name = programs(args.programs)[0]
+    for direction in (UPSTREAM, DOWNSTREAM):
+        # the first run of each file computes its lineage, the others are cached
+        reaches = timed(f'{direction} of a file, uncached', lambda: [index.query(direction, path=path) for path in paths],
+                        count=len(paths))
+        print(f'    {sum(len(reach.nodes) for reach in reaches) / len(reaches):.0f} nodes reached on average')
+        timed(f'{direction} of a file, cached', lambda: [index.query(direction, path=path) for path in paths],
+              count=len(paths))
+        timed(f'{direction} of program {name} (all logs), uncached', lambda: index.query(direction, program=name))
+
+if __name__ == '__main__':
+    main()
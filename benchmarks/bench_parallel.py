@@ -0,0 +1,40 @@
+# bench_parallel.py
+# measures how process_file scales with the number of worker processes
+#   python -m benchmarks.bench_parallel --lines 2000000 --max-workers 8
+import argparse
+import os
+import tempfile
+import time
+
+from app.processing import process_file
+from benchmarks.bench_filters import FILTERS
+from benchmarks.strace_gen import write_log
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark serial vs. parallel process_file.')
+    parser.add_argument('--lines', type=int, default=2000000, help='Number of synthetic log lines')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count(), help='Highest number of workers to try')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the log generator')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = os.path.join(tmp_dir, 'raw_logs')
+        os.makedirs(raw_dir)
+        raw_path = write_log(os.path.join(raw_dir, 'bench.log'), args.lines, seed=args.seed)
+        size_mb = os.path.getsize(raw_path) / (1024 * 1024)
+        print(f'log: {args.lines} lines, {size_mb:.1f} MiB')
+
+        baseline = None
+        serial_time = None
+        for workers in range(1, args.max_workers + 1):
+            start = time.perf_counter()
+            _, checksum = process_file(raw_path, FILTERS, workers=workers, min_parallel_size=0)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline, serial_time = checksum, elapsed
+            elif checksum != baseline:
+                raise SystemExit(f'output with {workers} workers differs from the serial output')
+            print(f'workers={workers:<3} {elapsed:8.3f}s {size_mb / elapsed:8.1f} MiB/s  speedup={serial_time / elapsed:5.2f}x')
+
+if __name__ == '__main__':
+    main()
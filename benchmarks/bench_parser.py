@@ -0,0 +1,90 @@
+# bench_parser.py
+# compares the single-pass parser (app/strace.py) with the per-field helpers
+# it replaced; before timing, both are checked against each other on the
+# synthetic log (the golden sample lines are in tests/test_strace.py)
+#   python -m benchmarks.bench_parser --lines 200000
+import argparse
+import re
+import time
+
+from app.strace import OpenCall, parse_line
+from benchmarks.strace_gen import generate_lines
+
+# helpers as they were used by get_dataflow before app/strace.py
+def is_open_call(line):
+    decoded_line = line.decode('utf-8')
+    row = re.split(r'\s+', decoded_line)
+    if re.search('^(open|openat|open64|fopen|fopenat|fopen64|freopen)$', row[12]):
+        return True
+    return False
+
+def get_program_name(line):
+    decoded_line = line.decode('utf-8')
+    row = re.split(r'\s+', decoded_line)
+    return row[8]
+
+def get_file_name(line):
+    decoded_line = line.decode('utf-8')
+    row = re.split(r'\s+', decoded_line)
+    if re.search('^(open|open64|fopen|fopen64|freopen)$', row[12]):
+        return row[13]
+    if re.search('^(openat|fopenat)$', row[12]):
+        return row[14]
+    else:
+        return 'NONE'
+
+def get_access_mode(line):
+    decoded_line = line.decode('utf-8')
+    row = re.split(r'\s+', decoded_line)
+    if re.search('^(open|open64|fopen|fopen64|freopen)$', row[12]):
+        raw_access_mode = row[14]
+    elif re.search('^(openat|fopenat)$', row[12]):
+        raw_access_mode = row[15]
+    else:
+        return 'UNKNOWN'
+    if re.search('^(open|open64|openat)$', row[12]):
+        if 'O_RDWR' in raw_access_mode:
+            return 'write'
+        if 'O_RDONLY' in raw_access_mode:
+            return 'read'
+    elif re.search('^(fopen|fopen64|fopenat|freopen)$', row[12]):
+        if 'w' in raw_access_mode:
+            return 'write'
+        if 'r' in raw_access_mode:
+            return 'read'
+    return 'UNKNOWN'
+
+def legacy_parse_line(line):
+    # the four helpers combined; lines too short for them are not open calls
+    try:
+        if not is_open_call(line):
+            return None
+        mode = get_access_mode(line)
+        return OpenCall(re.split(r'\s+', line.decode('utf-8'))[12], get_program_name(line), get_file_name(line), mode)
+    except IndexError:
+        return None
+
+def check(lines):
+    for line in lines:
+        if parse_line(line) != legacy_parse_line(line):
+            raise SystemExit(f'parse_line and the legacy helpers disagree on {line!r}')
+
+def run(name, func, lines):
+    start = time.perf_counter()
+    calls = sum(1 for line in lines if func(line) is not None)
+    elapsed = time.perf_counter() - start
+    print(f'{name:<24} {elapsed:8.3f}s {len(lines) / elapsed:12.0f} lines/s  open calls={calls}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark strace line parsing.')
+    parser.add_argument('--lines', type=int, default=200000, help='Number of synthetic log lines')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the log generator')
+    args = parser.parse_args()
+
+    lines = [line.encode('utf-8') for line in generate_lines(args.lines, seed=args.seed)]
+    check(lines)
+    run('legacy helpers', legacy_parse_line, lines)
+    run('strace.parse_line', parse_line, lines)
+
+if __name__ == '__main__':
+    main()
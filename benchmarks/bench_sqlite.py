@@ -0,0 +1,105 @@
+# bench_sqlite.py
+# before/after timings of the SQLite performance settings: the database as
+# created before (no secondary indexes, default journal, one commit per
+# file) versus the current models (indexes) with Config.SQLITE_PRAGMAS (WAL)
+# and one commit per upload batch
+#   python -m benchmarks.bench_sqlite --projects 10 --logs 10000
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, select, text
+
+from app import app, db
+from app.models import Project, LogFile, FilteredFile, View, Data
+
+def timed(name, func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f'  {name:<44} {elapsed * 1000:10.2f} ms')
+    return result
+
+def populate(engine, projects, logs, views, files):
+    with engine.begin() as connection:
+        connection.execute(insert(Project), [{'id': p, 'name': f'project{p}'} for p in range(1, projects + 1)])
+        connection.execute(insert(LogFile), [
+            {'id': i, 'project_id': (i - 1) // logs + 1, 'file_name': f'log{i}.log', 'file_path': f'/raw_logs/log{i}.log', 'checksum': f'{i:064x}'}
+            for i in range(1, projects * logs + 1)])
+        connection.execute(insert(FilteredFile), [
+            {'log_file_id': i, 'filtered_file_name': f'log{i}.log', 'filtered_file_path': f'/processed_logs/log{i}.log'}
+            for i in range(1, projects * logs + 1)])
+        connection.execute(insert(View), [{'id': v, 'name': f'view{v}'} for v in range(1, views + 1)])
+        connection.execute(insert(Data), [
+            {'view_id': (i - 1) // files + 1, 'filepath': f'file{i}.dat', 'stored_path': f'/data/file{i}.dat'}
+            for i in range(1, views * files + 1)])
+
+def run_queries(engine, projects, logs, views, files):
+    project_id = projects // 2 + 1
+    log_ids = list(range((project_id - 1) * logs + 1, project_id * logs + 1))
+    with engine.connect() as connection:
+        timed('log files of a project', lambda: connection.execute(
+            select(LogFile.id, LogFile.file_name).where(LogFile.project_id == project_id)).all(), repeat=5)
+        timed('filtered file per log (N+1, 1000 logs)', lambda: [connection.execute(
+            select(FilteredFile.id).where(FilteredFile.log_file_id == log_id)).first() for log_id in log_ids[:1000]])
+        timed('logs joined with filtered files', lambda: connection.execute(
+            select(LogFile.id, FilteredFile.id).outerjoin(FilteredFile, FilteredFile.log_file_id == LogFile.id)
+            .where(LogFile.project_id == project_id)).all(), repeat=5)
+        timed('log file by checksum (dedup)', lambda: connection.execute(
+            select(LogFile.id).where(LogFile.checksum == f'{log_ids[-1]:064x}')).all(), repeat=20)
+        timed('files of a view', lambda: connection.execute(
+            select(Data.id, Data.filepath).where(Data.view_id == views // 2 + 1)).all(), repeat=20)
+        timed('download lookup (view name + filepath)', lambda: connection.execute(
+            select(Data.stored_path).join(View, Data.view_id == View.id)
+            .where(View.name == f'view{views // 2 + 1}', Data.filepath == f'file{(views // 2) * files + 1}.dat')).first(), repeat=20)
+
+def run_inserts(engine, batch, per_file_commit):
+    rows = [{'project_id': 1, 'file_name': f'new{i}.log', 'file_path': f'/raw_logs/new{i}.log'} for i in range(batch)]
+    def insert_rows():
+        if per_file_commit:
+            for row in rows:
+                with engine.begin() as connection:
+                    connection.execute(insert(LogFile), [row])
+        else:
+            with engine.begin() as connection:
+                connection.execute(insert(LogFile), rows)
+    timed(f'upload of {batch} files ({"commit per file" if per_file_commit else "one commit"})', insert_rows)
+
+def benchmark(name, path, pragmas, indexes, per_file_commit, args):
+    print(name)
+    app.config['SQLITE_PRAGMAS'] = pragmas
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    if not indexes:
+        with engine.begin() as connection:
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    connection.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+    populate(engine, args.projects, args.logs, args.views, args.files)
+    with engine.begin() as connection:
+        connection.execute(text('ANALYZE'))
+    run_queries(engine, args.projects, args.logs, args.views, args.files)
+    run_inserts(engine, args.batch, per_file_commit)
+    engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SQLite settings.')
+    parser.add_argument('--projects', type=int, default=10, help='Number of projects')
+    parser.add_argument('--logs', type=int, default=10000, help='Log files per project')
+    parser.add_argument('--views', type=int, default=100, help='Number of views')
+    parser.add_argument('--files', type=int, default=1000, help='Data files per view')
+    parser.add_argument('--batch', type=int, default=500, help='Files per simulated upload')
+    args = parser.parse_args()
+
+    pragmas = app.config['SQLITE_PRAGMAS']
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        benchmark('before: no indexes, default journal, commit per file',
+                  os.path.join(tmp_dir, 'before.db'), [], False, True, args)
+        benchmark('after: indexes, ' + ', '.join(pragmas) + ', one commit per upload',
+                  os.path.join(tmp_dir, 'after.db'), pragmas, True, False, args)
+    app.config['SQLITE_PRAGMAS'] = pragmas
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# load_test.py
+# simple HTTP load generator reporting requests/sec and latency percentiles,
+# used to compare the development server ('run.py run') with the production
+# servers ('run.py serve --server gunicorn|uvicorn'), e.g.
+#   python -m benchmarks.load_test https://127.0.0.1:5575 --insecure \
+#       --path /projects --path /dataflow/1 --concurrency 32 --duration 30
+import argparse
+import http.client
+import ssl
+import threading
+import time
+import urllib.parse
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+class Client(threading.Thread):
+    # sends requests over one keep-alive connection until the deadline
+    def __init__(self, url, paths, deadline, ssl_context, upload):
+        super().__init__(daemon=True)
+        self.url = url
+        self.paths = paths
+        self.deadline = deadline
+        self.ssl_context = ssl_context
+        self.upload = upload
+        self.latencies = []
+        self.errors = 0
+
+    def connect(self):
+        if self.url.scheme == 'https':
+            return http.client.HTTPSConnection(self.url.netloc, context=self.ssl_context, timeout=60)
+        return http.client.HTTPConnection(self.url.netloc, timeout=60)
+
+    def run(self):
+        connection = self.connect()
+        index = 0
+        while time.perf_counter() < self.deadline:
+            path = self.paths[index % len(self.paths)]
+            index += 1
+            start = time.perf_counter()
+            try:
+                if self.upload is not None and path.startswith('/upload/'):
+                    connection.request('POST', path, body=self.upload[1], headers={'Content-Type': self.upload[0]})
+                else:
+                    connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    self.errors += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                connection.close()
+                connection = self.connect()
+                continue
+            self.latencies.append(time.perf_counter() - start)
+        connection.close()
+
+def multipart_upload(project_id, file_name, num_lines):
+    # multipart body for POST /upload/<project> with one synthetic log file
+    from benchmarks.strace_gen import generate_lines
+    boundary = 'vdi-load-test-boundary'
+    content = ''.join(generate_lines(num_lines)).encode('utf-8')
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="projectId"\r\n\r\n{project_id}\r\n'
+        f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{file_name}"\r\n'
+        f'Content-Type: text/plain\r\n\r\n'
+    ).encode('utf-8') + content + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return f'multipart/form-data; boundary={boundary}', body
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the VDI API server.')
+    parser.add_argument('url', help='Base URL of the server, e.g. https://127.0.0.1:5575')
+    parser.add_argument('--path', action='append', default=[], help='Path to request (repeatable), default /projects')
+    parser.add_argument('--concurrency', type=int, default=16, help='Number of concurrent connections')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to run')
+    parser.add_argument('--insecure', action='store_true', help='Do not verify the server certificate')
+    parser.add_argument('--upload-lines', type=int, default=10000, help='Lines of the log posted to /upload/<project> paths')
+    parser.add_argument('--project-id', default='1', help='projectId sent with uploads')
+    args = parser.parse_args()
+
+    url = urllib.parse.urlsplit(args.url)
+    paths = args.path or ['/projects']
+    ssl_context = ssl.create_default_context()
+    if args.insecure:
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+    upload = None
+    if any(path.startswith('/upload/') for path in paths):
+        upload = multipart_upload(args.project_id, 'load_test.log', args.upload_lines)
+
+    start = time.perf_counter()
+    clients = [Client(url, paths, start + args.duration, ssl_context, upload) for _ in range(args.concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for client in clients for latency in client.latencies]
+    errors = sum(client.errors for client in clients)
+    print(f'{args.url} paths={paths} concurrency={args.concurrency}')
+    print(f'requests={len(latencies)} errors={errors} duration={elapsed:.1f}s')
+    print(f'throughput={len(latencies) / elapsed:.1f} req/s')
+    for name, fraction in (('p50', 0.50), ('p90', 0.90), ('p99', 0.99)):
+        print(f'{name}={percentile(latencies, fraction) * 1000:.1f} ms')
+
+if __name__ == '__main__':
+    main()
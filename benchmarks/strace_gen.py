@@ -0,0 +1,95 @@
+# strace_gen.py
+# generates synthetic strace-style log lines with the column layout routes.py
+# expects: program name in column 8, syscall in column 12 and the path in
+# column 13 (open, open64, fopen, fopen64, freopen) or 14 (openat, fopenat)
+#
+# the syscall mix is either open_ratio (share of open calls, spread over the
+# open variants as below) or explicit weights per syscall; path cardinality
+# is num_paths distinct file names in num_paths // 10 + 1 directories under
+# each of PATH_PREFIXES
+#   python -m benchmarks.strace_gen trace.log --lines 1000000 \
+#       --syscall-mix openat=4,open=1,read=3,close=2 --num-paths 5000
+import argparse
+import random
+
+PROGRAMS = ['python3', 'gcc', 'ld', 'bash', 'make', 'cc1', 'as', 'git']
+PATH_PREFIXES = ['/cvmfs/software.eessi.io/versions/2023.06', '/usr/lib64', '/tmp', '/home/user/work', '/etc', '/proc/self']
+OPEN_FLAGS = ['O_RDONLY|O_CLOEXEC', 'O_RDWR|O_CREAT', 'O_WRONLY|O_CREAT|O_TRUNC', 'O_RDONLY']
+FOPEN_MODES = ['r', 'w', 'rb', 'a+']
+OPEN_CALLS = ['open', 'openat', 'openat', 'open64', 'fopen', 'fopenat', 'fopen64', 'freopen']
+OTHER_CALLS = ['read', 'write', 'close', 'mmap', 'fstat', 'stat', 'lseek']
+
+def programs(num_programs=None):
+    # PROGRAMS, or num_programs names (PROGRAMS first, then prog<N>)
+    if num_programs is None:
+        return PROGRAMS
+    return (PROGRAMS + [f'prog{index}' for index in range(len(PROGRAMS), num_programs)])[:num_programs]
+
+def generate_line(rnd, open_ratio=0.4, num_paths=1000, syscall_mix=None, program_names=PROGRAMS):
+    # syscall_mix: {syscall: weight} (any of OPEN_CALLS and OTHER_CALLS),
+    # replaces open_ratio if given
+    path = f'{rnd.choice(PATH_PREFIXES)}/dir{rnd.randrange(num_paths // 10 + 1)}/file{rnd.randrange(num_paths)}'
+    prefix = [
+        '2024-05-01', f'12:{rnd.randrange(60):02d}:{rnd.randrange(60):02d}.{rnd.randrange(10**6):06d}',
+        'node01', 'strace', f'pid={rnd.randrange(1000, 99999)}', f'tid={rnd.randrange(1000, 99999)}',
+        'uid=1000', 'gid=1000', rnd.choice(program_names), f'cpu={rnd.randrange(64)}', f'seq={rnd.randrange(10**6)}', 'call',
+    ]
+    if syscall_mix is not None:
+        syscall = rnd.choices(list(syscall_mix), weights=list(syscall_mix.values()))[0]
+    elif rnd.random() < open_ratio:
+        syscall = rnd.choice(OPEN_CALLS)
+    else:
+        syscall = rnd.choice(OTHER_CALLS)
+    if syscall in OPEN_CALLS:
+        if syscall in ('openat', 'fopenat'):
+            args = ['AT_FDCWD', path]
+        else:
+            args = [path]
+        args.append(rnd.choice(FOPEN_MODES) if syscall.startswith('f') else rnd.choice(OPEN_FLAGS))
+        args.append(f'= {rnd.randrange(3, 1024)}')
+    else:
+        args = [str(rnd.randrange(3, 1024)), f'{rnd.randrange(1, 65536)}', f'= {rnd.randrange(0, 65536)}']
+    return ' '.join(prefix + [syscall] + args) + '\n'
+
+def generate_lines(num_lines, seed=42, open_ratio=0.4, num_paths=1000, syscall_mix=None, num_programs=None):
+    rnd = random.Random(seed)
+    program_names = programs(num_programs)
+    return [generate_line(rnd, open_ratio, num_paths, syscall_mix, program_names) for _ in range(num_lines)]
+
+def write_log(path, num_lines, seed=42, open_ratio=0.4, num_paths=1000, syscall_mix=None, num_programs=None):
+    rnd = random.Random(seed)
+    program_names = programs(num_programs)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for _ in range(num_lines):
+            f.write(generate_line(rnd, open_ratio, num_paths, syscall_mix, program_names))
+    return path
+
+def parse_mix(text):
+    # 'openat=4,read=3' -> {'openat': 4.0, 'read': 3.0}
+    mix = {}
+    for item in text.split(','):
+        syscall, _, weight = item.partition('=')
+        if syscall not in OPEN_CALLS and syscall not in OTHER_CALLS:
+            raise argparse.ArgumentTypeError(f'unknown syscall {syscall}')
+        mix[syscall] = float(weight or 1)
+    return mix
+
+def add_arguments(parser):
+    # log generator options shared by the benchmarks
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the log generator')
+    parser.add_argument('--open-ratio', type=float, default=0.4, help='Share of open calls (without --syscall-mix)')
+    parser.add_argument('--syscall-mix', type=parse_mix, default=None, help='Weights per syscall, e.g. openat=4,read=3,close=2')
+    parser.add_argument('--num-paths', type=int, default=1000, help='Distinct file names per path prefix')
+    parser.add_argument('--num-programs', type=int, default=None, help='Distinct program names')
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic strace-style log.')
+    parser.add_argument('path', help='Output file')
+    parser.add_argument('--lines', type=int, default=1000000, help='Number of lines')
+    add_arguments(parser)
+    args = parser.parse_args()
+    write_log(args.path, args.lines, seed=args.seed, open_ratio=args.open_ratio, num_paths=args.num_paths,
+              syscall_mix=args.syscall_mix, num_programs=args.num_programs)
+
+if __name__ == '__main__':
+    main()
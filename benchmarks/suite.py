@@ -0,0 +1,200 @@
+# suite.py
+# benchmark suite over the hot paths of the backend with synthetic strace
+# logs (see strace_gen.py): process_file, match_filters and file checksums
+# (uncached and cached) called directly, and upload, background processing and
+# /dataflow end to end through the Flask test client, on a temporary SQLite
+# database and upload directory
+#
+# every stage reports its throughput and the peak RSS of the process after
+# it (ru_maxrss only grows, so stages run from the smallest to the largest
+# working set); results can be saved as a baseline and later runs checked
+# against it, failing if a throughput drops or the peak RSS grows by more
+# than --tolerance
+#   python -m benchmarks.suite --check benchmarks/baseline.json
+#   python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+#
+# baselines are only comparable on the same machine and with the same
+# generator parameters (these are stored with the results); the stored
+# benchmarks/baseline.json is for the default parameters, re-record it with
+# --save-baseline on the machine the checks run on
+import argparse
+import atexit
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import config
+
+# the app reads its configuration when it is imported, so the database and
+# the uploads are pointed to a temporary directory first
+TMP_DIR = tempfile.mkdtemp(prefix='vdi-bench-')
+atexit.register(shutil.rmtree, TMP_DIR, ignore_errors=True)
+config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(TMP_DIR, 'vdi.db')
+config.Config.UPLOAD_DIRECTORY = os.path.join(TMP_DIR, 'uploads')
+config.Config.DATA_DIRECTORY = os.path.join(TMP_DIR, 'data')
+config.Config.LOG_LEVEL = 'WARNING'
+
+from app import app, db, dataflow, hashing, reduction  # noqa: E402
+from app.models import LogFile, Project  # noqa: E402
+from app.processing import match_filters, process_file  # noqa: E402
+from benchmarks.bench_filters import FILTERS  # noqa: E402
+from benchmarks.strace_gen import add_arguments, generate_lines, write_log  # noqa: E402
+
+MIB = 1024 * 1024
+
+def peak_rss_mib():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (MIB if sys.platform == 'darwin' else 1024)
+
+def best_of(repeat, func):
+    # (seconds, result) of the fastest of repeat calls
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best[0]:
+            best = seconds, result
+    return best
+
+def record(results, name, seconds, amount, unit):
+    # throughput of a stage as amount per second
+    results[name] = {'seconds': seconds, 'throughput': amount / seconds, 'unit': unit, 'peak_rss_mib': peak_rss_mib()}
+    print(f'  {name:<24} {seconds:9.3f} s {amount / seconds:12.1f} {unit:<9} peak RSS {results[name]["peak_rss_mib"]:8.1f} MiB')
+
+def wait_for_jobs(log_file_ids, timeout):
+    # poll the job status of the log files until none is queued or running
+    deadline = time.monotonic() + timeout
+    while True:
+        with app.app_context():
+            statuses = [status for status, in db.session.query(LogFile.status).filter(LogFile.id.in_(log_file_ids))]
+        if all(status not in ('queued', 'running') for status in statuses):
+            if any(status != 'done' for status in statuses):
+                raise SystemExit(f'background processing failed: {statuses}')
+            return
+        if time.monotonic() > deadline:
+            raise SystemExit(f'background processing did not finish within {timeout} s')
+        time.sleep(0.01)
+
+def run(args):
+    results = {}
+    generator = dict(open_ratio=args.open_ratio, num_paths=args.num_paths,
+                     syscall_mix=args.syscall_mix, num_programs=args.num_programs)
+    # process_file writes raw_logs/<file> to processed_logs/<file>
+    log_dir = os.path.join(TMP_DIR, 'raw_logs')
+    os.makedirs(log_dir)
+    # one log per seed, so the uploads are not deduplicated
+    log_paths = [write_log(os.path.join(log_dir, f'bench{index}.log'), args.lines, seed=args.seed + index, **generator)
+                 for index in range(args.logs)]
+    log_size = os.path.getsize(log_paths[0])
+    total_size = sum(map(os.path.getsize, log_paths))
+    print(f'logs: {args.logs} x {args.lines} lines, {total_size / MIB:.1f} MiB')
+
+    lines = generate_lines(min(args.lines, args.match_lines), seed=args.seed, **generator)
+    seconds, _ = best_of(args.repeat, lambda: [match_filters(line, FILTERS) for line in lines])
+    record(results, 'match_filters', seconds, len(lines), 'lines/s')
+
+    seconds, _ = best_of(args.repeat, lambda: hashing.file_checksum(log_paths[0]))
+    record(results, 'checksum', seconds, log_size / MIB, 'MiB/s')
+    seconds, _ = best_of(args.repeat, lambda: hashing.checksum(log_paths[0]))
+    record(results, 'checksum cached', seconds, log_size / MIB, 'MiB/s')
+
+    def filter_log():
+        processed_path, _ = process_file(log_paths[0], FILTERS)
+        os.remove(processed_path)
+    seconds, _ = best_of(args.repeat, filter_log)
+    record(results, 'process_file', seconds, log_size / MIB, 'MiB/s')
+
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()
+    files = [(open(path, 'rb'), os.path.basename(path)) for path in log_paths]
+    try:
+        start = time.perf_counter()
+        response = client.post('/upload/bench', data={'projectId': '1', 'filters': json.dumps(FILTERS), 'files': files},
+                               content_type='multipart/form-data')
+        seconds = time.perf_counter() - start
+    finally:
+        for file, _ in files:
+            file.close()
+    if response.status_code != 200:
+        raise SystemExit(f'upload failed: {response.status_code} {response.get_data(as_text=True)}')
+    record(results, 'upload', seconds, total_size / MIB, 'MiB/s')
+
+    with app.app_context():
+        project_id = Project.query.filter_by(name='bench').one().id
+        log_file_ids = [log_file_id for log_file_id, in db.session.query(LogFile.id).filter_by(project_id=project_id)]
+    wait_for_jobs(log_file_ids, args.timeout)
+    # measured from the start of the upload, as the jobs start while it runs
+    record(results, 'upload+processing', time.perf_counter() - start, total_size / MIB, 'MiB/s')
+
+    def get_dataflow(fmt, cold):
+        if cold:
+            dataflow.invalidate(project_id)
+            reduction.invalidate(project_id)
+        query = {'json': '', 'ndjson': '?format=ndjson', 'reduced': '?reduce=1'}[fmt]
+        response = client.get(f'/dataflow/{project_id}{query}')
+        if response.status_code != 200:
+            raise SystemExit(f'/dataflow failed: {response.status_code}')
+        return response.get_data()
+    for fmt in ('json', 'ndjson', 'reduced'):
+        for cold in (True, False):
+            seconds, _ = best_of(args.repeat, lambda: get_dataflow(fmt, cold))
+            record(results, f'dataflow {fmt} {"cold" if cold else "warm"}', seconds, args.logs * args.lines, 'lines/s')
+    return results
+
+def compare(results, baseline, tolerance):
+    # names of the stages that regressed against the baseline
+    regressions = []
+    print(f'against baseline (tolerance {tolerance:.0%}):')
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        speed = result['throughput'] / base['throughput']
+        memory = result['peak_rss_mib'] / base['peak_rss_mib']
+        failed = speed < 1 - tolerance or memory > 1 + tolerance
+        print(f'  {name:<24} throughput {speed:6.2f}x  peak RSS {memory:6.2f}x{"  REGRESSION" if failed else ""}')
+        if failed:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite over filtering, upload, processing and /dataflow.')
+    parser.add_argument('--lines', type=int, default=200000, help='Lines per synthetic log')
+    parser.add_argument('--logs', type=int, default=4, help='Logs uploaded end to end')
+    parser.add_argument('--match-lines', type=int, default=100000, help='Lines passed to match_filters')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per stage, the fastest counts')
+    parser.add_argument('--timeout', type=float, default=600, help='Seconds to wait for background processing')
+    add_arguments(parser)
+    parser.add_argument('--save-baseline', metavar='PATH', help='Write the results to PATH')
+    parser.add_argument('--check', metavar='PATH', help='Fail on regressions against the baseline in PATH')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression')
+    args = parser.parse_args()
+
+    params = {name: getattr(args, name) for name in ('lines', 'logs', 'match_lines', 'seed', 'open_ratio',
+                                                     'syscall_mix', 'num_paths', 'num_programs')}
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        if baseline['params'] != params:
+            raise SystemExit(f'baseline {args.check} was recorded with {baseline["params"]}')
+
+    results = run(args)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'params': params, 'results': results}, f, indent=2)
+            f.write('\n')
+    if args.check:
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            raise SystemExit(f'regressions: {", ".join(regressions)}')
+
+if __name__ == '__main__':
+    main()
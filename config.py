@@ -4,5 +4,64 @@ import os
 class Config:
   SQLALCHEMY_DATABASE_URI = 'sqlite:////mnt/vol1/databases/vdi.db'
   SQLALCHEMY_TRACK_MODIFICATIONS = False
+  # applied to every SQLite connection: WAL lets readers run while a job
+  # writes, synchronous=NORMAL is safe with WAL, busy_timeout makes
+  # concurrent writers wait instead of failing with 'database is locked'
+  SQLITE_PRAGMAS = [
+    'journal_mode=WAL',
+    'synchronous=NORMAL',
+    'foreign_keys=ON',
+    'busy_timeout=10000',
+    'cache_size=-65536',
+    'temp_store=MEMORY',
+    'mmap_size=268435456',
+  ]
   UPLOAD_DIRECTORY = '/mnt/vol1/uploads'
   DATA_DIRECTORY = '/mnt/vol1/data'
+  # level of the messages logged by app.logger (DEBUG, INFO, WARNING, ...)
+  LOG_LEVEL = 'INFO'
+  # number of processes used to filter a single large log file (1 = serial)
+  PROCESSING_WORKERS = 1
+  # only log files of at least this size (bytes) are filtered in parallel
+  PROCESSING_PARALLEL_MIN_SIZE = 64 * 1024 * 1024
+  # background processing of uploaded log files: number of worker threads,
+  # maximum number of jobs held in memory and attempts before a job fails
+  JOB_WORKERS = 2
+  JOB_QUEUE_SIZE = 100
+  JOB_MAX_ATTEMPTS = 3
+  # compression of stored raw and processed logs: None, 'gzip' or 'zstd'
+  # (needs the zstandard package) and its level (None: default of the
+  # method); compressed files are detected when read, so this can be
+  # changed at any time; logs uploaded compressed (.gz, .zst) stay so
+  STORAGE_COMPRESSION = None
+  STORAGE_COMPRESSION_LEVEL = None
+  # /dataflow?reduce=1 collapses files into one node per directory prefix of
+  # this many components (?depth=N overrides it, 0 keeps single files)
+  DATAFLOW_COLLAPSE_DEPTH = 3
+  # nodes of the cached results of lineage queries kept per project (8
+  # bytes each, see app/lineage.py)
+  LINEAGE_CACHE_NODES = 10 * 1000 * 1000
+  # threads hashing files (the files of an upload are hashed in parallel)
+  # and number of file checksums kept by path, size and mtime
+  CHECKSUM_WORKERS = 4
+  CHECKSUM_CACHE_SIZE = 100000
+  # maximum size (bytes) of the cache of filtered log files kept in
+  # UPLOAD_DIRECTORY/.filter_cache (0 disables caching)
+  FILTER_CACHE_SIZE = 10 * 1024 * 1024 * 1024
+  # production server ('run.py serve'): worker processes, threads per worker,
+  # seconds to keep idle connections alive and request timeout (seconds)
+  SERVER_WORKERS = 4
+  SERVER_THREADS = 8
+  SERVER_KEEPALIVE = 5
+  SERVER_TIMEOUT = 600
+  # hand downloads off to the front proxy: None (send from Python),
+  # 'x-sendfile' (Apache/lighttpd) or 'x-accel-redirect' (nginx, with an
+  # internal location DOWNLOAD_ACCEL_PREFIX aliased to DATA_DIRECTORY)
+  DOWNLOAD_ACCEL = None
+  DOWNLOAD_ACCEL_PREFIX = '/protected-data'
+  # add an X-Query-Count header (number of SQL statements) to every response
+  QUERY_COUNT_HEADER = False
+  # answer requests with ?profile=<pstats sort key> with a cProfile report
+  # (the PROFILE_LINES top functions) instead of their response
+  PROFILE_REQUESTS = False
+  PROFILE_LINES = 50
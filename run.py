@@ -2,16 +2,23 @@
 import argparse
 import os
 import sys
+from sqlalchemy import inspect, text
 from app import app, db
 from app.models import *
+from app import hashing
+from app.routes import job_queue
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Start the VDI API server.')
-    parser.add_argument('command', choices=['run', 'initdb', 'migratedb'], help='Command to execute')
+    parser.add_argument('command', choices=['run', 'serve', 'initdb', 'migratedb', 'backfillchecksums'], help='Command to execute')
     parser.add_argument('--host', type=str, default='127.0.0.1', help='Hostname to listen on')
     parser.add_argument('--port', type=int, default=5575, help='Port to listen on')
     parser.add_argument('--cert', type=str, default='certs/fullchain.pem', help='Path to the SSL certificate')
     parser.add_argument('--key', type=str, default='certs/privkey.pem', help='Path to the SSL key')
+    parser.add_argument('--server', choices=['gunicorn', 'uvicorn'], default='gunicorn', help='Server used by serve')
+    parser.add_argument('--workers', type=int, default=app.config['SERVER_WORKERS'], help='Number of worker processes (serve)')
+    parser.add_argument('--threads', type=int, default=app.config['SERVER_THREADS'], help='Number of threads per worker (serve)')
+    parser.add_argument('--keepalive', type=int, default=app.config['SERVER_KEEPALIVE'], help='Seconds to keep idle connections alive (serve)')
     return parser.parse_args()
 
 def main():
@@ -21,17 +28,70 @@ def main():
         with app.app_context():
             db.create_all() # Ensure that this is within the application context
         print("Database initialised.")
-    elif args.command == 'migrate':
-        migrated_db()
+    elif args.command == 'migratedb':
+        migrate_db()
         print("Database migrated.")
+    elif args.command == 'backfillchecksums':
+        backfill_checksums()
     elif args.command == 'run':
+        # with debug=True the reloader runs main() in a monitoring process and
+        # in the serving child process; only the child processes jobs
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            job_queue.resume()
         context = (args.cert, args.key) 
         app.run(host=args.host, port=args.port, ssl_context=context, debug=True)
+    elif args.command == 'serve':
+        serve(args)
     else:
         print("Unknown command.")
 
+def serve(args):
+    from app.server import serve_gunicorn, serve_uvicorn
+    if args.server == 'uvicorn':
+        serve_uvicorn(args.host, args.port, args.workers, args.threads, args.keepalive,
+                      certfile=args.cert, keyfile=args.key)
+    else:
+        serve_gunicorn(args.host, args.port, args.workers, args.threads, args.keepalive,
+                       app.config['SERVER_TIMEOUT'], certfile=args.cert, keyfile=args.key)
+
 def migrate_db():
-    pass
+    # create missing tables, add columns and indexes that were added to the
+    # models after the database was initialised
+    with app.app_context():
+        db.create_all()
+        inspector = inspect(db.engine)
+        with db.engine.begin() as connection:
+            for table in db.metadata.sorted_tables:
+                existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing_columns:
+                        column_type = column.type.compile(dialect=db.engine.dialect)
+                        connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in existing_indexes:
+                        print(f'creating index {index.name}')
+                        index.create(connection)
+            # refresh the statistics the query planner uses to pick indexes
+            connection.execute(text('ANALYZE'))
+
+def backfill_checksums():
+    # store the checksums of raw logs, filtered logs and data files that were
+    # saved before checksums were recorded, hashing several files at once
+    with app.app_context():
+        for model, path_column in ((LogFile, LogFile.file_path), (FilteredFile, FilteredFile.filtered_file_path),
+                                   (Data, Data.stored_path)):
+            rows = [(row_id, path) for row_id, path in db.session.query(model.id, path_column).filter(model.checksum.is_(None))
+                    if path and os.path.isfile(path)]
+            computed = 0
+            for (row_id, path), checksum in zip(rows, hashing.service.checksums([path for _, path in rows])):
+                if isinstance(checksum, Exception):
+                    print(f'{path}: {checksum}', file=sys.stderr)
+                    continue
+                model.query.filter_by(id=row_id).update({'checksum': checksum}, synchronize_session=False)
+                computed += 1
+            db.session.commit()
+            print(f'{model.__tablename__}: {computed} checksums stored')
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,83 @@
+# conftest.py
+# the app reads its configuration when it is imported, so the database and
+# the uploads are pointed to a temporary directory first (like
+# benchmarks/suite.py); every test starts with empty tables and storage
+import atexit
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import pytest
+
+import config
+
+TMP_DIR = tempfile.mkdtemp(prefix='vdi-test-')
+atexit.register(shutil.rmtree, TMP_DIR, ignore_errors=True)
+config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(TMP_DIR, 'vdi.db')
+config.Config.UPLOAD_DIRECTORY = os.path.join(TMP_DIR, 'uploads')
+config.Config.DATA_DIRECTORY = os.path.join(TMP_DIR, 'data')
+config.Config.LOG_LEVEL = 'WARNING'
+
+from app import app, bulk, db  # noqa: E402
+from app.models import LogFile  # noqa: E402
+
+@pytest.fixture
+def client():
+    for directory in (app.config['UPLOAD_DIRECTORY'], app.config['DATA_DIRECTORY']):
+        shutil.rmtree(directory, ignore_errors=True)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    yield app.test_client()
+
+# an open call of a program in the strace log format, e.g.
+# strace_line('gcc', '/src/a.c') or strace_line('ld', '/tmp/a.o', 'O_RDWR')
+LINE = ('2024-05-01 12:00:00.000001 node01 strace pid=1 tid=1 uid=1 gid=1 {program} cpu=3 seq=17 call '
+        'open {path} {flags} = 3\n')
+
+@pytest.fixture
+def strace_line():
+    def line(program, path, flags='O_RDONLY'):
+        return LINE.format(program=program, path=path, flags=flags)
+    return line
+
+@pytest.fixture
+def upload_log(client):
+    # upload one log (bytes or str) to project1 (id 1), returns the response
+    def upload(content, name='trace.log', filters=()):
+        if isinstance(content, str):
+            content = content.encode()
+        return client.post('/upload/project1', data={'projectId': '1', 'filters': json.dumps(list(filters)),
+                                                     'files': [(io.BytesIO(content), name)]},
+                           content_type='multipart/form-data')
+    return upload
+
+@pytest.fixture
+def wait_for_jobs():
+    # wait until every log file is processed
+    def wait(timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with app.app_context():
+                if all(status == 'done' for status, in db.session.query(LogFile.status)):
+                    return
+            time.sleep(0.01)
+        raise AssertionError('jobs did not finish')
+    return wait
+
+@pytest.fixture
+def wait_for_operation(client):
+    # the state of a bulk operation once it is no longer running
+    def wait(operation_id, timeout=10):
+        deadline = time.monotonic() + timeout
+        while True:
+            operation = client.get(f'/operations/{operation_id}').json
+            if operation['status'] != bulk.RUNNING:
+                return operation
+            if time.monotonic() > deadline:
+                raise AssertionError(f'operation {operation_id} did not finish')
+            time.sleep(0.01)
+    return wait
@@ -0,0 +1,43 @@
+# test_access_index.py
+import pytest
+
+from app import app
+from app.models import LogFile
+
+@pytest.fixture
+def upload_open(strace_line, upload_log, wait_for_jobs):
+    # upload a log of one open call and wait until it is processed
+    def upload(program, path, name):
+        assert upload_log(strace_line(program, path), name).status_code == 200
+        wait_for_jobs()
+    return upload
+
+def paths(client):
+    return [file['path'] for file in client.get('/projects/1/files').json['files']]
+
+def test_index_follows_uploads_processing_and_deletes(client, upload_open):
+    upload_open('gcc', '/src/a.c', 'first.log')
+    assert paths(client) == ['/src/a.c']
+    upload_open('ld', '/src/b.o', 'second.log')
+    assert paths(client) == ['/src/a.c', '/src/b.o']
+    assert client.get('/projects/1/programs/ld').json['files'][0]['path'] == '/src/b.o'
+
+    with app.app_context():
+        first_id = LogFile.query.filter_by(file_name='first.log').one().id
+    assert client.delete('/projects/1/logfiles', json={'ids': [first_id]}).status_code == 202
+    assert paths(client) == ['/src/b.o']
+    assert client.get('/projects/1/programs/gcc').status_code == 404
+
+def test_lineage_follows_uploads_and_deletes(client, upload_open):
+    upload_open('gcc', '/src/a.c', 'first.log')
+    lineage = lambda: client.get('/projects/1/lineage?program=gcc&direction=upstream').status_code
+    assert lineage() == 200
+    assert client.get('/projects/1/lineage?program=ld&direction=upstream').status_code == 404
+    upload_open('ld', '/src/b.o', 'second.log')
+    assert client.get('/projects/1/lineage?program=ld&direction=upstream').json['nodes'] == [
+        {'type': 'file', 'path': '/src/b.o', 'depth': 1}]
+
+    with app.app_context():
+        first_id = LogFile.query.filter_by(file_name='first.log').one().id
+    assert client.delete('/projects/1/logfiles', json={'ids': [first_id]}).status_code == 202
+    assert lineage() == 404
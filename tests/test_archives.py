@@ -0,0 +1,103 @@
+# test_archives.py
+import hashlib
+import io
+import os
+import tarfile
+
+from app import app, bulk, routes
+from app.models import LogFile
+
+def tar_archive(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as archive:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+class PollingBody(io.BytesIO):
+    # request body that polls /operations before its second half is read
+    def __init__(self, data):
+        super().__init__(data)
+        self.half = len(data) // 2
+        self.polled = None
+
+    def poll(self):
+        if self.polled is None and self.tell() >= self.half:
+            self.polled = app.test_client().get('/operations?kind=upload').json['operations']
+
+    def read(self, size=-1):
+        self.poll()
+        return super().read(size if size is None or size < 0 else min(size, 4096))
+
+    def readinto(self, buffer):
+        self.poll()
+        return super().readinto(memoryview(buffer)[:4096])
+
+    read1 = read
+
+def test_archive_upload_can_be_followed_while_it_is_sent(client, strace_line):
+    data = tar_archive([(f'logs/trace{index}.log', strace_line('gcc', '/src/a.c').encode() * 1000) for index in range(8)])
+    body = PollingBody(data)
+    response = client.post('/upload/project1/archive?projectId=1', input_stream=body,
+                           content_type='application/x-tar', content_length=len(data))
+    assert response.status_code == 200
+    assert len(response.json['files']) == 8
+
+    [running] = body.polled
+    assert running['id'] == response.json['operation']['id']
+    assert running['label'] == 'project1'
+    assert running['status'] == 'running'
+    assert 0 < running['bytes_read'] < response.json['operation']['bytes_read']
+    assert client.get('/operations?kind=upload').json['operations'] == []
+
+def upload_archive(client, data):
+    return client.post('/upload/project1/archive?projectId=1', data=data, content_type='application/x-tar')
+
+def test_members_with_the_same_name_are_kept_apart(client, strace_line, wait_for_jobs):
+    first, second = strace_line('gcc', '/src/a.c').encode(), strace_line('ld', '/src/b.o').encode()
+    response = upload_archive(client, tar_archive([('n1/trace.log', first), ('n2/trace.log', second)]))
+    assert response.status_code == 200
+    assert sorted(file['file_name'] for file in response.json['files']) == ['n1_trace.log', 'n2_trace.log']
+    wait_for_jobs()
+    with app.app_context():
+        stored = {log_file.file_name: (log_file.checksum, log_file.file_path) for log_file in LogFile.query}
+    for name, content in (('n1_trace.log', first), ('n2_trace.log', second)):
+        checksum, file_path = stored[name]
+        with open(file_path, 'rb') as f:
+            assert f.read() == content
+        assert checksum == hashlib.sha256(content).hexdigest()
+    assert {file['path'] for file in client.get('/projects/1/files').json['files']} == {'/src/a.c', '/src/b.o'}
+
+def test_names_taken_in_the_archive_or_the_project_are_reported(client, strace_line):
+    first, second = strace_line('gcc', '/src/a.c').encode(), strace_line('ld', '/src/b.o').encode()
+    response = upload_archive(client, tar_archive([('n1/trace.log', first), ('n1_trace.log', second)]))
+    assert response.status_code == 200
+    assert [file['file_name'] for file in response.json['files']] == ['n1_trace.log']
+    assert response.json['skipped'] == ['n1_trace.log']
+    assert len(response.json['operation']['errors']) == 1
+
+    # the same content again is a duplicate, other content under the same name is not added
+    response = upload_archive(client, tar_archive([('n1/trace.log', first), ('n2/trace.log', second)]))
+    assert [file['file_name'] for file in response.json['files']] == ['n1_trace.log', 'n2_trace.log']
+    response = upload_archive(client, tar_archive([('n1/trace.log', second)]))
+    assert response.json['files'] == []
+    assert response.json['skipped'] == ['n1_trace.log']
+    assert 'other content' in response.json['operation']['errors'][0]
+    with app.app_context():
+        file_path = LogFile.query.filter_by(file_name='n1_trace.log').one().file_path
+    with open(file_path, 'rb') as f:
+        assert f.read() == first
+
+def test_operation_fails_on_unexpected_errors(client, strace_line, monkeypatch):
+    def fail(*args):
+        raise OSError('disk full')
+    monkeypatch.setattr(routes, 'add_log_file', fail)
+    response = upload_archive(client, tar_archive([('trace.log', strace_line('gcc', '/src/a.c').encode())]))
+    assert response.status_code == 500
+    operation = [operation for operation in bulk._operations.values() if operation.kind == 'upload'][-1]
+    assert operation.status == bulk.FAILED
+    assert operation.errors == ['upload failed: disk full']
+    assert client.get('/operations?kind=upload').json['operations'] == []
+    assert os.listdir(os.path.join(app.config['UPLOAD_DIRECTORY'], 'project1_1', 'raw_logs')) == []
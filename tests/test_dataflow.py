@@ -0,0 +1,29 @@
+# test_dataflow.py
+import json
+
+import pytest
+
+from app import app, db, reduction
+from app.models import LogFile
+
+@pytest.fixture
+def project_id(strace_line, upload_log, wait_for_jobs):
+    # id of a project with one processed log: gcc reads a.c and writes a.o,
+    # ld reads a.o
+    content = (strace_line('gcc', '/src/lib/a.c') + strace_line('gcc', '/build/obj/a.o', 'O_RDWR') +
+               strace_line('ld', '/build/obj/a.o'))
+    assert upload_log(content).status_code == 200
+    wait_for_jobs()
+    with app.app_context():
+        return db.session.query(LogFile.project_id).scalar()
+
+def test_reduced_depth_is_validated_and_cached_depths_are_bounded(client, project_id):
+    for depth in (-1, reduction.MAX_DEPTH + 1, 10 ** 9):
+        assert client.get(f'/dataflow/{project_id}?reduce=1&depth={depth}').status_code == 400
+
+    for depth in range(reduction.CACHED_DEPTHS + 3):
+        response = client.get(f'/dataflow/{project_id}?reduce=1&depth={depth}')
+        assert response.status_code == 200
+        assert json.loads(response.data)['nodes']
+    cached = sorted(depth for key_project, depth in reduction._reduced if key_project == project_id)
+    assert cached == list(range(3, reduction.CACHED_DEPTHS + 3))
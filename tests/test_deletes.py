@@ -0,0 +1,47 @@
+# test_deletes.py
+import os
+
+from app import app, bulk, db
+from app.models import LogFile
+
+def test_reupload_during_reclaim_keeps_new_file(client, monkeypatch, strace_line, upload_log, wait_for_operation):
+    assert upload_log(strace_line('gcc', '/src/a.c')).status_code == 200
+    with app.app_context():
+        log_file = LogFile.query.one()
+        log_file_id, raw_path = log_file.id, log_file.file_path
+
+    # hold the background removal until the same name was uploaded again
+    submitted = []
+    monkeypatch.setattr(bulk._executor, 'submit', lambda *args: submitted.append(args))
+    response = client.delete('/projects/1/logfiles', json={'ids': [log_file_id]})
+    assert response.status_code == 202
+    assert not os.path.exists(raw_path)
+
+    assert upload_log(strace_line('ld', '/src/b.c')).status_code == 200
+    monkeypatch.undo()
+    for args in submitted:
+        bulk._executor.submit(*args)
+    operation = wait_for_operation(response.json['operation']['id'])
+    assert operation['status'] == bulk.DONE
+
+    with app.app_context():
+        log_file = LogFile.query.one()
+        assert log_file.file_path == raw_path
+    with open(raw_path, 'rb') as f:
+        assert b'/src/b.c' in f.read()
+    trash = os.path.join(app.config['UPLOAD_DIRECTORY'], bulk.TRASH_DIRECTORY)
+    assert os.listdir(trash) == []
+
+def test_delete_project_removes_files_and_directories(client, strace_line, upload_log, wait_for_operation):
+    assert upload_log(strace_line('gcc', '/src/a.c')).status_code == 200
+    with app.app_context():
+        raw_path = LogFile.query.one().file_path
+        project_id = LogFile.query.one().project_id
+    response = client.delete(f'/projects/{project_id}')
+    assert response.status_code == 200
+    operation = wait_for_operation(response.json['operation']['id'])
+    assert operation['status'] == bulk.DONE
+    assert operation['bytes_freed'] > 0
+    assert not os.path.exists(os.path.dirname(raw_path))
+    with app.app_context():
+        assert db.session.query(LogFile.id).count() == 0
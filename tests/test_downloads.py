@@ -0,0 +1,24 @@
+# test_downloads.py
+import io
+
+def upload(client, content, name='result.txt'):
+    response = client.post('/data/view1', data={'viewId': '1', 'files': [(io.BytesIO(content), name)]},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+
+def test_reupload_replaces_content_and_etag(client):
+    upload(client, b'first version')
+    first = client.get('/download/view1/result.txt')
+    assert first.status_code == 200
+    old_etag = first.headers['ETag']
+
+    upload(client, b'second version')
+    files = client.get('/views/view1/files').json['files']
+    assert [file['filename'] for file in files] == ['result.txt']
+
+    # a client holding the ETag of the old content must get the new content
+    second = client.get('/download/view1/result.txt', headers={'If-None-Match': old_etag})
+    assert second.status_code == 200
+    assert second.data == b'second version'
+    assert second.headers['ETag'] != old_etag
+    assert client.get('/download/view1/result.txt', headers={'If-None-Match': second.headers['ETag']}).status_code == 304
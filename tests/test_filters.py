@@ -0,0 +1,115 @@
+# test_filters.py
+# the compiled filters (FilterPlan) must keep exactly the lines the original
+# match_filters kept, see legacy_match_filters in benchmarks/bench_filters.py;
+# a line the original raised IndexError for must raise it too; the same
+# holds for the column-wise evaluation with NumPy (filter_lines_batch)
+import random
+
+import pytest
+
+from app.processing import FilterPlan, filter_lines_batch, match_filters, numpy
+from benchmarks.bench_filters import legacy_match_filters
+from benchmarks.strace_gen import generate_lines
+
+LINES = [
+    'a b c\n',
+    'a b c\r\n',
+    '  a\tb   c  \n',
+    'a\x0bb\x0cc\x1cd\xa0e f\n',
+    'a',
+    'a b',
+    '',
+    '\n',
+    '   \r\n',
+    '2024-05-01 12:00:00.000001 node01 strace pid=1 tid=1 uid=1 gid=1 gcc cpu=3 seq=17 call open /src/a.c O_RDONLY = 3\n',
+    '2024-05-01 12:00:00.000001 node01 strace pid=1 tid=1 uid=1 gid=1 ld cpu=3 seq=17 call openat AT_FDCWD /tmp/a.o O_RDWR = 4\r\n',
+]
+
+FILTERS = [
+    [],
+    # filters without regexs match every line
+    [''],
+    ['0'],
+    ['0@@@'],
+    # anchors, against columns with surrounding whitespace and line endings
+    ['1@@@^b$'],
+    ['2@@@^c$'],
+    ['0@@@^$'],
+    ['0@@@^a', '0@@@c$'],
+    ['0@@@a|x', '0@@@^c'],
+    ['-1@@@^c$'],
+    ['-1@@@^3$', '-2@@@^=$'],
+    # missing columns raise IndexError unless an earlier filter matched
+    ['5@@@x'],
+    ['0@@@^a$', '5@@@x'],
+    ['5@@@x', '0@@@^a$'],
+    ['-4@@@a'],
+    ['1@@@^b$@@@5@@@x'],
+    # filters combined into alternations or factored by their common part
+    ['0@@@^a$@@@1@@@^b$', '0@@@^a$@@@1@@@^x$', '1@@@^x$@@@0@@@^a$'],
+    ['12@@@^open$@@@13@@@^/src', '12@@@^open$@@@13@@@^/tmp', '12@@@^openat$@@@14@@@^/tmp'],
+    ['8@@@^gcc$', '8@@@^ld$', '12@@@^openat$'],
+    # a trailing column without a regex is ignored
+    ['0@@@^a$@@@1'],
+    # regexs that cannot be merged: groups, backreferences, inline flags
+    ['0@@@(a)\\1', '0@@@^b'],
+    ['0@@@(?i)A', '1@@@B', '0@@@^x'],
+    ['0@@@(?i)A@@@1@@@^b$', '0@@@^a$@@@1@@@(?i)B'],
+]
+
+def outcome(func, *args):
+    try:
+        return func(*args)
+    except IndexError:
+        return IndexError
+
+@pytest.mark.parametrize('filters', FILTERS, ids=repr)
+def test_filter_plan_matches_like_match_filters_did(filters):
+    plan = FilterPlan(filters)
+    for line in LINES:
+        expected = outcome(legacy_match_filters, line, filters)
+        assert outcome(plan.match, line) == expected, line
+        assert outcome(match_filters, line, filters) == expected, line
+        assert outcome(match_filters, line, plan) == expected, line
+
+# random filter lists for the fuzz test: columns beyond the end of some
+# lines, negative columns and regexs that cannot be merged included
+FUZZ_COLUMNS = (0, 1, 8, 8, 8, 12, 12, 12, 13, 13, 14, 14, 15, 16, -1, -2)
+FUZZ_REGEXS = ('^open$', '^openat$', '^(read|write)$', '^f?open', 'close', 'gcc', '^ld$', '^(bash|make)$', 'a',
+               '^/tmp', '^/proc/', '^/etc/', '^/cvmfs/software\\.eessi\\.io', '^AT_FDCWD$', '^[rw]b?$', '\\+$',
+               'O_RDONLY', 'O_RDWR|O_CREAT', '^$', '(?i)^OPEN$', '(\\d)\\1', '^\\d+$', '^12:[0-2]', '^=$', '')
+FUZZ_LISTS = 30000
+
+def random_filters(rnd):
+    filters = []
+    for _ in range(rnd.choice((1, 1, 2, 3, 5, 12))):
+        # now and then a filter without regexs, which matches every line
+        num_regexs = 0 if rnd.random() < 0.02 else rnd.choice((1, 1, 1, 2, 3))
+        pairs = [f'{rnd.choice(FUZZ_COLUMNS)}@@@{rnd.choice(FUZZ_REGEXS)}' for _ in range(num_regexs)]
+        if rnd.random() < 0.05:
+            # a trailing column without a regex
+            pairs.append(str(rnd.choice(FUZZ_COLUMNS)))
+        filters.append('@@@'.join(pairs))
+    return filters
+
+def random_block(rnd, pool):
+    lines = rnd.sample(pool, 12)
+    if rnd.random() < 0.2:
+        # a line too short for some of the columns
+        lines.insert(rnd.randrange(len(lines)), rnd.choice(('a b c\n', '\n', ' x \r\n')))
+    return lines
+
+def legacy_kept(lines, filters):
+    return [line for line in lines if not legacy_match_filters(line, filters)]
+
+@pytest.mark.skipif(numpy is None, reason='filter_lines_batch needs NumPy')
+def test_fuzz_batch_and_plan_against_legacy_match_filters():
+    rnd = random.Random(16)
+    pool = generate_lines(2000, seed=16)
+    for _ in range(FUZZ_LISTS):
+        filters = random_filters(rnd)
+        lines = random_block(rnd, pool)
+        plan = FilterPlan(filters)
+        expected = outcome(legacy_kept, lines, filters)
+        assert outcome(filter_lines_batch, lines, plan) == expected, (filters, lines)
+        assert outcome(lambda: [line for line in lines if not plan.match(line)]) == expected, (filters, lines)
@@ -0,0 +1,18 @@
+# test_metrics.py
+from app import app
+from app.querycount import count_queries
+
+def test_requests_are_counted_once_and_statements_kept_only_when_profiled(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'QUERY_COUNT_HEADER', True)
+    monkeypatch.setitem(app.config, 'PROFILE_REQUESTS', True)
+    with count_queries() as queries:
+        response = client.get('/projects')
+    assert queries.statements is None
+    assert response.headers['X-Query-Count'] == str(queries.count)
+    assert queries.count > 0
+    assert 'vdi_http_request_queries_sum{endpoint="get_projects"}' in client.get('/metrics').get_data(as_text=True)
+
+    with count_queries(statements=True) as queries:
+        report = client.get('/projects?profile=cumulative').get_data(as_text=True)
+    assert f'{queries.count} SQL statements' in report
+    assert queries.statements[-1] in report
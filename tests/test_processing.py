@@ -0,0 +1,37 @@
+# test_processing.py
+# process_file must write the same bytes as the original implementation,
+# which read the log as text with newline='' and kept the lines that
+# match_filters did not match, whether it filters serially or in parallel
+import hashlib
+import os
+
+import pytest
+
+from app.processing import process_file
+from benchmarks.bench_filters import FILTERS, legacy_match_filters
+from benchmarks.strace_gen import generate_lines
+
+@pytest.fixture
+def raw_path(tmp_path):
+    # a log with mixed line endings and no newline after its last line
+    raw_dir = tmp_path / 'raw_logs'
+    raw_dir.mkdir()
+    lines = [line.rstrip('\n') for line in generate_lines(5000, seed=7)]
+    endings = ('\n', '\r\n', '\n', '\r')
+    path = raw_dir / 'trace.log'
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        f.write(''.join(line + endings[index % len(endings)] for index, line in enumerate(lines)) + lines[0])
+    return str(path)
+
+def legacy_output(raw_path, filters):
+    with open(raw_path, 'r', newline='', encoding='utf-8') as f:
+        return ''.join(line for line in f if not legacy_match_filters(line, filters)).encode('utf-8')
+
+@pytest.mark.parametrize('workers', [1, 2, 3])
+def test_serial_and_parallel_output_match_the_original(raw_path, workers):
+    expected = legacy_output(raw_path, FILTERS)
+    processed_path, checksum = process_file(raw_path, FILTERS, workers=workers, min_parallel_size=0)
+    with open(processed_path, 'rb') as f:
+        assert f.read() == expected
+    assert checksum == hashlib.sha256(expected).hexdigest()
+    assert os.path.basename(processed_path) == 'trace.log'
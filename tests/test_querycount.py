@@ -0,0 +1,64 @@
+# test_querycount.py
+# the list endpoints and /dataflow issue a fixed number of SQL statements,
+# however many projects and logs there are (no query per row)
+import pytest
+from sqlalchemy import insert
+
+from app import app, db, access_index, lineage, reduction
+from app.dataflow import invalidate
+from app.models import FileAccess, FilteredFile, LogFile, Project
+from app.querycount import count_queries
+
+# statements per request; the first /dataflow request reads the logs and
+# their triples, later ones only the logs (the graph is cached)
+EXPECTED = {
+    'projects': 1,
+    'rawlogfiles': 2,
+    'processedlogfiles': 2,
+    'dataflow cold': 3,
+    'dataflow warm': 2,
+    'dataflow not modified': 2,
+}
+
+def populate(num_logs):
+    # projects 1 and 2 with num_logs processed logs of two open calls each
+    for project_id in (1, 2):
+        invalidate(project_id)
+        access_index.invalidate(project_id)
+        reduction.invalidate(project_id)
+        lineage.invalidate(project_id)
+    with app.app_context(), db.engine.begin() as connection:
+        connection.execute(insert(Project), [{'id': project_id, 'name': f'project{project_id}', 'logs_version': 0}
+                                             for project_id in (1, 2)])
+        log_ids = range(1, 2 * num_logs + 1)
+        connection.execute(insert(LogFile), [
+            {'id': i, 'project_id': 1 + i % 2, 'file_name': f'log{i}.log', 'file_path': f'/raw_logs/log{i}.log', 'status': 'done'}
+            for i in log_ids])
+        connection.execute(insert(FilteredFile), [
+            {'id': i, 'log_file_id': i, 'filtered_file_name': f'log{i}.log', 'filtered_file_path': f'/processed_logs/log{i}.log',
+             'num_accesses': 2}
+            for i in log_ids])
+        connection.execute(insert(FileAccess), [
+            {'log_file_id': i, 'seq': seq, 'program': f'prog{i % 7}', 'path': f'/src/file{(i + seq) % 50}', 'mode': mode}
+            for i in log_ids for seq, mode in enumerate(('read', 'write'))])
+
+def statements(client, url, headers=None):
+    with count_queries() as queries:
+        response = client.get(url, headers=headers)
+    assert response.status_code in (200, 304), url
+    return queries.count, response
+
+@pytest.mark.parametrize('num_logs', [1, 10, 200])
+def test_statements_do_not_grow_with_the_number_of_logs(client, num_logs):
+    populate(num_logs)
+    counts = {}
+    counts['projects'], _ = statements(client, '/projects')
+    counts['rawlogfiles'], response = statements(client, '/projects/project1/rawlogfiles')
+    assert len(response.json['log_files']) == num_logs
+    counts['processedlogfiles'], _ = statements(client, '/projects/project1/processedlogfiles')
+    counts['dataflow cold'], response = statements(client, '/dataflow/1')
+    assert response.json['nodes']
+    counts['dataflow warm'], response = statements(client, '/dataflow/1')
+    counts['dataflow not modified'], response = statements(client, '/dataflow/1', {'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+    assert counts == EXPECTED
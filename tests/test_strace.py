@@ -0,0 +1,48 @@
+# test_strace.py
+# golden sample lines of the open-call parser (app/strace.py); the helpers
+# it replaced (benchmarks/bench_parser.py) must agree with them as well
+import gzip
+
+import pytest
+
+from app.strace import OpenCall, iter_open_calls, parse_file, parse_line
+from benchmarks.bench_parser import legacy_parse_line
+
+PREFIX = '2024-05-01 12:00:00.000001 node01 strace pid=4242 tid=4242 uid=1000 gid=1000'
+SUFFIX = 'cpu=3 seq=17 call'
+
+GOLDEN = [
+    (f'{PREFIX} python3 {SUFFIX} open /etc/ld.so.cache O_RDONLY|O_CLOEXEC = 3\n',
+     OpenCall('open', 'python3', '/etc/ld.so.cache', 'read')),
+    (f'{PREFIX} gcc {SUFFIX} openat AT_FDCWD /tmp/out.o O_RDWR|O_CREAT = 4\n',
+     OpenCall('openat', 'gcc', '/tmp/out.o', 'write')),
+    (f'{PREFIX} ld {SUFFIX} open64 /tmp/a.out O_WRONLY|O_CREAT|O_TRUNC = 5\n',
+     OpenCall('open64', 'ld', '/tmp/a.out', 'UNKNOWN')),
+    (f'{PREFIX} bash {SUFFIX} fopen /home/user/in.txt r = 6\n',
+     OpenCall('fopen', 'bash', '/home/user/in.txt', 'read')),
+    (f'{PREFIX} make {SUFFIX} fopenat AT_FDCWD /home/user/log.txt a+ = 7\n',
+     OpenCall('fopenat', 'make', '/home/user/log.txt', 'UNKNOWN')),
+    (f'{PREFIX} git {SUFFIX} freopen /dev/null w+ = 8\r\n',
+     OpenCall('freopen', 'git', '/dev/null', 'write')),
+    (f'{PREFIX} cc1 {SUFFIX} fopen64 /usr/lib64/specs rb = 9\n',
+     OpenCall('fopen64', 'cc1', '/usr/lib64/specs', 'read')),
+    (f'{PREFIX} as {SUFFIX} read 3 4096 = 4096\n', None),
+    (f'{PREFIX} as {SUFFIX} openat\n', None),
+    (f'{PREFIX} as {SUFFIX} opendir /tmp O_RDONLY = 3\n', None),
+]
+
+@pytest.mark.parametrize('line, expected', GOLDEN)
+def test_parse_line(line, expected):
+    assert parse_line(line) == expected
+    assert parse_line(line.encode('utf-8')) == expected
+    assert legacy_parse_line(line.encode('utf-8')) == expected
+
+def test_parse_file(tmp_path):
+    content = ''.join(line for line, _ in GOLDEN).encode('utf-8')
+    expected = [call for _, call in GOLDEN if call is not None]
+    (tmp_path / 'trace.log').write_bytes(content)
+    (tmp_path / 'trace.log.gz').write_bytes(gzip.compress(content))
+    for name in ('trace.log', 'trace.log.gz'):
+        path = str(tmp_path / name)
+        assert list(iter_open_calls(path)) == expected
+        assert parse_file(path) == tuple(list(column) for column in zip(*expected))
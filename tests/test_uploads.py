@@ -0,0 +1,131 @@
+# test_uploads.py
+import gzip
+import hashlib
+import io
+import json
+import os
+
+from app import app, db, routes
+from app.columnar import sidecar_path
+from app.models import FilteredFile, LogFile
+
+def test_deduplicated_upload_gets_a_sidecar(client, strace_line, upload_log, wait_for_jobs):
+    content = strace_line('gcc', '/src/a.c') + strace_line('ld', '/tmp/a.o')
+    assert upload_log(content, 'first.log').status_code == 200
+    wait_for_jobs()
+    assert upload_log(content, 'second.log').status_code == 200
+
+    with app.app_context():
+        filtered_paths = [path for path, in db.session.query(FilteredFile.filtered_file_path).order_by(FilteredFile.id)]
+        statuses = [status for status, in db.session.query(LogFile.status)]
+    # the second log reuses the processed output of the first without a job
+    assert statuses == ['done', 'done']
+    assert len(filtered_paths) == 2
+    first, second = (sidecar_path(path) for path in filtered_paths)
+    assert os.path.isfile(second)
+    assert os.path.samefile(first, second)
+
+def test_invalid_filters_are_rejected_before_anything_is_stored(client, strace_line, upload_log):
+    content = strace_line('gcc', '/src/a.c').encode()
+    for filters in ('[3]', '"notalist"', '{"a": 1}', 'not json'):
+        response = client.post('/upload/project1', data={'projectId': '1', 'filters': filters,
+                                                         'files': [(io.BytesIO(content), 'trace.log')]},
+                               content_type='multipart/form-data')
+        assert response.status_code == 400, filters
+        assert 'Invalid filters' in response.json['error']
+        response = client.post(f'/upload/project1/archive?projectId=1&filters={filters}', data=b'',
+                               content_type='application/x-tar')
+        assert response.status_code == 400, filters
+    response = client.post('/upload/project1/chunked', json={'projectId': '1', 'fileName': 'trace.log', 'size': 1,
+                                                             'filters': 'notalist'})
+    assert response.status_code == 400
+    response = client.post('/upload/project1/manifest', json={'projectId': '1', 'filters': [3], 'files': []})
+    assert response.status_code == 400
+    assert not os.path.exists(app.config['UPLOAD_DIRECTORY'])
+    with app.app_context():
+        assert db.session.query(LogFile.id).count() == 0
+
+    assert upload_log(content, filters=['8@@@gcc']).status_code == 200
+
+def filtered_lines(log_file_name):
+    with app.app_context():
+        log_file = LogFile.query.filter_by(file_name=log_file_name).one()
+        [filtered_file] = log_file.filtered_files
+        with open(filtered_file.filtered_file_path) as f:
+            return log_file.status, [line.split()[8] for line in f]
+
+def test_reupload_with_other_filters_filters_again(client, strace_line, upload_log, wait_for_jobs):
+    content = strace_line('gcc', '/src/a.c') + strace_line('ld', '/tmp/a.o')
+    assert upload_log(content).status_code == 200
+    wait_for_jobs()
+    assert filtered_lines('trace.log') == ('done', ['gcc', 'ld'])
+    with app.app_context():
+        [filtered_id] = [filtered_id for filtered_id, in db.session.query(FilteredFile.id)]
+
+    # the same filters again keep the output
+    assert upload_log(content, filters=[]).status_code == 200
+    with app.app_context():
+        assert [filtered_id for filtered_id, in db.session.query(FilteredFile.id)] == [filtered_id]
+
+    assert upload_log(content, filters=['8@@@^ld$']).status_code == 200
+    wait_for_jobs()
+    assert filtered_lines('trace.log') == ('done', ['gcc'])
+    assert [file['path'] for file in client.get('/projects/1/files').json['files']] == ['/src/a.c']
+    with app.app_context():
+        assert db.session.query(LogFile.id).count() == 1
+
+def test_filters_changed_while_processing_run_the_job_again(client, strace_line, upload_log, wait_for_jobs, monkeypatch):
+    runs = []
+    handler = routes.job_queue.handler
+    def changing_handler(log_file_id, filters):
+        if not runs:
+            # an upload with other filters arrives while the job runs
+            LogFile.query.filter_by(id=log_file_id).update({'filters': json.dumps(['8@@@^ld$'])})
+            db.session.commit()
+        runs.append(filters)
+        handler(log_file_id, filters)
+    monkeypatch.setattr(routes.job_queue, 'handler', changing_handler)
+    assert upload_log(strace_line('gcc', '/src/a.c') + strace_line('ld', '/tmp/a.o')).status_code == 200
+    wait_for_jobs()
+    assert runs == [[], ['8@@@^ld$']]
+    assert filtered_lines('trace.log') == ('done', ['gcc'])
+
+def test_client_checksums_only_reuse_content_of_the_same_project(client, strace_line, upload_log, wait_for_jobs):
+    content = strace_line('gcc', '/src/secret.c').encode()
+    checksum = hashlib.sha256(content).hexdigest()
+    assert upload_log(content).status_code == 200
+    wait_for_jobs()
+
+    # another project cannot claim the content by its checksum
+    response = client.post('/upload/other/manifest', json={'projectId': '2', 'files': [
+        {'fileName': 'copy.log', 'checksum': checksum}]})
+    assert response.status_code == 200
+    assert response.json['missing'] == ['copy.log']
+    response = client.post('/upload/other/chunked', json={'projectId': '2', 'fileName': 'copy.log',
+                                                          'size': len(content), 'checksum': checksum})
+    assert response.status_code == 201
+    with app.app_context():
+        assert db.session.query(LogFile.id).count() == 1
+
+    # the project holding it can add it again under another name
+    response = client.post('/upload/project1/manifest', json={'projectId': '1', 'files': [
+        {'fileName': 'copy.log', 'checksum': checksum}]})
+    assert response.json['missing'] == []
+    with app.app_context():
+        assert db.session.query(LogFile.id).count() == 2
+
+def test_processed_files_are_named_after_their_compression(client, strace_line, upload_log, wait_for_jobs, monkeypatch):
+    content = strace_line('gcc', '/src/a.c').encode()
+    assert upload_log(gzip.compress(content), 'first.log.gz').status_code == 200
+    wait_for_jobs()
+    monkeypatch.setitem(app.config, 'STORAGE_COMPRESSION', 'gzip')
+    assert upload_log(strace_line('ld', '/src/b.o'), 'second.log').status_code == 200
+    wait_for_jobs()
+    with app.app_context():
+        filtered = {filtered_file.log_file.file_name: filtered_file for filtered_file in FilteredFile.query}
+    assert filtered['first.log.gz'].filtered_file_name == 'first.log'
+    with open(filtered['first.log.gz'].filtered_file_path, 'rb') as f:
+        assert f.read() == content
+    assert filtered['second.log'].filtered_file_name == 'second.log.gz'
+    with gzip.open(filtered['second.log'].filtered_file_path) as f:
+        assert b'/src/b.o' in f.read()